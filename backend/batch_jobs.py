@@ -0,0 +1,375 @@
+"""
+Whole-repository batch test generation jobs
+Jobs and per-file results are persisted in SQLite, so a job interrupted by a
+server restart resumes with the files that were not finished yet. With
+several workers sharing the database, each job is claimed by one worker
+under a renewed lease; jobs whose owner stopped renewing are taken over.
+Cancel and progress streams work from any worker through the database
+"""
+import asyncio
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config import BATCH_JOBS_DB_PATH, BATCH_WORKER_POOL_SIZE, BATCH_JOB_LEASE_SECONDS, BATCH_EVENTS_POLL_SECONDS
+from github_scheduler import background_priority
+
+# Job and file states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+
+FILE_PENDING = "pending"
+FILE_RUNNING = "running"
+FILE_DONE = "done"
+FILE_FAILED = "failed"
+
+UNFINISHED_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# Generates tests for one file: (job, file_path) -> result dict
+GenerateFileFn = Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]]
+
+class BatchJobStore:
+    """SQLite persistence for jobs and their per-file results"""
+
+    def __init__(self, path: str = BATCH_JOBS_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " repo_url TEXT NOT NULL,"
+            " framework TEXT,"
+            " file_filter TEXT,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_job_files ("
+            " job_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " path TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " PRIMARY KEY (job_id, path))"
+        )
+        self._conn.commit()
+
+    def create_job(self, job_id: str, repo_url: str, framework: Optional[str], file_filter: Optional[str],
+                   file_paths: List[str], owner: str, lease_seconds: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO batch_jobs (id, repo_url, framework, file_filter, status, created_at, updated_at, owner, lease_expires)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, repo_url, framework, file_filter, JOB_QUEUED, now, now, owner, now + lease_seconds)
+            )
+            self._conn.executemany(
+                "INSERT INTO batch_job_files (job_id, position, path, status) VALUES (?, ?, ?, ?)",
+                [(job_id, position, path, FILE_PENDING) for position, path in enumerate(file_paths)]
+            )
+            self._conn.commit()
+
+    def set_job_status(self, job_id: str, status: str, error: Optional[str] = None):
+        """Move an unfinished job to status (a job cancelled meanwhile, possibly by another worker, stays cancelled)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (status, error, time.time(), job_id, *UNFINISHED_JOB_STATES)
+            )
+            self._conn.commit()
+
+    def get_job_status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def cancel_unfinished_job(self, job_id: str) -> bool:
+        """Mark an unfinished job cancelled; its owner stops it when renewing its lease"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE batch_jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (JOB_CANCELLED, time.time(), job_id, *UNFINISHED_JOB_STATES)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def claim_job(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Atomically take an unfinished job that has no live owner"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE batch_jobs SET owner = ?, lease_expires = ?"
+                " WHERE id = ? AND status IN (?, ?) AND (owner IS NULL OR owner = ? OR lease_expires < ?)",
+                (owner, now + lease_seconds, job_id, *UNFINISHED_JOB_STATES, owner, now)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def renew_leases(self, job_ids: List[str], owner: str, lease_seconds: float):
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE batch_jobs SET lease_expires = ? WHERE id = ? AND owner = ?",
+                [(time.time() + lease_seconds, job_id, owner) for job_id in job_ids]
+            )
+            self._conn.commit()
+
+    def release_job(self, job_id: str, owner: str):
+        """Give up a job so another worker (or the next start) can resume it"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_jobs SET owner = NULL, lease_expires = 0 WHERE id = ? AND owner = ?",
+                (job_id, owner)
+            )
+            self._conn.commit()
+
+    def set_file_status(self, job_id: str, path: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_job_files SET status = ?, result = ?, error = ? WHERE job_id = ? AND path = ?",
+                (status, json.dumps(result) if result is not None else None, error, job_id, path)
+            )
+            self._conn.execute("UPDATE batch_jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def get_job(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job_row = self._conn.execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job_row is None:
+                return None
+            file_rows = self._conn.execute(
+                "SELECT path, status, result, error FROM batch_job_files WHERE job_id = ? ORDER BY position",
+                (job_id,)
+            ).fetchall()
+
+        job = dict(job_row)
+        files = []
+        counts = {FILE_PENDING: 0, FILE_RUNNING: 0, FILE_DONE: 0, FILE_FAILED: 0}
+        for row in file_rows:
+            counts[row["status"]] += 1
+            file_entry = {"path": row["path"], "status": row["status"]}
+            if row["error"]:
+                file_entry["error"] = row["error"]
+            if include_results and row["result"]:
+                file_entry["result"] = json.loads(row["result"])
+            files.append(file_entry)
+
+        job["total_files"] = len(files)
+        job["progress"] = counts
+        job["files"] = files
+        return job
+
+    def pending_files(self, job_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM batch_job_files WHERE job_id = ? AND status IN (?, ?) ORDER BY position",
+                (job_id, FILE_PENDING, FILE_RUNNING)
+            ).fetchall()
+        return [row["path"] for row in rows]
+
+    def claimable_jobs(self) -> List[str]:
+        """Unfinished jobs without a live owner"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM batch_jobs WHERE status IN (?, ?) AND (owner IS NULL OR lease_expires < ?)"
+                " ORDER BY created_at",
+                (*UNFINISHED_JOB_STATES, time.time())
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+class BatchJobManager:
+    """Runs batch jobs on a shared, bounded worker pool and publishes progress events"""
+
+    def __init__(self, store: Optional[BatchJobStore] = None, pool_size: int = BATCH_WORKER_POOL_SIZE,
+                 lease_seconds: float = BATCH_JOB_LEASE_SECONDS):
+        self._store = store
+        self.pool_size = pool_size
+        self.lease_seconds = lease_seconds
+        # Identifies this worker process in job leases
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._lease_task: Optional[asyncio.Task] = None
+        self._generate_file: Optional[GenerateFileFn] = None
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+
+    @property
+    def store(self) -> BatchJobStore:
+        """The job database, opened on first use (importing the app creates no file)"""
+        if self._store is None:
+            self._store = BatchJobStore()
+        return self._store
+
+    async def start(self, generate_file: GenerateFileFn):
+        """Start the worker pool, resume unowned unfinished jobs and keep leases renewed"""
+        self._generate_file = generate_file
+        self._worker_slots = asyncio.Semaphore(self.pool_size)
+        self._claim_orphaned_jobs()
+        self._lease_task = asyncio.create_task(self._maintain_leases())
+
+    async def stop(self):
+        """Stop running jobs; they stay unfinished in the store and resume on next start"""
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            await asyncio.gather(self._lease_task, return_exceptions=True)
+            self._lease_task = None
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def _claim_orphaned_jobs(self):
+        for job_id in self.store.claimable_jobs():
+            if job_id not in self._tasks and self.store.claim_job(job_id, self.owner_id, self.lease_seconds):
+                print(f"♻️ Resuming batch job {job_id}")
+                self._launch(job_id)
+
+    async def _maintain_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                self.store.renew_leases(list(self._tasks), self.owner_id, self.lease_seconds)
+                # Jobs cancelled through another worker
+                for job_id, task in list(self._tasks.items()):
+                    if self.store.get_job_status(job_id) == JOB_CANCELLED:
+                        task.cancel()
+                        self._publish(job_id, "cancelled", {"job_id": job_id})
+                # Jobs of workers that stopped renewing their leases
+                self._claim_orphaned_jobs()
+            except Exception as e:
+                print(f"⚠️ Batch job lease maintenance failed: {str(e)}")
+
+    def submit(self, repo_url: str, framework: Optional[str], file_filter: Optional[str], file_paths: List[str]) -> str:
+        """Persist a new job owned by this worker and start it"""
+        job_id = secrets.token_urlsafe(12)
+        self.store.create_job(job_id, repo_url, framework, file_filter, file_paths, self.owner_id, self.lease_seconds)
+        self._launch(job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel an unfinished job, whichever worker runs it"""
+        if not self.store.cancel_unfinished_job(job_id):
+            return False
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        self._publish(job_id, "cancelled", {"job_id": job_id})
+        return True
+
+    def _launch(self, job_id: str):
+        self._tasks[job_id] = asyncio.create_task(self._run_job(job_id))
+
+    async def _run_job(self, job_id: str):
+        job = self.store.get_job(job_id, include_results=False)
+        try:
+            self.store.set_job_status(job_id, JOB_RUNNING)
+            with background_priority():
+                await asyncio.gather(*(
+                    self._run_file(job, path) for path in self.store.pending_files(job_id)
+                ))
+            self.store.set_job_status(job_id, JOB_COMPLETED)
+            self._publish(job_id, "completed", self._summary(job_id))
+            print(f"✅ Batch job {job_id} completed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Batch job {job_id} failed: {str(e)}")
+            self.store.set_job_status(job_id, JOB_FAILED, str(e))
+            self._publish(job_id, "failed", {"job_id": job_id, "error": str(e)})
+        finally:
+            self._tasks.pop(job_id, None)
+            self.store.release_job(job_id, self.owner_id)
+
+    async def _run_file(self, job: Dict[str, Any], path: str):
+        async with self._worker_slots:
+            self.store.set_file_status(job["id"], path, FILE_RUNNING)
+            self._publish(job["id"], "file_started", {"path": path})
+            try:
+                result = await self._generate_file(job, path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = getattr(e, "detail", None) or str(e)
+                self.store.set_file_status(job["id"], path, FILE_FAILED, error=error)
+                self._publish(job["id"], "file_failed", {"path": path, "error": error})
+                return
+            self.store.set_file_status(job["id"], path, FILE_DONE, result=result)
+            self._publish(job["id"], "file_done", {"path": path, "result": result})
+
+    def _summary(self, job_id: str) -> Dict[str, Any]:
+        job = self.store.get_job(job_id, include_results=False)
+        return {"job_id": job_id, "status": job["status"], "progress": job["progress"]}
+
+    def _publish(self, job_id: str, event: str, data: Dict[str, Any]):
+        for queue in self._listeners.get(job_id, []):
+            queue.put_nowait((event, data))
+
+    async def events(self, job_id: str) -> AsyncIterator[tuple]:
+        """Yield (event, data) tuples for a job: a snapshot first, then live progress until it finishes"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, []).append(queue)
+        try:
+            job = self.store.get_job(job_id)
+            yield "snapshot", job
+            if job["status"] not in UNFINISHED_JOB_STATES:
+                return
+            if job_id not in self._tasks:
+                # Another worker runs this job: follow its progress in the database
+                async for event, data in self._poll_events(job):
+                    yield event, data
+                return
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in ("completed", "failed", "cancelled"):
+                    return
+        finally:
+            self._listeners[job_id].remove(queue)
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
+
+    async def _poll_events(self, job: Dict[str, Any]) -> AsyncIterator[tuple]:
+        """Progress events derived from the stored file states of a job run elsewhere"""
+        job_id = job["id"]
+        seen = {entry["path"]: entry["status"] for entry in job["files"]}
+        while True:
+            await asyncio.sleep(BATCH_EVENTS_POLL_SECONDS)
+            job = self.store.get_job(job_id)
+            for entry in job["files"]:
+                if seen.get(entry["path"]) == entry["status"]:
+                    continue
+                seen[entry["path"]] = entry["status"]
+                if entry["status"] == FILE_RUNNING:
+                    yield "file_started", {"path": entry["path"]}
+                elif entry["status"] == FILE_DONE:
+                    yield "file_done", {"path": entry["path"], "result": entry.get("result")}
+                elif entry["status"] == FILE_FAILED:
+                    yield "file_failed", {"path": entry["path"], "error": entry.get("error")}
+            if job["status"] == JOB_COMPLETED:
+                yield "completed", {"job_id": job_id, "status": job["status"], "progress": job["progress"]}
+                return
+            if job["status"] == JOB_FAILED:
+                yield "failed", {"job_id": job_id, "error": job.get("error")}
+                return
+            if job["status"] == JOB_CANCELLED:
+                yield "cancelled", {"job_id": job_id}
+                return
+
+# Process-wide job manager (started from the app lifespan)
+batch_jobs = BatchJobManager()
@@ -0,0 +1,118 @@
+"""
+Content-addressed cache for GitHub file contents
+Blobs are keyed by their git SHA, so unchanged files are only downloaded once
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import BLOB_CACHE_MAX_BYTES, BLOB_CACHE_DIR
+
+def git_blob_sha(data: bytes) -> str:
+    """Compute the git blob SHA of file contents (matches the SHAs in GitHub trees)"""
+    header = f"blob {len(data)}\0".encode("ascii")
+    return hashlib.sha1(header + data).hexdigest()
+
+class BlobCache:
+    """In-memory LRU cache bounded by bytes, with an optional on-disk tier"""
+
+    def __init__(self, max_bytes: int = BLOB_CACHE_MAX_BYTES, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, sha: str) -> Optional[str]:
+        """Get decoded blob content by SHA, checking memory first and then disk"""
+        with self._lock:
+            if sha in self._entries:
+                self._entries.move_to_end(sha)
+                self.hits += 1
+                return self._entries[sha]
+
+        content = self._read_from_disk(sha)
+        if content is not None:
+            self.disk_hits += 1
+            self._put_in_memory(sha, content)
+            return content
+
+        self.misses += 1
+        return None
+
+    def put(self, sha: str, content: str):
+        """Store decoded blob content under its SHA"""
+        if not sha:
+            return
+        self._put_in_memory(sha, content)
+        self._write_to_disk(sha, content)
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_enabled": bool(self.disk_dir)
+        }
+
+    def _put_in_memory(self, sha: str, content: str):
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if sha in self._entries:
+                self._entries.move_to_end(sha)
+                return
+
+            self._entries[sha] = content
+            self._sizes[sha] = size
+            self.current_bytes += size
+
+            # Evict least recently used blobs until we are back under budget
+            while self.current_bytes > self.max_bytes and self._entries:
+                evicted_sha, _ = self._entries.popitem(last=False)
+                self.current_bytes -= self._sizes.pop(evicted_sha)
+
+    def _disk_path(self, sha: str) -> str:
+        return os.path.join(self.disk_dir, sha[:2], sha)
+
+    def _read_from_disk(self, sha: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(sha), "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _write_to_disk(self, sha: str, content: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(sha)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write blob {sha[:8]} to disk cache: {str(e)}")
+
+# Process-wide blob cache shared by all GitHub content fetches
+blob_cache = BlobCache(disk_dir=BLOB_CACHE_DIR)
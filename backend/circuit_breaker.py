@@ -0,0 +1,137 @@
+"""
+Circuit breakers for upstream APIs (OpenRouter, GitHub)
+After CIRCUIT_FAILURE_THRESHOLD consecutive failures (connection errors,
+timeouts, 5xx) a breaker opens and calls fail fast with 503 instead of
+waiting for the upstream timeout. After CIRCUIT_RECOVERY_SECONDS it lets a
+trial call through (half-open): success closes it, failure opens it again
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import httpx
+from fastapi import HTTPException
+
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_SECONDS, CIRCUIT_HALF_OPEN_MAX_CALLS
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitOpenError(HTTPException):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"{upstream} is temporarily unavailable. Retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.upstream = upstream
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS,
+        half_open_max_calls: int = CIRCUIT_HALF_OPEN_MAX_CALLS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_calls = 0
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _retry_after(self) -> int:
+        return max(1, int(self.opened_at + self.recovery_seconds - time.monotonic()) + 1)
+
+    def is_open(self) -> bool:
+        """Whether calls would currently be rejected"""
+        if self.state == STATE_OPEN:
+            return time.monotonic() < self.opened_at + self.recovery_seconds
+        return self.state == STATE_HALF_OPEN and self._trial_calls >= self.half_open_max_calls
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError"""
+        if self.state == STATE_OPEN:
+            if time.monotonic() < self.opened_at + self.recovery_seconds:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+            self.state = STATE_HALF_OPEN
+            self._trial_calls = 0
+            print(f"🔌 {self.name} circuit half-open, sending a trial request")
+
+        if self.state == STATE_HALF_OPEN:
+            if self._trial_calls >= self.half_open_max_calls:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name, max(1, int(self.recovery_seconds)))
+            self._trial_calls += 1
+
+        self.counters["calls"] += 1
+
+    def record(self, success: Optional[bool]):
+        """Record a call's outcome (None: the call was abandoned without a verdict)"""
+        if self.state == STATE_HALF_OPEN:
+            self._trial_calls = max(0, self._trial_calls - 1)
+
+        if success is None:
+            return
+        if success:
+            if self.state != STATE_CLOSED:
+                print(f"✅ {self.name} circuit closed, upstream recovered")
+            self.state = STATE_CLOSED
+            self.consecutive_failures = 0
+            return
+
+        self.counters["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.counters["opened"] += 1
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+            print(f"🚫 {self.name} circuit open after {self.consecutive_failures} failures, failing fast for {int(self.recovery_seconds)}s")
+
+    async def call(self, send_fn: Callable[[], Awaitable[Any]], is_failure: Callable[[Any], bool] = lambda result: False) -> Any:
+        """Run send_fn through the breaker; connection errors and results matching is_failure count as failures"""
+        self.before_call()
+        success = None
+        try:
+            result = await send_fn()
+            success = not is_failure(result)
+            return result
+        except httpx.RequestError:
+            success = False
+            raise
+        finally:
+            self.record(success)
+
+    def stats(self) -> Dict:
+        return {
+            "state": STATE_OPEN if self.is_open() else self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after_seconds": self._retry_after() if self.state == STATE_OPEN and self.is_open() else None,
+            "failure_threshold": self.failure_threshold,
+            "recovery_seconds": self.recovery_seconds,
+            **self.counters
+        }
+
+def is_upstream_failure(response: httpx.Response) -> bool:
+    """Server errors mean the upstream is unhealthy; client errors and rate limits do not"""
+    return response.status_code >= 500
+
+# Process-wide breakers, one per upstream
+openrouter_breaker = CircuitBreaker("OpenRouter")
+github_breaker = CircuitBreaker("GitHub")
+
+def get_circuit_breaker_stats() -> Dict:
+    """Get the state of every upstream breaker"""
+    return {
+        "openrouter": openrouter_breaker.stats(),
+        "github": github_breaker.stats()
+    }
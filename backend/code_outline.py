@@ -0,0 +1,356 @@
+"""
+Code outlines (skeletons) for large source files
+Keeps public functions and classes with their signatures and docstrings,
+including bodies up to OUTLINE_BODY_MAX_LINES and eliding longer ones.
+Python files are parsed with ast; brace languages and Ruby use a small
+tokenizer that skips strings and comments. Outlines are cached by blob SHA
+"""
+import ast
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from config import OUTLINE_BODY_MAX_LINES, OUTLINE_CACHE_MAX_ENTRIES
+from blob_cache import git_blob_sha
+
+_BRACE_LANGUAGE_EXTENSIONS = {'.js', '.jsx', '.ts', '.tsx', '.java', '.go', '.php', '.cs', '.swift', '.cpp', '.c', '.h'}
+
+_CLASS_LIKE = re.compile(r"\b(class|interface|struct|enum|trait|namespace|impl|extension|protocol|object|module)\b")
+_CONTROL_FLOW = re.compile(r"^\s*(if|else|for|foreach|while|do|switch|catch|try|finally|synchronized|with|using|lock|unsafe|fixed)\b")
+_PRIVATE_MEMBER = re.compile(r"\bprivate\b|(^|[\s.])[_#][\w$]*\s*(\(|=|:)")
+
+_cache: "OrderedDict[Tuple[str, str], Optional[str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def _is_public_name(name: str) -> bool:
+    return not name.startswith("_") or (name.startswith("__") and name.endswith("__"))
+
+# Python
+
+def _python_node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+def _python_header_end(node: ast.AST) -> int:
+    """Last line of the signature, including the docstring if there is one"""
+    first = node.body[0]
+    if isinstance(first, ast.Expr) and isinstance(getattr(first, "value", None), ast.Constant) and isinstance(first.value.value, str):
+        return first.end_lineno
+    return first.lineno - 1
+
+def _outline_python_node(node: ast.AST, lines: List[str], out: List[str]):
+    start, end = _python_node_start(node), node.end_lineno
+
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        if not _is_public_name(node.name):
+            return
+        header_end = _python_header_end(node)
+        if end - start + 1 <= OUTLINE_BODY_MAX_LINES or header_end < node.lineno:
+            out.extend(lines[start - 1:end])
+            return
+        out.extend(lines[start - 1:header_end])
+        body_line = lines[node.body[-1].lineno - 1]
+        indent = body_line[:len(body_line) - len(body_line.lstrip())]
+        out.append(f"{indent}...")
+
+    elif isinstance(node, ast.ClassDef):
+        if not _is_public_name(node.name):
+            return
+        if end - start + 1 <= OUTLINE_BODY_MAX_LINES:
+            out.extend(lines[start - 1:end])
+            return
+        header_end = _python_header_end(node)
+        out.extend(lines[start - 1:header_end])
+        members_start = len(out)
+        for child in node.body:
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                _outline_python_node(child, lines, out)
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and child.lineno == child.end_lineno:
+                out.append(lines[child.lineno - 1])
+        if len(out) == members_start:
+            body_line = lines[node.body[-1].lineno - 1]
+            out.append(body_line[:len(body_line) - len(body_line.lstrip())] + "...")
+
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        out.extend(lines[start - 1:end])
+
+    elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.lineno == node.end_lineno:
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        if all(isinstance(target, ast.Name) and target.id.isupper() for target in targets):
+            out.append(lines[node.lineno - 1])
+
+def _outline_python(source: str) -> Optional[str]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    lines = source.splitlines()
+    out: List[str] = []
+    for index, node in enumerate(tree.body):
+        if index == 0 and isinstance(node, ast.Expr) and isinstance(getattr(node, "value", None), ast.Constant) and isinstance(node.value.value, str):
+            out.extend(lines[node.lineno - 1:node.end_lineno])
+            continue
+        # Separate top-level definitions like the source does
+        is_definition = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        if is_definition and out and out[-1] != "":
+            out.append("")
+        _outline_python_node(node, lines, out)
+    return "\n".join(out).strip() + "\n"
+
+# Brace languages (JavaScript/TypeScript, Java, Go, PHP, C#, Swift, C/C++)
+
+def _mask_source(source: str) -> Tuple[str, str]:
+    """
+    Returns (masked, cleaned), both aligned with source:
+    masked blanks comments and string contents (for structure), cleaned drops
+    only non-doc comments (for output)
+    """
+    masked = list(source)
+    cleaned = list(source)
+    i, length = 0, len(source)
+
+    def blank(target, start, stop):
+        for j in range(start, stop):
+            if target[j] != "\n":
+                target[j] = " "
+
+    while i < length:
+        ch = source[i]
+        if source.startswith("//", i):
+            stop = source.find("\n", i)
+            stop = length if stop == -1 else stop
+            blank(masked, i, stop)
+            if not source.startswith("///", i):
+                blank(cleaned, i, stop)
+            i = stop
+        elif source.startswith("/*", i):
+            stop = source.find("*/", i + 2)
+            stop = length if stop == -1 else stop + 2
+            blank(masked, i, stop)
+            if not source.startswith("/**", i):
+                blank(cleaned, i, stop)
+            i = stop
+        elif ch in "\"'`":
+            j = i + 1
+            while j < length and source[j] != ch:
+                if source[j] == "\\":
+                    j += 1
+                elif source[j] == "\n" and ch != "`":
+                    break
+                j += 1
+            blank(masked, i + 1, min(j, length))
+            i = j + 1
+        else:
+            i += 1
+    return "".join(masked), "".join(cleaned)
+
+def _match_braces(masked: str) -> Optional[dict]:
+    pairs, stack = {}, []
+    for i, ch in enumerate(masked):
+        if ch == "{":
+            stack.append(i)
+        elif ch == "}":
+            if not stack:
+                return None
+            pairs[stack.pop()] = i
+    return pairs if not stack else None
+
+_NESTED_DECLARATION = re.compile(
+    r"^(export\s+)?(async\s+)?function\b"
+    r"|^(export\s+)?(const|let|var)\s+[\w$]+\s*=[^=]"
+    r"|^[\w$<>\[\],.?\s]*[\w$]+\s*\([^()]*\)\s*(:[^{]+|throws[^{]+)?$"
+)
+
+def _nested_signatures(masked: str, cleaned: str, pairs: dict, start: int, end: int) -> List[str]:
+    """Signatures of functions declared directly inside a large body (e.g. handlers in a component)"""
+    signatures = []
+    i = start
+    while i < end:
+        if masked[i] != "{":
+            i += 1
+            continue
+        close = pairs[i]
+        header_start = max(masked.rfind(";", start, i), masked.rfind("}", start, i), masked.rfind("{", start, i)) + 1
+        header = masked[header_start:i].strip()
+        if header and not _CONTROL_FLOW.match(header) and _NESTED_DECLARATION.search(header):
+            signature = cleaned[header_start:i]
+            signatures.append(re.sub(r"^\s*\n", "", signature).rstrip() + " { ... }")
+        i = close + 1
+    return signatures
+
+def _outline_brace_block(masked: str, cleaned: str, pairs: dict, start: int, end: int, out: List[str]):
+    cursor = i = start
+    while i < end:
+        if masked[i] != "{":
+            i += 1
+            continue
+
+        close = pairs[i]
+        header_start = max(masked.rfind(";", start, i), masked.rfind("}", start, i), masked.rfind("{", start, i)) + 1
+        header_start = max(header_start, start)
+        header = masked[header_start:i]
+
+        class_keyword = _CLASS_LIKE.search(header)
+        if re.search(r"(^|\n)\s*(import|export)\b[^()\n]*$", header):
+            # Import/export lists are kept whole
+            out.append(cleaned[cursor:close + 1])
+        elif class_keyword and "(" not in header[:class_keyword.start()]:
+            out.append(cleaned[cursor:i + 1])
+            _outline_brace_block(masked, cleaned, pairs, i + 1, close, out)
+            out.append("}")
+        elif ")" in header and not _CONTROL_FLOW.match(header) and _PRIVATE_MEMBER.search(header):
+            out.append(cleaned[cursor:header_start])
+        elif cleaned[i + 1:close].count("\n") <= OUTLINE_BODY_MAX_LINES:
+            out.append(cleaned[cursor:close + 1])
+        else:
+            signatures = _nested_signatures(masked, cleaned, pairs, i + 1, close)
+            if signatures:
+                indent = re.match(r"[ \t]*", signatures[0]).group(0)
+                out.append(cleaned[cursor:i + 1] + "\n" + "\n".join(signatures) + f"\n{indent}...\n}}")
+            else:
+                out.append(cleaned[cursor:i + 1] + " ... }")
+
+        cursor = i = close + 1
+    out.append(cleaned[cursor:end])
+
+def _outline_braces(source: str) -> Optional[str]:
+    masked, cleaned = _mask_source(source)
+    pairs = _match_braces(masked)
+    if pairs is None:
+        return None
+    out: List[str] = []
+    _outline_brace_block(masked, cleaned, pairs, 0, len(source), out)
+    return "".join(out)
+
+# Ruby
+
+_RUBY_BLOCK_START = re.compile(r"^\s*(def|class|module|case|begin|for|if|unless|while|until)\b")
+_RUBY_DO_BLOCK = re.compile(r"\bdo\s*(\|[^|]*\|)?\s*$")
+_RUBY_BLOCK_END = re.compile(r"^\s*end\b")
+_RUBY_ONE_LINE_DEF = re.compile(r"^\s*def\s+[\w.?!=]+(\(.*\))?\s*=[^=]|\bend\s*$")
+
+def _ruby_line_kind(line: str) -> Optional[str]:
+    """'open' for lines that start a block, 'close' for 'end' lines"""
+    code = re.sub(r"#(?!\{).*$", "", line)
+    if _RUBY_BLOCK_END.match(code):
+        return "close"
+    if code.strip().startswith("def") and _RUBY_ONE_LINE_DEF.search(code):
+        return None
+    if _RUBY_BLOCK_START.match(code) or _RUBY_DO_BLOCK.search(code):
+        return "open"
+    return None
+
+def _ruby_block_length(kinds: List[Optional[str]], start: int) -> int:
+    """Number of lines until the 'end' that closes the block opened at start"""
+    depth = 0
+    for index in range(start, len(kinds)):
+        if kinds[index] == "open":
+            depth += 1
+        elif kinds[index] == "close":
+            depth -= 1
+            if depth == 0:
+                return index - start
+    return len(kinds) - start
+
+def _outline_ruby(source: str) -> Optional[str]:
+    lines = source.splitlines()
+    kinds = [_ruby_line_kind(line) for line in lines]
+    out: List[str] = []
+    depth = 0
+    skip_to_depth = None  # Inside an elided or private method until depth drops back
+    keep_skipped_end = False
+    private_depth = None  # Depth of the class body after a bare 'private'
+
+    for index, line in enumerate(lines):
+        kind = kinds[index]
+
+        if skip_to_depth is not None:
+            depth += 1 if kind == "open" else -1 if kind == "close" else 0
+            if kind == "close" and depth == skip_to_depth:
+                skip_to_depth = None
+                if keep_skipped_end:
+                    out.append(line)
+            continue
+
+        if kind == "close":
+            depth -= 1
+            if depth < 0:
+                return None
+            if private_depth is not None and depth < private_depth:
+                private_depth = None
+            out.append(line)
+            continue
+
+        in_private = private_depth is not None and depth == private_depth
+        if line.strip() == "private" and depth > 0:
+            private_depth = depth
+            continue
+
+        if kind == "open" and line.strip().startswith("def"):
+            if in_private:
+                skip_to_depth, keep_skipped_end = depth, False
+            elif _ruby_block_length(kinds, index) > OUTLINE_BODY_MAX_LINES:
+                indent = line[:len(line) - len(line.lstrip())]
+                out.extend([line, f"{indent}  ..."])
+                skip_to_depth, keep_skipped_end = depth, True
+            else:
+                out.append(line)
+            depth += 1
+            continue
+
+        if kind == "open":
+            depth += 1
+        elif in_private and line.strip().startswith("def"):
+            continue
+        out.append(line)
+
+    if depth != 0:
+        return None
+    return "\n".join(out) + "\n"
+
+# Public API
+
+def _build_outline(file_path: str, content: str) -> Optional[str]:
+    ext = '.' + file_path.split('.')[-1].lower() if '.' in file_path else ''
+    if ext == '.py':
+        outline = _outline_python(content)
+    elif ext == '.rb':
+        outline = _outline_ruby(content)
+    elif ext in _BRACE_LANGUAGE_EXTENSIONS:
+        outline = _outline_braces(content)
+    else:
+        return None
+
+    if outline is None:
+        return None
+    # Collapse the blank runs left by removed members and comments
+    outline = re.sub(r"[ \t]+\n", "\n", outline)
+    outline = re.sub(r"\n{3,}", "\n\n", outline).strip() + "\n"
+    return outline if len(outline) < len(content) else None
+
+def get_code_outline(file_path: str, content: str) -> Optional[str]:
+    """Get a compact outline of a source file (None when it cannot be outlined or is not smaller)"""
+    ext = file_path.rsplit('.', 1)[-1].lower() if '.' in file_path else ''
+    key = (git_blob_sha(content.encode("utf-8")), ext)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _cache[key]
+
+    _stats["misses"] += 1
+    outline = _build_outline(file_path, content)
+
+    with _cache_lock:
+        _cache[key] = outline
+        while len(_cache) > OUTLINE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return outline
+
+def get_outline_cache_stats():
+    """Get outline cache counters"""
+    return {"entries": len(_cache), **_stats}
@@ -0,0 +1,157 @@
+"""
+Response cache for AI completions
+Completions are keyed by a fingerprint of (model, messages, temperature,
+max_tokens), so identical prompts from different users or retries are only
+sent to OpenRouter once per TTL
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+from config import (
+    COMPLETION_CACHE_BACKEND, COMPLETION_CACHE_TTL_SECONDS,
+    COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_SQLITE_PATH
+)
+
+def make_completion_key(model: str, messages: List[dict], temperature: float, max_tokens: int) -> str:
+    """Fingerprint a completion request"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryCompletionBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = COMPLETION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key: str, response: str, ttl_seconds: int):
+        with self._lock:
+            self._entries[key] = (response, time.time() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class SQLiteCompletionBackend:
+    """SQLite store, shared by all workers on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = COMPLETION_CACHE_SQLITE_PATH, max_entries: int = COMPLETION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, response: str, ttl_seconds: int):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now + ttl_seconds, now)
+            )
+            # Drop expired entries, then the least recently used ones over the limit
+            self._conn.execute("DELETE FROM completions WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                " SELECT key FROM completions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+class CompletionCache:
+    """Completion cache with hit/miss accounting on top of a storage backend"""
+
+    def __init__(self, backend, ttl_seconds: int = COMPLETION_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key: str) -> Optional[str]:
+        response = self.backend.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, key: str, response: str):
+        self.backend.set(key, response, self.ttl_seconds)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "entries": self.backend.size(),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+def create_completion_backend(backend_name: str = COMPLETION_CACHE_BACKEND):
+    """Create the configured storage backend ('memory' or 'sqlite')"""
+    if backend_name == "sqlite":
+        return SQLiteCompletionBackend()
+    return MemoryCompletionBackend()
+
+# Process-wide completion cache used by call_openrouter_api
+completion_cache = CompletionCache(create_completion_backend())
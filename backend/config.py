@@ -8,25 +8,37 @@ from typing import Dict, List
 AI_MODELS = {
     "mistral-7b": {
         "name": "mistralai/mistral-7b-instruct",
+        "tokenizer": "mistral-7b",
+        "chars_per_token": 3.5,
         "max_tokens": 2000,
+        "context_window": 32768,
         "temperature": 0.7,
         "description": "Fast and efficient for code analysis"
     },
     "llama-3-8b": {
         "name": "meta-llama/llama-3-8b-instruct", 
+        "tokenizer": "llama-3",
+        "chars_per_token": 4.0,
         "max_tokens": 2000,
+        "context_window": 8192,
         "temperature": 0.7,
         "description": "Good balance of speed and quality"
     },
     "claude-haiku": {
         "name": "anthropic/claude-3-haiku",
+        "tokenizer": "claude-3",
+        "chars_per_token": 3.5,
         "max_tokens": 2000,
+        "context_window": 200000,
         "temperature": 0.7,
         "description": "Excellent for test case generation"
     },
     "gpt-3.5": {
         "name": "openai/gpt-3.5-turbo",
+        "tokenizer": "cl100k_base",
+        "chars_per_token": 4.0,
         "max_tokens": 2000,
+        "context_window": 16385,
         "temperature": 0.7,
         "description": "Reliable and well-tested"
     }
@@ -35,6 +47,23 @@ AI_MODELS = {
 # Default model
 DEFAULT_AI_MODEL = "mistral-7b"
 
+# Quality tiers: AI_MODELS keys a request may be routed to, in preference order
+MODEL_TIERS = {
+    "fast": ["mistral-7b", "llama-3-8b"],
+    "balanced": ["llama-3-8b", "gpt-3.5", "mistral-7b"],
+    "quality": ["claude-haiku", "gpt-3.5"]
+}
+DEFAULT_MODEL_TIER = os.getenv("DEFAULT_MODEL_TIER", "fast")
+
+# Model routing: latency statistics and hedged requests
+ROUTER_HEDGING_ENABLED = os.getenv("ROUTER_HEDGING_ENABLED", "true").lower() == "true"
+ROUTER_LATENCY_WINDOW = 100  # Recent latencies kept per model for percentiles
+ROUTER_MIN_SAMPLES = 5  # Latencies needed before a model's p95 is trusted
+ROUTER_DEFAULT_LATENCY_SECONDS = 10.0  # Assumed latency (and hedge delay) for models without samples
+ROUTER_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("ROUTER_HEDGE_MIN_DELAY_SECONDS", "2"))
+ROUTER_HEDGE_MAX_DELAY_SECONDS = float(os.getenv("ROUTER_HEDGE_MAX_DELAY_SECONDS", "20"))
+ROUTER_ERROR_PENALTY = 4.0  # A model failing every call ranks as 5x slower
+
 # File type configurations with multiple framework options
 SUPPORTED_EXTENSIONS = {
     '.py': {
@@ -174,12 +203,122 @@ GITHUB_OAUTH_BASE = "https://github.com/login/oauth"
 # OpenRouter API settings
 OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
 
+# Shared HTTP client pool settings (one pooled client per upstream host)
+HTTP_CLIENT_POOLS = {
+    "github": {
+        "max_connections": 50,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 60.0,
+        "timeout": 30.0
+    },
+    "github_oauth": {
+        "max_connections": 10,
+        "max_keepalive_connections": 5,
+        "keepalive_expiry": 30.0,
+        "timeout": 30.0
+    },
+    "openrouter": {
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "keepalive_expiry": 120.0,
+        "timeout": 30.0
+    }
+}
+
+# HTTP/2 is only used when enabled and the optional 'h2' package is installed
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# AI completion cache settings
+COMPLETION_CACHE_BACKEND = os.getenv("COMPLETION_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+COMPLETION_CACHE_TTL_SECONDS = int(os.getenv("COMPLETION_CACHE_TTL_SECONDS", "3600"))
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "1000"))
+COMPLETION_CACHE_SQLITE_PATH = os.getenv("COMPLETION_CACHE_SQLITE_PATH", "completion_cache.db")
+
+# AI call admission control (fair queuing per session or client IP)
+LLM_MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENT_CALLS", "8"))  # OpenRouter calls in flight at once
+LLM_MAX_QUEUED_PER_CLIENT = int(os.getenv("LLM_MAX_QUEUED_PER_CLIENT", "4"))  # Waiting calls per client before 429
+LLM_MAX_QUEUED_TOTAL = int(os.getenv("LLM_MAX_QUEUED_TOTAL", "64"))  # Waiting calls across all clients before 429
+
+# Circuit breakers for OpenRouter and GitHub (fail fast while an upstream is down)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures that open a breaker
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))  # Open time before a trial request
+CIRCUIT_HALF_OPEN_MAX_CALLS = 1  # Trial requests allowed at once while half-open
+
+# GitHub rate limit scheduling
+GITHUB_BUDGET_RESERVE = int(os.getenv("GITHUB_BUDGET_RESERVE", "100"))  # Requests kept for interactive calls
+GITHUB_BACKGROUND_MAX_WAIT_SECONDS = 60  # Background calls wait this long for a reset before being shed
+GITHUB_SECONDARY_RETRIES = 3
+GITHUB_SECONDARY_BACKOFF_SECONDS = 2
+
 # Rate limiting (tokens per request)
 MAX_INPUT_TOKENS = 24000
 MAX_FILES_PER_REQUEST = 5
+PROMPT_RESERVED_TOKENS = 1500  # Kept for instructions around the source files
+CODE_MAX_TOKENS_PER_FILE = 2000  # Completion tokens per generated test file
+BATCH_CODE_MAX_TOKENS = int(os.getenv("BATCH_CODE_MAX_TOKENS", "8000"))  # Cap for batch-mode completions
+MIN_PACKED_FILE_TOKENS = 200  # Files are dropped instead of truncated below this
+
+# Speculative pre-generation of test code for the top suggestions (opt-in per request)
+SPECULATIVE_TOP_K = int(os.getenv("SPECULATIVE_TOP_K", "2"))  # Suggestions pre-generated per request
+SPECULATIVE_TTL_SECONDS = int(os.getenv("SPECULATIVE_TTL_SECONDS", "900"))  # How long results are kept
+SPECULATIVE_MAX_INFLIGHT = 8  # Background generations at once; more are skipped
+
+# Tokenizer files: tiktoken encodings are used when installed, otherwise
+# "<tokenizer>.json" (Hugging Face format) is loaded from this directory
+TOKENIZER_DIR = os.getenv("TOKENIZER_DIR")
+
+# Code outlines replace files that are over budget (public signatures and
+# docstrings, with function bodies longer than this many lines elided)
+OUTLINE_BODY_MAX_LINES = 15
+OUTLINE_FILE_MAX_TOKENS = int(os.getenv("OUTLINE_FILE_MAX_TOKENS", "6000"))  # Larger files are outlined
+OUTLINE_CACHE_MAX_ENTRIES = 512
+
+# Number of file contents fetched from GitHub at the same time per request
+MAX_CONCURRENT_FILE_FETCHES = 5
+
+# Batched pull requests (many test files in one commit)
+PR_BATCH_MAX_FILES = 100
+PR_MAX_CONCURRENT_BLOBS = 5  # Blobs uploaded to GitHub at the same time per pull request
+
+# Idempotency-Key journal for resumable pull request creation
+PR_JOURNAL_BACKEND = os.getenv("PR_JOURNAL_BACKEND", "memory")  # "memory" or "sqlite"
+PR_JOURNAL_SQLITE_PATH = os.getenv("PR_JOURNAL_SQLITE_PATH", "pr_journal.db")
+PR_JOURNAL_TTL_SECONDS = int(os.getenv("PR_JOURNAL_TTL_SECONDS", "86400"))  # How long a key can be retried or replayed
+PR_JOURNAL_LEASE_SECONDS = 60  # An attempt holds its key this long past its last step; then a retry may take over
+PR_JOURNAL_WAIT_SECONDS = 30  # A concurrent attempt with the same key waits this long before 409
+
+# Blob cache settings (file contents keyed by git blob SHA)
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR")  # Optional on-disk tier
+
+# Conditional request (ETag) cache settings
+ETAG_CACHE_MAX_BYTES = int(os.getenv("ETAG_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Repository tree cache settings
+TREE_HEAD_TTL_SECONDS = int(os.getenv("TREE_HEAD_TTL_SECONDS", "60"))  # How long a resolved HEAD commit is reused
+TREE_CACHE_MAX_ENTRIES = 32
+TREE_HEAD_CACHE_MAX_ENTRIES = 1024  # Resolved HEADs kept (one per token scope and repository)
+
+# Batch test generation jobs
+BATCH_JOBS_DB_PATH = os.getenv("BATCH_JOBS_DB_PATH", "batch_jobs.db")
+BATCH_WORKER_POOL_SIZE = int(os.getenv("BATCH_WORKER_POOL_SIZE", "3"))  # Files generated at the same time across all jobs
+BATCH_JOB_LEASE_SECONDS = 60  # A worker renews its claim on a job every third of this; silent workers lose their jobs after it
+BATCH_EVENTS_POLL_SECONDS = 2  # Progress streams poll the database for jobs run by another worker
+BATCH_MAX_FILES_PER_JOB = 200
+
+# Tarball ingestion (whole repository in one download)
+TARBALL_INGEST_MIN_FILES = int(os.getenv("TARBALL_INGEST_MIN_FILES", "10"))  # Used when more files than this are requested
+TARBALL_MAX_FILE_BYTES = 1024 * 1024  # Larger files are left to per-file fetches
+
+# Batched GraphQL file fetches (files per query before the query is split)
+GRAPHQL_MAX_BLOBS_PER_QUERY = int(os.getenv("GRAPHQL_MAX_BLOBS_PER_QUERY", "50"))
 
 # Session settings
-SESSION_TIMEOUT_HOURS = 24
+SESSION_TIMEOUT_HOURS = float(os.getenv("SESSION_TIMEOUT_HOURS", "24"))  # Since the session was last used
+SESSION_TOUCH_INTERVAL_SECONDS = 60  # Refresh a session's last_accessed at most this often
+SESSION_REAPER_INTERVAL_SECONDS = int(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "60"))
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")  # "memory" (single worker) or "sqlite" (shared by workers)
+SESSION_STORE_SQLITE_PATH = os.getenv("SESSION_STORE_SQLITE_PATH", "sessions.db")
 
 def get_ai_model_config(model_key: str = None) -> Dict:
     """Get AI model configuration"""
@@ -220,4 +359,8 @@ def is_supported_file(file_path: str) -> bool:
 def should_exclude_file(file_path: str) -> bool:
     """Check if file should be excluded from analysis"""
     path_lower = file_path.lower()
-    return any(pattern in path_lower for pattern in EXCLUDED_PATTERNS)
\ No newline at end of file
+    return any(pattern in path_lower for pattern in EXCLUDED_PATTERNS)
+
+def is_code_file(file_path: str) -> bool:
+    """Check if file is a code file we want to analyze"""
+    return is_supported_file(file_path) and not should_exclude_file(file_path)
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Conditional GET support for the GitHub API
+Stores ETag/Last-Modified validators and bodies per URL and token scope, and
+replays the stored body when GitHub answers 304 Not Modified (which does not
+count against the rate limit)
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import httpx
+
+from config import ETAG_CACHE_MAX_BYTES
+from github_scheduler import scheduled_send
+from circuit_breaker import CircuitOpenError
+from utils import get_token_scope
+
+# Headers that describe the wire encoding of the original response and must
+# not be replayed with the already-decoded body
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+class ValidatorCache:
+    """LRU store of validators and response bodies, bounded by bytes"""
+
+    def __init__(self, max_bytes: int = ETAG_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, str, str], response: httpx.Response):
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS},
+            "body": body
+        }
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous["body"])
+            self._entries[key] = entry
+            self.current_bytes += len(body)
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted["body"])
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses
+        }
+
+# Process-wide validator cache shared by all GitHub GET helpers
+validator_cache = ValidatorCache()
+
+async def conditional_get(client: httpx.AsyncClient, url: str, headers: Dict[str, str], **kwargs) -> httpx.Response:
+    """
+    GET a GitHub URL with If-None-Match/If-Modified-Since when a validator is stored
+
+    A 304 response is turned into a 200 response carrying the stored body, so
+    callers handle it exactly like a fresh response. While the GitHub circuit
+    is open the stored body is served as is (marked X-Served-Stale).
+    """
+    key = (get_token_scope(headers.get("Authorization")), url, headers.get("Accept", ""))
+    entry = validator_cache.get(key)
+
+    request_headers = dict(headers)
+    if entry:
+        validator_cache.revalidations += 1
+        if entry["etag"]:
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+    else:
+        validator_cache.misses += 1
+
+    try:
+        response = await scheduled_send(
+            request_headers,
+            lambda: client.get(url, headers=request_headers, **kwargs)
+        )
+    except CircuitOpenError:
+        if not entry:
+            raise
+        validator_cache.stale_hits += 1
+        return httpx.Response(
+            status_code=200,
+            headers={**entry["headers"], "X-Served-Stale": "circuit-open"},
+            content=entry["body"],
+            request=httpx.Request("GET", url)
+        )
+
+    if response.status_code == 304 and entry:
+        validator_cache.hits += 1
+        return httpx.Response(
+            status_code=200,
+            headers=entry["headers"],
+            content=entry["body"],
+            request=response.request
+        )
+
+    if response.status_code == 200:
+        validator_cache.put(key, response)
+
+    return response
+
+def get_validator_cache_stats() -> Dict:
+    """Get conditional request counters"""
+    return validator_cache.stats()
@@ -0,0 +1,175 @@
+"""
+Batched file content fetches through the GitHub GraphQL API
+Many files are read with one query of aliased object(expression: "<sha>:path")
+lookups instead of one REST round trip per file. The SHA is the HEAD commit
+tree_cache resolved, so one request never mixes files from two commits.
+Queries are chunked, and a chunk GitHub rejects as too expensive is split
+and retried
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import httpx
+from fastapi import HTTPException
+
+from config import GRAPHQL_MAX_BLOBS_PER_QUERY
+from http_clients import get_client
+from blob_cache import blob_cache
+from tree_cache import lookup_blob_sha, resolve_head_commit
+from github_scheduler import scheduled_send, is_rate_limited, is_secondary_rate_limited
+from utils import get_token_scope, fetch_files_concurrently
+
+# GraphQL error types that mean the query was too large or too expensive
+_LIMIT_ERROR_TYPES = {"MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED", "EXCESSIVE_PAGINATION"}
+
+# Token scopes GitHub refused GraphQL for (e.g. tokens without GraphQL access); rate limits do not count
+_unavailable_scopes: Set[str] = set()
+
+_stats = {"queries": 0, "blobs_fetched": 0, "split_retries": 0, "rest_fallbacks": 0}
+
+class GraphQLUnavailable(Exception):
+    """GraphQL cannot be used for this token or request"""
+
+def _is_auth_failure(response: httpx.Response) -> bool:
+    """401, or a 403 that is not a (primary or secondary) rate limit"""
+    if response.status_code == 401:
+        return True
+    return (
+        response.status_code == 403
+        and not is_rate_limited(response)
+        and not is_secondary_rate_limited(response)
+        and "rate limit" not in response.text.lower()
+    )
+
+def _build_blob_query(count: int) -> str:
+    variables = ", ".join(f"$e{i}: String!" for i in range(count))
+    objects = "\n".join(
+        f"    f{i}: object(expression: $e{i}) {{ ... on Blob {{ oid text isBinary isTruncated }} }}"
+        for i in range(count)
+    )
+    return (
+        f"query($owner: String!, $name: String!, {variables}) {{\n"
+        f"  repository(owner: $owner, name: $name) {{\n{objects}\n  }}\n"
+        f"  rateLimit {{ cost remaining }}\n"
+        f"}}"
+    )
+
+async def _query_blobs(owner: str, repo: str, file_paths: List[str], token: str, ref: str) -> Dict[str, str]:
+    """Fetch one chunk of files; splits the chunk when GitHub rejects it as too expensive"""
+    headers = {
+        "Authorization": f"bearer {token}",
+        "User-Agent": "TestCaseGenerator/1.0"
+    }
+    payload = {
+        "query": _build_blob_query(len(file_paths)),
+        "variables": {
+            "owner": owner,
+            "name": repo,
+            **{f"e{i}": f"{ref}:{path}" for i, path in enumerate(file_paths)}
+        }
+    }
+
+    client = get_client("github")
+    try:
+        response = await scheduled_send(
+            headers,
+            lambda: client.post("https://api.github.com/graphql", headers=headers, json=payload),
+            resource="graphql"
+        )
+    except httpx.RequestError as e:
+        raise GraphQLUnavailable(f"Failed to connect to GitHub GraphQL API: {str(e)}")
+    _stats["queries"] += 1
+
+    if _is_auth_failure(response):
+        _unavailable_scopes.add(get_token_scope(token))
+        raise GraphQLUnavailable(f"GraphQL not available for this token ({response.status_code})")
+    if response.status_code in (403, 429):
+        raise GraphQLUnavailable("GitHub GraphQL rate limit exceeded")
+    if response.status_code != 200:
+        raise GraphQLUnavailable(f"GitHub GraphQL API error ({response.status_code})")
+
+    body = response.json()
+    errors = body.get("errors") or []
+    if any(error.get("type") in _LIMIT_ERROR_TYPES for error in errors):
+        if len(file_paths) == 1:
+            raise GraphQLUnavailable("GraphQL query cost limit exceeded for a single file")
+        _stats["split_retries"] += 1
+        middle = len(file_paths) // 2
+        print(f"✂️ GraphQL query for {len(file_paths)} files too expensive, splitting")
+        first = await _query_blobs(owner, repo, file_paths[:middle], token, ref)
+        second = await _query_blobs(owner, repo, file_paths[middle:], token, ref)
+        return {**first, **second}
+
+    # Missing files come back as null objects (with NOT_FOUND errors); other errors leave data empty
+    repository = (body.get("data") or {}).get("repository")
+    if repository is None:
+        message = errors[0].get("message") if errors else "no repository data"
+        raise GraphQLUnavailable(f"GitHub GraphQL query failed: {message}")
+
+    contents = {}
+    for i, path in enumerate(file_paths):
+        blob = repository.get(f"f{i}")
+        if not blob or blob.get("isBinary") or blob.get("isTruncated") or blob.get("text") is None:
+            continue
+        blob_cache.put(blob["oid"], blob["text"])
+        contents[path] = blob["text"]
+    return contents
+
+async def fetch_blobs_graphql(owner: str, repo: str, file_paths: List[str], token: str, ref: str) -> Dict[str, str]:
+    """
+    Fetch text contents of many files at commit `ref` with batched GraphQL queries
+
+    Returns path -> content for the files GraphQL could serve; binary, truncated
+    and missing files are left out so callers can fetch them over REST.
+    """
+    if not token or get_token_scope(token) in _unavailable_scopes:
+        raise GraphQLUnavailable("GraphQL requires an authorized token")
+
+    contents: Dict[str, str] = {}
+    for start in range(0, len(file_paths), GRAPHQL_MAX_BLOBS_PER_QUERY):
+        chunk = file_paths[start:start + GRAPHQL_MAX_BLOBS_PER_QUERY]
+        contents.update(await _query_blobs(owner, repo, chunk, token, ref))
+
+    _stats["blobs_fetched"] += len(contents)
+    return contents
+
+async def fetch_files_batched(
+    owner: str,
+    repo: str,
+    file_paths: List[str],
+    token: Optional[str],
+    fetch_one: Callable[[str], Awaitable[Optional[str]]]
+) -> List[Optional[str]]:
+    """
+    Fetch file contents in request order: blob cache first, then one batched
+    GraphQL query for the rest, then fetch_one (REST) for anything left over
+    """
+    contents: Dict[str, Optional[str]] = {}
+    for file_path in file_paths:
+        blob_sha = lookup_blob_sha(owner, repo, file_path, token)
+        if blob_sha:
+            cached_content = blob_cache.get(blob_sha)
+            if cached_content is not None:
+                contents[file_path] = cached_content
+
+    missing = [file_path for file_path in file_paths if file_path not in contents]
+    if len(missing) > 1 and token:
+        try:
+            commit_sha = await resolve_head_commit(owner, repo, token)
+            contents.update(await fetch_blobs_graphql(owner, repo, missing, token, commit_sha))
+        except (GraphQLUnavailable, HTTPException) as e:
+            _stats["rest_fallbacks"] += 1
+            print(f"⚠️ {getattr(e, 'detail', str(e))}, fetching files over REST")
+
+    remaining = [file_path for file_path in file_paths if file_path not in contents]
+    if remaining:
+        remaining_contents = await fetch_files_concurrently(remaining, fetch_one)
+        contents.update(zip(remaining, remaining_contents))
+
+    return [contents[file_path] for file_path in file_paths]
+
+def get_graphql_stats() -> Dict:
+    """Get batched GraphQL fetch counters"""
+    return {
+        **_stats,
+        "max_blobs_per_query": GRAPHQL_MAX_BLOBS_PER_QUERY,
+        "unavailable_tokens": len(_unavailable_scopes)
+    }
@@ -0,0 +1,175 @@
+"""
+GitHub rate-limit-aware scheduler
+Tracks the remaining request budget per token from X-RateLimit-* headers,
+keeps a reserve for interactive requests by delaying or shedding background
+work, and retries secondary rate limit responses with backoff
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+from fastapi import HTTPException
+
+from config import (
+    GITHUB_BUDGET_RESERVE, GITHUB_BACKGROUND_MAX_WAIT_SECONDS,
+    GITHUB_SECONDARY_RETRIES, GITHUB_SECONDARY_BACKOFF_SECONDS
+)
+from utils import get_token_scope
+from circuit_breaker import github_breaker, is_upstream_failure
+
+# Request priorities
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+# Priority of GitHub calls made in the current task (background jobs switch it)
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "github_priority", default=PRIORITY_INTERACTIVE
+)
+
+@contextmanager
+def background_priority():
+    """Mark GitHub calls made inside this block (and tasks it starts) as background work"""
+    reset_token = _current_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_priority.reset(reset_token)
+
+def is_rate_limited(response: httpx.Response) -> bool:
+    """Check if a response was rejected by the primary (hourly) rate limit"""
+    return response.status_code in (403, 429) and response.headers.get("x-ratelimit-remaining") == "0"
+
+def is_secondary_rate_limited(response: httpx.Response) -> bool:
+    """Check if a response was rejected by a secondary (abuse) rate limit"""
+    if response.status_code not in (403, 429) or is_rate_limited(response):
+        return False
+    if "retry-after" in response.headers:
+        return True
+    return "secondary rate limit" in response.text.lower()
+
+def seconds_until_reset(response: httpx.Response) -> int:
+    """Seconds until the rate limit window of a response resets"""
+    try:
+        reset_at = int(response.headers.get("x-ratelimit-reset", "0"))
+    except ValueError:
+        return 60
+    return max(0, reset_at - int(time.time()))
+
+class TokenBudget:
+    """Last known rate limit state for one token"""
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: float = 0.0
+        self.updated_at: float = 0.0
+
+    def update(self, headers: httpx.Headers):
+        try:
+            if "x-ratelimit-remaining" in headers:
+                self.remaining = int(headers["x-ratelimit-remaining"])
+            if "x-ratelimit-limit" in headers:
+                self.limit = int(headers["x-ratelimit-limit"])
+            if "x-ratelimit-reset" in headers:
+                self.reset_at = float(headers["x-ratelimit-reset"])
+            self.updated_at = time.time()
+        except ValueError:
+            pass
+
+    def is_current(self) -> bool:
+        return self.remaining is not None and time.time() < self.reset_at
+
+    def to_dict(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "resets_in_seconds": max(0, int(self.reset_at - time.time())) if self.reset_at else None
+        }
+
+class GitHubScheduler:
+    """Admission control and retries for GitHub API calls, per token"""
+
+    def __init__(self):
+        self.budgets: Dict[str, TokenBudget] = {}
+        self.counters = {
+            "sent": 0,
+            "delayed": 0,
+            "shed": 0,
+            "rejected_exhausted": 0,
+            "secondary_retries": 0
+        }
+
+    def _budget(self, scope: str) -> TokenBudget:
+        if scope not in self.budgets:
+            self.budgets[scope] = TokenBudget()
+        return self.budgets[scope]
+
+    async def _admit(self, budget: TokenBudget, priority: str):
+        if not budget.is_current():
+            return
+
+        wait_seconds = budget.reset_at - time.time()
+
+        if budget.remaining <= 0:
+            self.counters["rejected_exhausted"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"GitHub API rate limit exhausted. Resets in {int(wait_seconds)}s",
+                headers={"Retry-After": str(int(wait_seconds) + 1)}
+            )
+
+        if priority == PRIORITY_BACKGROUND and budget.remaining <= GITHUB_BUDGET_RESERVE:
+            if wait_seconds > GITHUB_BACKGROUND_MAX_WAIT_SECONDS:
+                self.counters["shed"] += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="GitHub API budget is reserved for interactive requests. Try again later",
+                    headers={"Retry-After": str(int(wait_seconds) + 1)}
+                )
+            self.counters["delayed"] += 1
+            print(f"⏳ Delaying background GitHub call {int(wait_seconds)}s until rate limit reset")
+            await asyncio.sleep(wait_seconds)
+
+    async def send(self, headers: Dict[str, str], send_fn: Callable[[], Awaitable[httpx.Response]], resource: str = "core") -> httpx.Response:
+        """Send a GitHub request through the circuit breaker and admission control, retrying secondary rate limits"""
+        # GraphQL has its own point budget, tracked separately from the REST (core) budget
+        scope = get_token_scope(headers.get("Authorization"))
+        budget = self._budget(scope if resource == "core" else f"{scope}:{resource}")
+        priority = _current_priority.get()
+
+        await self._admit(budget, priority)
+
+        attempt = 0
+        while True:
+            if budget.remaining is not None:
+                budget.remaining -= 1
+            self.counters["sent"] += 1
+            response = await github_breaker.call(send_fn, is_upstream_failure)
+            budget.update(response.headers)
+
+            if not is_secondary_rate_limited(response) or attempt >= GITHUB_SECONDARY_RETRIES:
+                return response
+
+            retry_after = response.headers.get("retry-after")
+            delay = int(retry_after) if retry_after and retry_after.isdigit() else GITHUB_SECONDARY_BACKOFF_SECONDS * (2 ** attempt)
+            attempt += 1
+            self.counters["secondary_retries"] += 1
+            print(f"🔁 GitHub secondary rate limit hit, retrying in {delay}s (attempt {attempt}/{GITHUB_SECONDARY_RETRIES})")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {
+            "reserve": GITHUB_BUDGET_RESERVE,
+            "background_max_wait_seconds": GITHUB_BACKGROUND_MAX_WAIT_SECONDS,
+            "counters": dict(self.counters),
+            "budgets": {scope: budget.to_dict() for scope, budget in self.budgets.items()}
+        }
+
+# Process-wide scheduler shared by all GitHub helpers
+github_scheduler = GitHubScheduler()
+
+async def scheduled_send(headers: Dict[str, str], send_fn: Callable[[], Awaitable[httpx.Response]], resource: str = "core") -> httpx.Response:
+    """Send a GitHub request through the shared scheduler"""
+    return await github_scheduler.send(headers, send_fn, resource)
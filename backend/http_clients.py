@@ -0,0 +1,61 @@
+"""
+Shared HTTP client pool for GitHub and OpenRouter API calls
+Keeps one keep-alive client per upstream host for the lifetime of the process
+"""
+from typing import Dict
+import httpx
+
+from config import HTTP_CLIENT_POOLS, HTTP2_ENABLED
+
+# Process-wide client registry, keyed by pool name from HTTP_CLIENT_POOLS
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _http2_available() -> bool:
+    """Check if HTTP/2 is enabled and the optional 'h2' package is installed"""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("⚠️ HTTP2_ENABLED is set but 'h2' is not installed, using HTTP/1.1")
+        return False
+
+def _create_client(name: str) -> httpx.AsyncClient:
+    """Create a pooled client using the settings for the given pool"""
+    if name not in HTTP_CLIENT_POOLS:
+        raise ValueError(f"Unknown HTTP client pool: {name}")
+
+    settings = HTTP_CLIENT_POOLS[name]
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"]
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=settings["timeout"],
+        http2=_http2_available()
+    )
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Get the shared client for an upstream host, creating it on first use"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _create_client(name)
+        _clients[name] = client
+    return client
+
+async def start_clients():
+    """Create all configured clients (called from the app lifespan)"""
+    for name in HTTP_CLIENT_POOLS:
+        get_client(name)
+    print(f"🔌 HTTP client pools ready: {list(_clients.keys())}")
+
+async def close_clients():
+    """Close all shared clients (called on app shutdown)"""
+    for name, client in list(_clients.items()):
+        if not client.is_closed:
+            await client.aclose()
+        del _clients[name]
+    print("🔌 HTTP client pools closed")
@@ -0,0 +1,167 @@
+"""
+Admission control for AI completion calls
+Caps how many OpenRouter calls run at once and queues the rest per client
+(session or IP), granting free slots to clients in round-robin order so one
+busy client cannot starve the others. Full queues are rejected with 429
+"""
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict
+from fastapi import HTTPException
+
+from config import LLM_MAX_CONCURRENT_CALLS, LLM_MAX_QUEUED_PER_CLIENT, LLM_MAX_QUEUED_TOTAL
+
+# Client the current request's AI calls are accounted to (set per request)
+_current_client: contextvars.ContextVar[str] = contextvars.ContextVar("llm_client", default="anonymous")
+
+@contextmanager
+def llm_client(key: str):
+    """Account AI calls made inside this block (and tasks it starts) to a client key"""
+    reset_token = _current_client.set(key)
+    try:
+        yield
+    finally:
+        _current_client.reset(reset_token)
+
+def current_llm_client() -> str:
+    return _current_client.get()
+
+class LLMAdmissionController:
+    """Global concurrency limit with per-client fair queuing"""
+
+    def __init__(
+        self,
+        max_concurrent: int = LLM_MAX_CONCURRENT_CALLS,
+        max_queued_per_client: int = LLM_MAX_QUEUED_PER_CLIENT,
+        max_queued_total: int = LLM_MAX_QUEUED_TOTAL
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued_per_client = max_queued_per_client
+        self.max_queued_total = max_queued_total
+        self.active = 0
+        self.active_by_client: Dict[str, int] = {}
+        # Clients with waiters, in round-robin order
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued_total = 0
+        self._average_call_seconds = 10.0
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def _retry_after(self) -> int:
+        """Rough wait until a newly queued call would start"""
+        rounds = (self._queued_total + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._average_call_seconds))
+
+    def _reject(self, reason: str):
+        self.counters["rejected"] += 1
+        retry_after = self._retry_after()
+        print(f"🚦 AI call rejected ({reason}), retry in {retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many AI requests in progress ({reason}). Please retry shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def _grant(self, client: str):
+        self.active += 1
+        self.active_by_client[client] = self.active_by_client.get(client, 0) + 1
+        self.counters["admitted"] += 1
+
+    def check_admission(self, client: str = None):
+        """Raise 429 now if a call for this client would be rejected (used before streaming starts)"""
+        client = client or current_llm_client()
+        if self.active < self.max_concurrent and not self._queues:
+            return
+        queue = self._queues.get(client)
+        if queue is not None and len(queue) >= self.max_queued_per_client:
+            self._reject("client queue is full")
+        if self._queued_total >= self.max_queued_total:
+            self._reject("server queue is full")
+
+    async def _acquire(self, client: str):
+        if self.active < self.max_concurrent and not self._queues:
+            self._grant(client)
+            return
+
+        self.check_admission(client)
+        queue = self._queues.get(client)
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client] = deque()
+        queue.append(waiter)
+        self._queued_total += 1
+        self.counters["queued"] += 1
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the caller went away: hand the slot on
+                self._release(client)
+            else:
+                self._remove_waiter(client, waiter)
+            raise
+
+    def _remove_waiter(self, client: str, waiter: asyncio.Future):
+        queue = self._queues.get(client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued_total -= 1
+            if not queue:
+                del self._queues[client]
+
+    def _release(self, client: str):
+        self.active -= 1
+        self.active_by_client[client] -= 1
+        if not self.active_by_client[client]:
+            del self.active_by_client[client]
+
+        # Wake the next client in round-robin order, then move it to the back
+        while self._queues and self.active < self.max_concurrent:
+            next_client, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued_total -= 1
+            if queue:
+                self._queues.move_to_end(next_client)
+            else:
+                del self._queues[next_client]
+            if not waiter.done():
+                self._grant(next_client)
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, client: str = None):
+        """Hold one AI call slot for the current (or given) client"""
+        client = client or current_llm_client()
+        await self._acquire(client)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            self._average_call_seconds = 0.8 * self._average_call_seconds + 0.2 * elapsed
+            self._release(client)
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued_per_client": self.max_queued_per_client,
+            "max_queued_total": self.max_queued_total,
+            "active": self.active,
+            "queued": self._queued_total,
+            "average_call_seconds": round(self._average_call_seconds, 2),
+            "clients": {
+                client: {
+                    "active": self.active_by_client.get(client, 0),
+                    "queued": len(self._queues.get(client, ()))
+                }
+                for client in set(self.active_by_client) | set(self._queues)
+            },
+            "counters": dict(self.counters)
+        }
+
+# Process-wide limiter shared by all OpenRouter calls
+llm_limiter = LLMAdmissionController()
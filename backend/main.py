@@ -1,12 +1,15 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
+import asyncio
 import httpx
 import json
 import time
-from typing import List, Optional, Dict, Any
+import fnmatch
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator, Awaitable
 from pydantic import BaseModel
 import secrets
 from itsdangerous import URLSafeTimedSerializer
@@ -15,23 +18,57 @@ from itsdangerous import URLSafeTimedSerializer
 from config import (
     AI_MODELS, DEFAULT_AI_MODEL, SUPPORTED_EXTENSIONS, FRAMEWORK_CONFIGS,
     get_ai_model_config, get_language_config, get_framework_config, 
-    get_available_frameworks, is_supported_file, should_exclude_file
+    get_available_frameworks, is_code_file,
+    BATCH_MAX_FILES_PER_JOB, CODE_MAX_TOKENS_PER_FILE, BATCH_CODE_MAX_TOKENS, DEFAULT_MODEL_TIER,
+    SPECULATIVE_TOP_K, PR_BATCH_MAX_FILES, PR_MAX_CONCURRENT_BLOBS
 )
 from utils import (
     decode_github_content, parse_test_suggestions, generate_test_filename,
-    validate_branch_name, format_commit_message, extract_code_from_ai_response,
-    make_github_request, sanitize_file_path, truncate_content_if_needed
+    validate_branch_name, format_commit_message, extract_code_from_ai_response, split_batch_code_response,
+    make_github_request, sanitize_file_path, truncate_content_if_needed,
+    format_sse_event, get_token_scope
 )
 from github_direct import (
     parse_github_url, fetch_github_repo_info, fetch_github_repo_files, 
     fetch_file_content, detect_language_from_extension, 
     detect_framework_from_language, detect_framework_from_project_structure, get_github_token
 )
+from blob_cache import blob_cache
+from tree_cache import get_repo_tree, lookup_blob_sha, get_tree_cache_stats
+from etag_cache import get_validator_cache_stats
+from completion_cache import completion_cache, make_completion_key
+from single_flight import openrouter_flight, get_single_flight_stats
+from github_scheduler import github_scheduler
+from repo_profile import get_repo_profile
+from http_clients import get_client, start_clients, close_clients
+from batch_jobs import batch_jobs
+from tarball_ingest import prefetch_repo_files, get_tarball_stats
+from github_graphql import fetch_files_batched, get_graphql_stats
+from token_budget import pack_file_contents, finalize_token_usage, get_tightest_budget
+from code_outline import get_outline_cache_stats
+from llm_limiter import llm_limiter, llm_client
+from model_router import model_router
+from circuit_breaker import openrouter_breaker, is_upstream_failure, get_circuit_breaker_stats
+from speculative import speculative_generator, make_speculative_key
+from session_store import session_store, session_reaper
+from pr_journal import pr_journal, make_request_fingerprint, JournalLeaseLost
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Test Case Generator API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    await start_clients()
+    await batch_jobs.start(generate_batch_file)
+    await session_reaper.start()
+    yield
+    await session_reaper.stop()
+    await batch_jobs.stop()
+    await speculative_generator.stop()
+    await close_clients()
+
+app = FastAPI(title="Test Case Generator API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -48,6 +85,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def account_llm_calls(request: Request, call_next):
+    """Queue this request's AI calls under its session (or client IP) for fair scheduling"""
+    with llm_client(get_llm_client_key(request)):
+        return await call_next(request)
+
 # Configuration
 GITHUB_CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
@@ -58,27 +101,6 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 # Session serializer
 serializer = URLSafeTimedSerializer(SECRET_KEY)
 
-# In-memory session storage (for MVP)
-sessions: Dict[str, Dict[str, Any]] = {}
-
-# Session cleanup - remove expired sessions
-def cleanup_sessions():
-    """Clean up expired or invalid sessions"""
-    import time
-    current_time = time.time()
-    expired_sessions = []
-    
-    for session_token, session_data in sessions.items():
-        # Remove sessions older than 24 hours
-        if current_time - session_data.get("created_at", 0) > 86400:
-            expired_sessions.append(session_token)
-    
-    for session_token in expired_sessions:
-        del sessions[session_token]
-        print(f"🧹 Cleaned up expired session: {session_token[:10]}...")
-    
-    return len(expired_sessions)
-
 # Pydantic models
 class Repository(BaseModel):
     id: int
@@ -105,6 +127,12 @@ class GenerateTestRequest(BaseModel):
     files: List[str]
     repo_full_name: str
     framework: Optional[str] = None  # Allow user to specify framework
+    bypass_cache: bool = False  # Skip the AI completion cache for this request
+    quality_tier: Optional[str] = None  # "fast", "balanced" or "quality" (see MODEL_TIERS)
+
+class SuggestionItem(BaseModel):
+    suggestion_id: int
+    suggestion_summary: str
 
 class GenerateCodeRequest(BaseModel):
     suggestion_id: int
@@ -112,6 +140,9 @@ class GenerateCodeRequest(BaseModel):
     files: List[str]
     repo_full_name: str
     framework: Optional[str] = None  # Allow user to specify framework
+    bypass_cache: bool = False  # Skip the AI completion cache for this request
+    quality_tier: Optional[str] = None  # "fast", "balanced" or "quality" (see MODEL_TIERS)
+    additional_suggestions: List[SuggestionItem] = []  # Batch mode: more test files from the same completion
 
 class CreatePRRequest(BaseModel):
     repo_full_name: str
@@ -120,6 +151,17 @@ class CreatePRRequest(BaseModel):
     branch_name: str
     commit_message: str
 
+class PRFileItem(BaseModel):
+    path: str  # Target path in the repository, e.g. "tests/test_utils.py"
+    test_code: str
+
+class CreateBatchPRRequest(BaseModel):
+    repo_full_name: str
+    files: List[PRFileItem]
+    branch_name: str
+    commit_message: str
+    title: Optional[str] = None
+
 class AuthCallbackRequest(BaseModel):
     code: str
     state: str
@@ -131,6 +173,9 @@ class DirectTestRequest(BaseModel):
     repo_url: str
     files: List[str]
     framework: Optional[str] = None
+    bypass_cache: bool = False  # Skip the AI completion cache for this request
+    quality_tier: Optional[str] = None  # "fast", "balanced" or "quality" (see MODEL_TIERS)
+    speculative: bool = False  # Pre-generate test code for the top suggestions in the background
 
 class DirectCodeRequest(BaseModel):
     repo_url: str
@@ -138,6 +183,15 @@ class DirectCodeRequest(BaseModel):
     suggestion_summary: str
     files: List[str]
     framework: Optional[str] = None
+    bypass_cache: bool = False  # Skip the AI completion cache for this request
+    quality_tier: Optional[str] = None  # "fast", "balanced" or "quality" (see MODEL_TIERS)
+    additional_suggestions: List[SuggestionItem] = []  # Batch mode: more test files from the same completion
+
+class BatchJobRequest(BaseModel):
+    repo_url: str
+    file_filter: Optional[str] = None  # Glob matched against file paths, e.g. "src/*.py"
+    framework: Optional[str] = None
+    max_files: int = BATCH_MAX_FILES_PER_JOB
 
 # Models are defined above
 
@@ -250,7 +304,7 @@ async def get_ai_status():
             {"role": "user", "content": "Generate 3 test cases for a simple calculator function. Format as: 1. Description 2. Description 3. Description"}
         ]
         
-        ai_response = await call_openrouter_api(messages)
+        ai_response = await call_openrouter_api(messages, use_cache=False)
         
         return {
             "status": "success",
@@ -265,22 +319,74 @@ async def get_ai_status():
             "openrouter_key_set": bool(OPENROUTER_API_KEY)
         }
 
+@app.get("/admin/ai-cache")
+async def get_ai_cache_status():
+    """Get AI completion cache statistics"""
+    return completion_cache.stats()
+
 @app.get("/admin/sessions")
-async def get_session_status():
-    """Get current session status and statistics"""
+async def get_session_status(offset: int = 0, limit: int = 50):
+    """Get current session status and statistics (one page of sessions, soonest expiry first)"""
+    offset = max(0, offset)
+    limit = min(max(1, limit), 500)
+    page = await session_store.list(offset, limit)
     return {
-        "total_sessions": len(sessions),
-        "session_tokens": [token[:10] + "..." for token in sessions.keys()],
+        "total_sessions": await session_store.count(),
+        "store_backend": session_store.name,
+        "offset": offset,
+        "limit": limit,
+        "expiry": session_reaper.stats(),
+        "session_tokens": [token[:10] + "..." for token, _ in page],
         "sessions_detail": {
             token[:10] + "...": {
                 "user": session_data["user"]["login"],
                 "created_at": session_data.get("created_at", "unknown"),
-                "last_accessed": session_data.get("last_accessed", "unknown")
+                "last_accessed": session_data.get("last_accessed", "unknown"),
+                "expires_at": session_data["expires_at"]
             }
-            for token, session_data in sessions.items()
+            for token, session_data in page
         }
     }
 
+@app.get("/admin/cache-stats")
+async def get_cache_stats():
+    """Get upstream caching statistics (conditional requests, trees, blobs, tarballs, GraphQL, outlines, coalescing and speculation)"""
+    return {
+        "conditional_requests": get_validator_cache_stats(),
+        "trees": get_tree_cache_stats(),
+        "blobs": blob_cache.stats(),
+        "tarballs": get_tarball_stats(),
+        "graphql": get_graphql_stats(),
+        "outlines": get_outline_cache_stats(),
+        "single_flight": get_single_flight_stats(),
+        "speculative": speculative_generator.stats()
+    }
+
+@app.get("/admin/llm-queue")
+async def get_llm_queue_status():
+    """Get AI call concurrency, per-client queues and rejection counters"""
+    return llm_limiter.stats()
+
+@app.get("/admin/model-router")
+async def get_model_router_status():
+    """Get per-model latency/error statistics, tier rankings and hedging counters"""
+    return model_router.stats()
+
+@app.get("/admin/circuit-breakers")
+async def get_circuit_breaker_status():
+    """Get the state (closed, open, half_open) and counters of the OpenRouter and GitHub breakers"""
+    return get_circuit_breaker_stats()
+
+@app.get("/admin/pr-journal")
+async def get_pr_journal_status():
+    """Get Idempotency-Key journal counters for pull request creation (started, resumed, replayed)"""
+    return pr_journal.stats()
+
+@app.get("/admin/github-rate-limits")
+async def get_github_rate_limits():
+    """Get GitHub rate limit budgets per token and scheduler counters"""
+    return github_scheduler.stats()
+
 @app.get("/admin/test-pr-permissions")
 async def test_pr_permissions(request: Request):
     """Test if the current user can create PRs"""
@@ -288,7 +394,7 @@ async def test_pr_permissions(request: Request):
     if not session_token:
         return {"error": "Not authenticated"}
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         return {"error": "No GitHub token"}
     
@@ -327,25 +433,101 @@ def get_session_token(request: Request) -> Optional[str]:
         return auth_header[7:]
     return None
 
-def get_github_token_from_session(session_token: str) -> Optional[str]:
+def build_fallback_suggestions(files: List[str], framework: str) -> List[Dict[str, Any]]:
+    """Framework-specific suggestions served when the AI returns none or is unavailable"""
+    # Get file info for better suggestions
+    first_file = files[0] if files else "code_file"
+    file_name = first_file.split('/')[-1] if '/' in first_file else first_file
+    file_ext = file_name.split('.')[-1].lower() if '.' in file_name else 'code'
+    
+    # GUARANTEED Framework-specific fallback suggestions
+    if framework == 'pytest' or file_ext == 'py':
+        fallback_suggestions = [
+            f"Verify that functions in {file_name} return correct data types and values",
+            f"Test error handling and exception scenarios in {file_name}",
+            f"Validate input parameters and boundary conditions in {file_name}",
+            f"Test function behavior with None, empty, and invalid inputs in {file_name}",
+            f"Verify integration points and external dependencies in {file_name}"
+        ]
+    elif framework == 'jest' or file_ext in ['js', 'jsx', 'ts', 'tsx']:
+        fallback_suggestions = [
+            f"Test component rendering and prop validation in {file_name}",
+            f"Verify user interactions and event handling in {file_name}",
+            f"Test state management and component updates in {file_name}",
+            f"Validate API calls and async operations in {file_name}",
+            f"Test error boundaries and error handling in {file_name}"
+        ]
+    elif framework == 'junit' or file_ext == 'java':
+        fallback_suggestions = [
+            f"Test method return values and object states in {file_name}",
+            f"Verify exception handling and error scenarios in {file_name}",
+            f"Test input validation and parameter checking in {file_name}",
+            f"Validate class initialization and constructor behavior in {file_name}",
+            f"Test integration with external services and dependencies in {file_name}"
+        ]
+    elif framework == 'selenium':
+        fallback_suggestions = [
+            f"Test web element interactions and page navigation for {file_name}",
+            f"Verify form submissions and input validations for {file_name}",
+            f"Test dynamic content loading and AJAX operations for {file_name}",
+            f"Validate cross-browser compatibility for {file_name}",
+            f"Test responsive design and mobile compatibility for {file_name}"
+        ]
+    else:
+        # Universal fallback that works for ANY file type
+        fallback_suggestions = [
+            f"Test core functionality and expected behavior in {file_name}",
+            f"Verify error handling and exception scenarios in {file_name}",
+            f"Test input validation and data processing in {file_name}",
+            f"Validate edge cases and boundary conditions in {file_name}",
+            f"Test performance and resource usage in {file_name}"
+        ]
+    
+    return [
+        {"id": i, "summary": summary, "framework": framework}
+        for i, summary in enumerate(fallback_suggestions, 1)
+    ]
+
+def get_llm_client_key(request: Request) -> str:
+    """Fair-queuing key for AI calls: the session, or the client IP in direct mode"""
+    session_token = get_session_token(request)
+    if session_token:
+        return f"session:{get_token_scope(session_token)}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+async def get_github_token_from_session(session_token: str) -> Optional[str]:
     """Get GitHub token from session"""
-    if session_token in sessions:
-        return sessions[session_token].get("github_token")
+    session_data = await session_store.get(session_token)
+    if session_data:
+        return session_data.get("github_token")
     return None
 
 async def github_api_request(endpoint: str, token: str, method: str = "GET", data: dict = None):
     """Make authenticated request to GitHub API"""
     return await make_github_request(endpoint, token, method, data)
 
+async def fetch_file_content_oauth(owner: str, repo: str, file_path: str, token: str) -> Optional[str]:
+    """Fetch file content with the session's GitHub token (None if it can't be decoded)"""
+    blob_sha = lookup_blob_sha(owner, repo, file_path, token)
+    if blob_sha:
+        cached_content = blob_cache.get(blob_sha)
+        if cached_content is not None:
+            return cached_content
+        file_data = await github_api_request(f"/repos/{owner}/{repo}/git/blobs/{blob_sha}", token)
+    else:
+        file_data = await github_api_request(f"/repos/{owner}/{repo}/contents/{file_path}", token)
+    
+    if file_data.get("encoding") == "base64":
+        content = decode_github_content(file_data["content"])
+        blob_cache.put(file_data.get("sha"), content)
+        return content
+    return None
+
 def detect_test_framework(file_path: str, language: str = None) -> str:
     """Detect appropriate test framework based on file extension and language"""
     config = get_language_config(file_path)
     return config['framework']
 
-def is_code_file(file_path: str) -> bool:
-    """Check if file is a code file we want to analyze"""
-    return is_supported_file(file_path) and not should_exclude_file(file_path)
-
 # Authentication endpoints
 @app.get("/auth/github")
 async def github_login():
@@ -386,28 +568,28 @@ async def github_callback(request_data: AuthCallbackRequest):
         }
         
         print("📡 Exchanging code for token...")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://github.com/login/oauth/access_token",
-                data=token_data,
-                headers={"Accept": "application/json"}
-            )
-            
-            print(f"GitHub token response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"❌ GitHub token exchange failed: {response.text}")
-                raise HTTPException(status_code=400, detail=f"Failed to exchange code for token: {response.text}")
-            
-            token_response = response.json()
-            print(f"Token response keys: {list(token_response.keys())}")
-            
-            github_token = token_response.get("access_token")
-            
-            if not github_token:
-                error_description = token_response.get("error_description", "No access token received")
-                print(f"❌ No access token: {error_description}")
-                raise HTTPException(status_code=400, detail=f"GitHub OAuth error: {error_description}")
+        client = get_client("github_oauth")
+        response = await client.post(
+            "https://github.com/login/oauth/access_token",
+            data=token_data,
+            headers={"Accept": "application/json"}
+        )
+        
+        print(f"GitHub token response status: {response.status_code}")
+        
+        if response.status_code != 200:
+            print(f"❌ GitHub token exchange failed: {response.text}")
+            raise HTTPException(status_code=400, detail=f"Failed to exchange code for token: {response.text}")
+        
+        token_response = response.json()
+        print(f"Token response keys: {list(token_response.keys())}")
+        
+        github_token = token_response.get("access_token")
+        
+        if not github_token:
+            error_description = token_response.get("error_description", "No access token received")
+            print(f"❌ No access token: {error_description}")
+            raise HTTPException(status_code=400, detail=f"GitHub OAuth error: {error_description}")
         
         print("👤 Getting user info...")
         # Get user info
@@ -415,20 +597,16 @@ async def github_callback(request_data: AuthCallbackRequest):
         print(f"✅ User authenticated: {user_info.get('login')}")
         
         # Create session
-        import time
         session_token = secrets.token_urlsafe(32)
-        sessions[session_token] = {
+        await session_store.set(session_token, {
             "github_token": github_token,
             "user": user_info,
             "created_at": time.time(),
             "last_accessed": time.time()
-        }
+        })
         
         print(f"✅ Created new session for user: {user_info['login']}")
-        print(f"📊 Total active sessions: {len(sessions)}")
-        
-        # Cleanup old sessions
-        cleanup_sessions()
+        print(f"📊 Total active sessions: {await session_store.count()}")
         
         return {
             "session_token": session_token,
@@ -453,12 +631,13 @@ async def get_current_user(request: Request):
     if not session_token:
         raise HTTPException(status_code=401, detail="No session token provided")
     
-    if session_token not in sessions:
+    session_data = await session_store.get(session_token)
+    if not session_data:
         print(f"❌ Session token not found in sessions: {session_token[:10]}...")
-        print(f"📊 Current sessions count: {len(sessions)}")
+        print(f"📊 Current sessions count: {await session_store.count()}")
         raise HTTPException(status_code=401, detail="Session expired or invalid")
     
-    user_info = sessions[session_token]["user"]
+    user_info = session_data["user"]
     print(f"✅ Session validated for user: {user_info['login']}")
     
     return {
@@ -471,11 +650,11 @@ async def get_current_user(request: Request):
 async def logout(request: Request):
     """Logout user"""
     session_token = get_session_token(request)
-    if session_token and session_token in sessions:
-        user_login = sessions[session_token]["user"]["login"]
-        del sessions[session_token]
+    session_data = await session_store.delete(session_token) if session_token else None
+    if session_data:
+        user_login = session_data["user"]["login"]
         print(f"🚪 User logged out: {user_login}")
-        print(f"📊 Remaining sessions: {len(sessions)}")
+        print(f"📊 Remaining sessions: {await session_store.count()}")
     return {"message": "Logged out successfully"}
 
 # Repository endpoints
@@ -486,7 +665,7 @@ async def get_repositories(request: Request) -> List[Repository]:
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         raise HTTPException(status_code=401, detail="GitHub token not found")
     
@@ -513,15 +692,15 @@ async def get_repository_files(owner: str, repo: str, request: Request) -> List[
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         raise HTTPException(status_code=401, detail="GitHub token not found")
     
-    # Get repository tree
-    tree_data = await github_api_request(f"/repos/{owner}/{repo}/git/trees/HEAD?recursive=1", github_token)
+    # Get repository tree (cached per commit)
+    tree_items = await get_repo_tree(owner, repo, github_token)
     
     files = []
-    for item in tree_data.get("tree", []):
+    for item in tree_items:
         if item["type"] == "blob" and is_code_file(item["path"]):
             files.append(FileItem(
                 path=item["path"],
@@ -540,15 +719,12 @@ async def get_file_content(owner: str, repo: str, file_path: str, request: Reque
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         raise HTTPException(status_code=401, detail="GitHub token not found")
     
-    file_data = await github_api_request(f"/repos/{owner}/{repo}/contents/{file_path}", github_token)
-    
-    if file_data.get("encoding") == "base64":
-        import base64
-        content = base64.b64decode(file_data["content"]).decode("utf-8")
+    content = await fetch_file_content_oauth(owner, repo, file_path, github_token)
+    if content is not None:
         return {"content": content, "path": file_path}
     
     raise HTTPException(status_code=400, detail="Unable to decode file content")
@@ -623,6 +799,25 @@ async def analyze_repository_direct(request_data: DirectRepoRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to analyze repository: {str(e)}")
 
+@app.post("/repo/profile")
+async def get_repository_profile(request_data: DirectRepoRequest):
+    """Get the project profile (languages, framework indicators, test layout) of a repository"""
+    try:
+        owner, repo = parse_github_url(request_data.repo_url)
+        token = get_github_token()
+        
+        profile = await get_repo_profile(owner, repo, token)
+        
+        return {
+            "repository": f"{owner}/{repo}",
+            **profile.model_dump()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build repository profile: {str(e)}")
+
 @app.post("/repo/generate-suggestions")
 async def generate_suggestions_direct(request_data: DirectTestRequest):
     """Generate test suggestions directly from repo URL"""
@@ -633,11 +828,15 @@ async def generate_suggestions_direct(request_data: DirectTestRequest):
         owner, repo = parse_github_url(request_data.repo_url)
         token = get_github_token()
         
-        # Fetch file contents
-        file_contents = []
-        for file_path in request_data.files:
-            content = await fetch_file_content(owner, repo, file_path, token)
-            file_contents.append(f"File: {file_path}\n```\n{content}\n```")
+        # Fetch file contents (whole tarball when many files are requested)
+        await prefetch_repo_files(owner, repo, request_data.files, token)
+        contents = await fetch_files_batched(
+            owner, repo, request_data.files, token,
+            lambda file_path: fetch_file_content(owner, repo, file_path, token)
+        )
+        # Pack for the tightest model the tier may route to (hedging and failover included)
+        model, budget = get_packing_model(request_data.quality_tier)
+        file_contents, token_usage = pack_file_contents(request_data.files, contents, model, budget)
         
         # Detect framework if not specified using enhanced detection
         if request_data.framework:
@@ -737,9 +936,20 @@ Generate 3-5 meaningful test case suggestions focusing on:
             {"role": "system", "content": system_message},
             {"role": "user", "content": user_message}
         ]
+        finalize_token_usage(token_usage, messages, model)
         
-        # Call AI API
-        ai_response = await call_openrouter_api(messages)
+        # Call AI API; while it is unavailable (open circuit, upstream errors) the fallback suggestions below are served
+        ai_unavailable = None
+        try:
+            ai_response = await call_openrouter_api(
+                messages, use_cache=not request_data.bypass_cache, quality_tier=request_data.quality_tier
+            )
+        except HTTPException as e:
+            if e.status_code in (400, 429):
+                raise
+            print(f"⚠️ AI unavailable, serving fallback suggestions: {e.detail}")
+            ai_unavailable = e.detail
+            ai_response = ""
         
         # Parse response into suggestions
         suggestions = []
@@ -773,61 +983,7 @@ Generate 3-5 meaningful test case suggestions focusing on:
         if len(suggestions) == 0:
             print("🔄 No suggestions parsed, generating GUARANTEED fallback suggestions...")
             
-            # Get file info for better suggestions
-            first_file = request_data.files[0] if request_data.files else "code_file"
-            file_name = first_file.split('/')[-1] if '/' in first_file else first_file
-            file_ext = file_name.split('.')[-1].lower() if '.' in file_name else 'code'
-            
-            # GUARANTEED Framework-specific fallback suggestions
-            if framework == 'pytest' or file_ext == 'py':
-                fallback_suggestions = [
-                    f"Verify that functions in {file_name} return correct data types and values",
-                    f"Test error handling and exception scenarios in {file_name}",
-                    f"Validate input parameters and boundary conditions in {file_name}",
-                    f"Test function behavior with None, empty, and invalid inputs in {file_name}",
-                    f"Verify integration points and external dependencies in {file_name}"
-                ]
-            elif framework == 'jest' or file_ext in ['js', 'jsx', 'ts', 'tsx']:
-                fallback_suggestions = [
-                    f"Test component rendering and prop validation in {file_name}",
-                    f"Verify user interactions and event handling in {file_name}",
-                    f"Test state management and component updates in {file_name}",
-                    f"Validate API calls and async operations in {file_name}",
-                    f"Test error boundaries and error handling in {file_name}"
-                ]
-            elif framework == 'junit' or file_ext == 'java':
-                fallback_suggestions = [
-                    f"Test method return values and object states in {file_name}",
-                    f"Verify exception handling and error scenarios in {file_name}",
-                    f"Test input validation and parameter checking in {file_name}",
-                    f"Validate class initialization and constructor behavior in {file_name}",
-                    f"Test integration with external services and dependencies in {file_name}"
-                ]
-            elif framework == 'selenium':
-                fallback_suggestions = [
-                    f"Test web element interactions and page navigation for {file_name}",
-                    f"Verify form submissions and input validations for {file_name}",
-                    f"Test dynamic content loading and AJAX operations for {file_name}",
-                    f"Validate cross-browser compatibility for {file_name}",
-                    f"Test responsive design and mobile compatibility for {file_name}"
-                ]
-            else:
-                # Universal fallback that works for ANY file type
-                fallback_suggestions = [
-                    f"Test core functionality and expected behavior in {file_name}",
-                    f"Verify error handling and exception scenarios in {file_name}",
-                    f"Test input validation and data processing in {file_name}",
-                    f"Validate edge cases and boundary conditions in {file_name}",
-                    f"Test performance and resource usage in {file_name}"
-                ]
-            
-            # FORCE creation of suggestions - this CANNOT fail
-            for i, summary in enumerate(fallback_suggestions, 1):
-                suggestions.append({
-                    "id": i,
-                    "summary": summary,
-                    "framework": framework
-                })
+            suggestions.extend(build_fallback_suggestions(request_data.files, framework))
             
             print(f"✅ GUARANTEED: Generated {len(suggestions)} fallback suggestions")
         
@@ -850,47 +1006,134 @@ Generate 3-5 meaningful test case suggestions focusing on:
             
             print(f"🚨 EMERGENCY: Generated {len(suggestions)} basic suggestions")
         
-        return {
+        response = {
             "repository": f"{owner}/{repo}",
             "framework": framework,
             "suggestions": suggestions,
-            "files_analyzed": request_data.files
+            "files_analyzed": request_data.files,
+            "token_usage": token_usage,
+            "ai_unavailable": ai_unavailable
         }
+        if request_data.speculative and not ai_unavailable:
+            response["speculative_suggestion_ids"] = start_speculative_generation(request_data, suggestions)
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate suggestions: {str(e)}")
 
-@app.post("/repo/generate-code")
-async def generate_code_direct(request_data: DirectCodeRequest):
-    """Generate test code directly from repo URL"""
-    try:
-        owner, repo = parse_github_url(request_data.repo_url)
-        token = get_github_token()
-        
-        # Fetch file contents
-        file_contents = []
-        for file_path in request_data.files:
-            content = await fetch_file_content(owner, repo, file_path, token)
-            file_contents.append(f"File: {file_path}\n```\n{content}\n```")
-        
-        # Detect framework and language using enhanced detection
-        if request_data.framework:
-            framework = request_data.framework
-        else:
-            framework = await detect_framework_from_project_structure(owner, repo, request_data.files[0], token)
-            print(f"🔧 Enhanced framework detection for code generation: {framework}")
-        
-        # Detect primary language
-        first_file = request_data.files[0]
-        primary_language = detect_language_from_extension(first_file)
-        
-        # Get framework configuration for imports
-        framework_config = get_framework_config(framework)
-        framework_imports = framework_config.get('imports', {}).get(primary_language, [])
-        
-        # Create framework-specific AI prompt for code generation
-        if framework == 'selenium':
-            system_message = f"""You are a Senior QA Engineer writing Selenium automation test code using {primary_language}. 
+def get_requested_suggestions(request_data) -> List[SuggestionItem]:
+    """The request's suggestion followed by any batch-mode suggestions (duplicates removed)"""
+    suggestions = [SuggestionItem(suggestion_id=request_data.suggestion_id, suggestion_summary=request_data.suggestion_summary)]
+    seen_ids = {request_data.suggestion_id}
+    for suggestion in request_data.additional_suggestions:
+        if suggestion.suggestion_id not in seen_ids:
+            seen_ids.add(suggestion.suggestion_id)
+            suggestions.append(suggestion)
+    return suggestions
+
+def describe_requested_test_cases(suggestions: List[SuggestionItem]) -> str:
+    """Opening line of the code generation prompt"""
+    if len(suggestions) == 1:
+        return f'Write complete test code for this test case: "{suggestions[0].suggestion_summary}"'
+    test_cases = "\n".join(f'- TEST {s.suggestion_id}: "{s.suggestion_summary}"' for s in suggestions)
+    return f"Write complete test code for each of these test cases, as separate test files:\n{test_cases}"
+
+def batch_format_instructions(suggestions: List[SuggestionItem], language: Optional[str]) -> str:
+    """Output format for batch mode, so the completion can be split per test case"""
+    if len(suggestions) == 1:
+        return ""
+    return f"""
+
+Write one complete, independent test file per test case. Start each file with a line containing only its marker, followed by the code in one fenced block:
+
+### TEST {suggestions[0].suggestion_id}
+```{language or ''}
+<test code>
+```
+
+Use the markers {', '.join(f'### TEST {s.suggestion_id}' for s in suggestions)} in this order."""
+
+def describe_batch_files(suggestions: List[SuggestionItem], suggested_filename: str) -> List[Dict[str, Any]]:
+    """Per-suggestion filenames for batch mode (test_app.py -> test_app_3.py, app.spec.ts -> app_3.spec.ts, Makefile -> Makefile_3)"""
+    # Split at the first dot so compound extensions (.spec.ts) stay intact for test runners
+    name, dot, extension = suggested_filename.partition('.')
+    return [
+        {
+            "suggestion_id": suggestion.suggestion_id,
+            "suggestion_summary": suggestion.suggestion_summary,
+            "suggested_filename": f"{name}_{suggestion.suggestion_id}{dot}{extension}"
+        }
+        for suggestion in suggestions
+    ]
+
+def get_code_max_tokens_for(file_count: int) -> int:
+    """Completion budget: one test file's worth per requested suggestion"""
+    return min(CODE_MAX_TOKENS_PER_FILE * max(file_count, 1), BATCH_CODE_MAX_TOKENS)
+
+def get_code_max_tokens(metadata: Dict[str, Any]) -> int:
+    """Completion budget of a prepared code generation prompt"""
+    return get_code_max_tokens_for(len(metadata.get("batch", [])))
+
+def get_packing_model(quality_tier: Optional[str], max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Model whose tokenizer and input budget a prompt is packed for: the tightest
+    of the tier, since the router may hedge or fail over to any of its models
+    """
+    return get_tightest_budget(model_router.rank(quality_tier), max_tokens)
+
+def split_batch_test_code(test_code: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the code generation result, splitting batch completions into one test file per suggestion"""
+    batch = metadata.pop("batch", None)
+    if not batch:
+        return {"test_code": test_code, **metadata}
+    
+    codes = split_batch_code_response(test_code, [item["suggestion_id"] for item in batch])
+    test_files = [
+        {**item, "test_code": codes[item["suggestion_id"]] or "", "status": "generated" if codes[item["suggestion_id"]] else "missing"}
+        for item in batch
+    ]
+    missing = [item["suggestion_id"] for item in test_files if item["status"] == "missing"]
+    if missing:
+        print(f"⚠️ Batch completion had no test file for suggestions {missing}")
+    
+    return {"test_code": test_files[0]["test_code"], "test_files": test_files, **metadata}
+
+async def prepare_direct_code_generation(request_data: DirectCodeRequest) -> Tuple[List[dict], Dict[str, Any]]:
+    """Fetch source files, detect the framework and build the code generation prompt (direct mode)"""
+    owner, repo = parse_github_url(request_data.repo_url)
+    token = get_github_token()
+    
+    # Fetch file contents (whole tarball when many files are requested)
+    await prefetch_repo_files(owner, repo, request_data.files, token)
+    contents = await fetch_files_batched(
+        owner, repo, request_data.files, token,
+        lambda file_path: fetch_file_content(owner, repo, file_path, token)
+    )
+    # Pack for the tightest model the tier may route to, leaving room for every requested test file
+    suggestions = get_requested_suggestions(request_data)
+    model, budget = get_packing_model(request_data.quality_tier, get_code_max_tokens_for(len(suggestions)))
+    file_contents, token_usage = pack_file_contents(request_data.files, contents, model, budget)
+    
+    # Detect framework and language using enhanced detection
+    if request_data.framework:
+        framework = request_data.framework
+    else:
+        framework = await detect_framework_from_project_structure(owner, repo, request_data.files[0], token)
+        print(f"🔧 Enhanced framework detection for code generation: {framework}")
+    
+    # Detect primary language
+    first_file = request_data.files[0]
+    primary_language = detect_language_from_extension(first_file)
+    
+    # Get framework configuration for imports
+    framework_config = get_framework_config(framework)
+    framework_imports = framework_config.get('imports', {}).get(primary_language, [])
+    
+    # Create framework-specific AI prompt for code generation
+    if framework == 'selenium':
+        system_message = f"""You are a Senior QA Engineer writing Selenium automation test code using {primary_language}. 
 
 Rules:
 1. Write complete, runnable Selenium test code
@@ -904,8 +1147,8 @@ Rules:
 9. Return ONLY the test code, no explanations
 
 The code should be production-ready Selenium automation code."""
-        elif framework in ['cypress', 'playwright']:
-            system_message = f"""You are a Senior QA Engineer writing {framework} E2E test code using {primary_language}. 
+    elif framework in ['cypress', 'playwright']:
+        system_message = f"""You are a Senior QA Engineer writing {framework} E2E test code using {primary_language}. 
 
 Rules:
 1. Write complete, runnable {framework} test code
@@ -918,8 +1161,8 @@ Rules:
 8. Return ONLY the test code, no explanations
 
 The code should be production-ready {framework} automation code."""
-        else:
-            system_message = f"""You are a Senior QA Engineer writing test code using {framework}. 
+    else:
+        system_message = f"""You are a Senior QA Engineer writing test code using {framework}. 
 
 Rules:
 1. Write complete, runnable test code
@@ -932,7 +1175,7 @@ Rules:
 
 The code should be production-ready and follow industry standards."""
 
-        user_message = f"""Write complete test code for this test case: "{request_data.suggestion_summary}"
+    user_message = f"""{describe_requested_test_cases(suggestions)}
 
 Source code to test:
 {chr(10).join(file_contents)}
@@ -945,78 +1188,398 @@ Generate a complete test file with:
 - Test class/function structure
 - Meaningful test method names
 - Appropriate assertions
-- Any necessary mocks or fixtures"""
+- Any necessary mocks or fixtures{batch_format_instructions(suggestions, primary_language)}"""
 
-        messages = [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_message}
-        ]
-        
-        # Call AI API
-        test_code = await call_openrouter_api(messages)
-        
-        # Generate suggested filename
-        base_name = request_data.files[0].split('/')[-1].split('.')[0]
-        ext_map = {
-            "pytest": "py",
-            "selenium": "py",
-            "jest": "js" if primary_language == "javascript" else "ts",
-            "cypress": "js",
-            "playwright": "js" if primary_language == "javascript" else "ts",
-            "junit": "java",
-            "testing": "go",
-            "rspec": "rb"
-        }
-        ext = ext_map.get(framework, "py")
-        
-        if framework == 'selenium':
-            suggested_filename = f"test_{base_name}_selenium.{ext}"
-        elif framework in ['cypress', 'playwright']:
-            suggested_filename = f"{base_name}.spec.{ext}"
-        else:
-            suggested_filename = f"test_{base_name}.{ext}"
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": user_message}
+    ]
+    finalize_token_usage(token_usage, messages, model)
+    
+    # Generate suggested filename
+    base_name = request_data.files[0].split('/')[-1].split('.')[0]
+    ext_map = {
+        "pytest": "py",
+        "selenium": "py",
+        "jest": "js" if primary_language == "javascript" else "ts",
+        "cypress": "js",
+        "playwright": "js" if primary_language == "javascript" else "ts",
+        "junit": "java",
+        "testing": "go",
+        "rspec": "rb"
+    }
+    ext = ext_map.get(framework, "py")
+    
+    if framework == 'selenium':
+        suggested_filename = f"test_{base_name}_selenium.{ext}"
+    elif framework in ['cypress', 'playwright']:
+        suggested_filename = f"{base_name}.spec.{ext}"
+    else:
+        suggested_filename = f"test_{base_name}.{ext}"
+    
+    metadata = {
+        "repository": f"{owner}/{repo}",
+        "suggested_filename": suggested_filename,
+        "framework": framework,
+        "language": primary_language,
+        "files_analyzed": request_data.files,
+        "token_usage": token_usage
+    }
+    if len(suggestions) > 1:
+        metadata["batch"] = describe_batch_files(suggestions, suggested_filename)
+    
+    return messages, metadata
+
+async def generate_direct_code(request_data: DirectCodeRequest) -> Dict[str, Any]:
+    """Build the prompt, call the AI and split batch results (direct mode)"""
+    messages, metadata = await prepare_direct_code_generation(request_data)
+    
+    # Call AI API (one completion for all suggestions in batch mode)
+    test_code = await call_openrouter_api(
+        messages, use_cache=not request_data.bypass_cache, max_tokens=get_code_max_tokens(metadata),
+        quality_tier=request_data.quality_tier
+    )
+    
+    return split_batch_test_code(test_code, metadata)
+
+def get_speculative_key(request_data: DirectCodeRequest) -> Optional[str]:
+    """Key of a speculatively generated result for this request (None when speculation does not apply)"""
+    if request_data.bypass_cache or request_data.additional_suggestions:
+        return None
+    owner, repo = parse_github_url(request_data.repo_url)
+    return make_speculative_key(
+        owner, repo, request_data.files, request_data.framework,
+        request_data.suggestion_id, request_data.suggestion_summary, request_data.quality_tier
+    )
+
+def start_speculative_generation(request_data: DirectTestRequest, suggestions: List[Dict[str, Any]]) -> List[int]:
+    """Generate test code for the top suggestions in the background; returns the suggestion ids started"""
+    started = []
+    for suggestion in suggestions[:SPECULATIVE_TOP_K]:
+        code_request = DirectCodeRequest(
+            repo_url=request_data.repo_url,
+            suggestion_id=suggestion["id"],
+            suggestion_summary=suggestion["summary"],
+            files=request_data.files,
+            framework=request_data.framework,
+            quality_tier=request_data.quality_tier
+        )
+        if speculative_generator.start(get_speculative_key(code_request), lambda code_request=code_request: generate_direct_code(code_request)):
+            started.append(suggestion["id"])
+    if started:
+        print(f"🔮 Speculatively generating test code for suggestions {started}")
+    return started
+
+async def stream_speculative_code_events(speculative_key: str, request_data: DirectCodeRequest) -> AsyncIterator[str]:
+    """Server-sent events for a speculatively generated result (generates live if speculation failed)"""
+    result = await speculative_generator.get(speculative_key)
+    if result is None:
+        try:
+            messages, metadata = await prepare_direct_code_generation(request_data)
+        except Exception as e:
+            yield format_sse_event("error", {"detail": f"Failed to generate test code: {getattr(e, 'detail', str(e))}"})
+            return
+        async for event in stream_code_generation_events(
+            messages, metadata, use_cache=not request_data.bypass_cache, quality_tier=request_data.quality_tier
+        ):
+            yield event
+        return
+    
+    yield format_sse_event("start", {k: v for k, v in result.items() if k not in ("test_code", "test_files")})
+    yield format_sse_event("token", {"content": result["test_code"]})
+    yield format_sse_event("done", {**result, "speculative": True})
+
+@app.post("/repo/generate-code")
+async def generate_code_direct(request_data: DirectCodeRequest):
+    """Generate test code directly from repo URL"""
+    try:
+        # Return a speculatively generated result (or wait for the one in flight)
+        speculative_key = get_speculative_key(request_data)
+        if speculative_key:
+            result = await speculative_generator.get(speculative_key)
+            if result is not None:
+                return {**result, "speculative": True}
         
-        return {
-            "repository": f"{owner}/{repo}",
-            "test_code": test_code,
-            "suggested_filename": suggested_filename,
-            "framework": framework,
-            "language": primary_language,
-            "files_analyzed": request_data.files
-        }
+        return await generate_direct_code(request_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate test code: {str(e)}")
 
+@app.post("/repo/generate-code/stream")
+async def generate_code_direct_stream(request_data: DirectCodeRequest):
+    """Stream generated test code as server-sent events (direct mode)"""
+    speculative_key = get_speculative_key(request_data)
+    if speculative_key and speculative_generator.has(speculative_key):
+        return sse_response(stream_speculative_code_events(speculative_key, request_data))
+    
+    try:
+        messages, metadata = await prepare_direct_code_generation(request_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate test code: {str(e)}")
+    
+    # Reject unknown tiers (400) and full AI queues (429) before the stream starts
+    model_router.rank(request_data.quality_tier)
+    llm_limiter.check_admission()
+    return sse_response(stream_code_generation_events(
+        messages, metadata, use_cache=not request_data.bypass_cache, quality_tier=request_data.quality_tier
+    ))
+
+async def generate_batch_file(job: Dict[str, Any], file_path: str) -> Dict[str, Any]:
+    """Generate a test file for one source file of a batch job"""
+    # Large jobs read the whole repository from one tarball (once per commit)
+    owner, repo = parse_github_url(job["repo_url"])
+    await prefetch_repo_files(owner, repo, [f["path"] for f in job["files"]], get_github_token())
+    
+    code_request = DirectCodeRequest(
+        repo_url=job["repo_url"],
+        suggestion_id=0,
+        suggestion_summary=f"Comprehensive unit tests for {file_path}",
+        files=[file_path],
+        framework=job["framework"]
+    )
+    messages, metadata = await prepare_direct_code_generation(code_request)
+    # Each job queues for AI calls on its own, next to interactive clients
+    with llm_client(f"batch:{job['id']}"):
+        test_code = await call_openrouter_api(messages)
+    return {"test_code": test_code, **metadata}
+
+@app.post("/repo/batch-jobs")
+async def create_batch_job(request_data: BatchJobRequest):
+    """Start generating tests for every eligible file of a repository in the background"""
+    try:
+        owner, repo = parse_github_url(request_data.repo_url)
+        token = get_github_token()
+        code_files = await fetch_github_repo_files(owner, repo, token)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list repository files: {str(e)}")
+    
+    file_paths = [
+        f["path"] for f in code_files
+        if not request_data.file_filter or fnmatch.fnmatch(f["path"], request_data.file_filter)
+    ]
+    if not file_paths:
+        raise HTTPException(status_code=400, detail="No eligible files match the filter")
+    
+    max_files = min(request_data.max_files, BATCH_MAX_FILES_PER_JOB)
+    file_paths = file_paths[:max_files]
+    
+    job_id = batch_jobs.submit(request_data.repo_url, request_data.framework, request_data.file_filter, file_paths)
+    print(f"📦 Batch job {job_id} started for {owner}/{repo} ({len(file_paths)} files)")
+    
+    return {"job_id": job_id, "status": "queued", "total_files": len(file_paths)}
+
+@app.get("/repo/batch-jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Poll a batch job's progress and per-file results"""
+    job = batch_jobs.store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@app.get("/repo/batch-jobs/{job_id}/events")
+async def stream_batch_job_events(job_id: str):
+    """Stream a batch job's progress as server-sent events"""
+    if batch_jobs.store.get_job(job_id, include_results=False) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    async def events():
+        async for event, data in batch_jobs.events(job_id):
+            yield format_sse_event(event, data)
+    
+    return sse_response(events())
+
+@app.delete("/repo/batch-jobs/{job_id}")
+async def cancel_batch_job(job_id: str):
+    """Cancel a running batch job"""
+    if batch_jobs.store.get_job(job_id, include_results=False) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    if not batch_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Batch job is not running")
+    return {"job_id": job_id, "status": "cancelled"}
+
 # AI Integration endpoints
-async def call_openrouter_api(messages: List[dict], model: str = "mistralai/mistral-7b-instruct") -> str:
-    """Call OpenRouter API for AI generation"""
-    headers = {
+def get_openrouter_headers() -> Dict[str, str]:
+    """Get request headers for the OpenRouter API"""
+    return {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
         "HTTP-Referer": "http://localhost:8000",
         "X-Title": "Test Case Generator"
     }
+
+async def call_openrouter_api(messages: List[dict], model: Optional[str] = None, use_cache: bool = True, max_tokens: int = 2000, quality_tier: Optional[str] = None) -> str:
+    """Call OpenRouter API for AI generation (routed across the quality tier's models unless a model is given; identical prompts are served from the completion cache)"""
+    headers = get_openrouter_headers()
     
     payload = {
         "model": model,
         "messages": messages,
-        "max_tokens": 2000,
+        "max_tokens": max_tokens,
         "temperature": 0.7
     }
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload
+    # Routed requests are cached per tier, whichever model answered
+    model_key = model or f"tier:{quality_tier or DEFAULT_MODEL_TIER}"
+    cache_key = make_completion_key(model_key, messages, payload["temperature"], payload["max_tokens"])
+    if use_cache:
+        cached_response = completion_cache.get(cache_key)
+        if cached_response is not None:
+            print(f"⚡ Completion cache hit for {model_key}")
+            return cached_response
+    else:
+        completion_cache.bypassed += 1
+    
+    if model:
+        send = lambda: model_router.observe(model, lambda name: request_openrouter_completion(headers, payload))
+    else:
+        send = lambda: model_router.complete(
+            lambda name: request_openrouter_completion(headers, {**payload, "model": name}), quality_tier
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.text}")
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+    
+    # Identical prompts already in flight share one upstream call
+    content = await openrouter_flight.do(cache_key if use_cache else None, send)
+    if content and content.strip():
+        completion_cache.set(cache_key, content)
+    return content
+
+def openrouter_transport_error(error: httpx.RequestError) -> HTTPException:
+    """Report an OpenRouter connection failure or timeout like any other upstream error"""
+    if isinstance(error, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="OpenRouter API request timed out")
+    return HTTPException(status_code=502, detail=f"OpenRouter API request failed: {type(error).__name__}")
+
+async def request_openrouter_completion(headers: Dict[str, str], payload: Dict[str, Any]) -> str:
+    """Send one chat completion request to OpenRouter"""
+    client = get_client("openrouter")
+    async with llm_limiter.slot():
+        try:
+            response = await openrouter_breaker.call(
+                lambda: client.post(
+                    "https://openrouter.ai/api/v1/chat/completions",
+                    headers=headers,
+                    json=payload
+                ),
+                is_upstream_failure
+            )
+        except httpx.RequestError as e:
+            # The breaker has already counted the failure
+            raise openrouter_transport_error(e) from e
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.text}")
+    
+    result = response.json()
+    return result["choices"][0]["message"]["content"]
+
+async def stream_openrouter_api(messages: List[dict], model: Optional[str] = None, use_cache: bool = True, max_tokens: int = 2000, quality_tier: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream completion tokens from OpenRouter (shares the completion cache with call_openrouter_api)"""
+    # Streams are not hedged: they go to the tier's best-ranked model
+    model_key = model or f"tier:{quality_tier or DEFAULT_MODEL_TIER}"
+    model = model or model_router.rank(quality_tier)[0]
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": True
+    }
+    
+    cache_key = make_completion_key(model_key, messages, payload["temperature"], payload["max_tokens"])
+    if use_cache:
+        cached_response = completion_cache.get(cache_key)
+        if cached_response is not None:
+            print(f"⚡ Completion cache hit for {model_key} (stream)")
+            yield cached_response
+            return
+    else:
+        completion_cache.bypassed += 1
+    
+    chunks = []
+    client = get_client("openrouter")
+    started_at = time.monotonic()
+    try:
+        async with llm_limiter.slot():
+            # Streams go through the breaker by hand: the verdict is known once the status arrives
+            openrouter_breaker.before_call()
+            upstream_healthy = None
+            try:
+                async with client.stream(
+                    "POST",
+                    "https://openrouter.ai/api/v1/chat/completions",
+                    headers=get_openrouter_headers(),
+                    json=payload
+                ) as response:
+                    upstream_healthy = not is_upstream_failure(response)
+                    if response.status_code != 200:
+                        error_body = await response.aread()
+                        raise HTTPException(status_code=500, detail=f"OpenRouter API error: {error_body.decode('utf-8', errors='replace')}")
+        
+                    async for line in response.aiter_lines():
+                        # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+                        if not line.startswith("data: "):
+                            continue
+                        data = line[len("data: "):].strip()
+                        if data == "[DONE]":
+                            break
+            
+                        try:
+                            chunk = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+            
+                        if "error" in chunk:
+                            raise HTTPException(status_code=500, detail=f"OpenRouter API error: {chunk['error']}")
+            
+                        choices = chunk.get("choices") or [{}]
+                        token = choices[0].get("delta", {}).get("content")
+                        if token:
+                            chunks.append(token)
+                            yield token
+            except httpx.RequestError as e:
+                upstream_healthy = False
+                raise openrouter_transport_error(e) from e
+            finally:
+                openrouter_breaker.record(upstream_healthy)
+    except Exception as e:
+        model_router.record_error(model, e)
+        raise
+    model_router.record_success(model, time.monotonic() - started_at)
+    
+    content = "".join(chunks)
+    if content.strip():
+        completion_cache.set(cache_key, content)
+
+async def stream_code_generation_events(messages: List[dict], metadata: Dict[str, Any], use_cache: bool = True, quality_tier: Optional[str] = None) -> AsyncIterator[str]:
+    """Server-sent events for code generation: start (metadata), token..., then done or error"""
+    yield format_sse_event("start", metadata)
+    
+    chunks = []
+    try:
+        async for token in stream_openrouter_api(
+            messages, use_cache=use_cache, max_tokens=get_code_max_tokens(metadata), quality_tier=quality_tier
+        ):
+            chunks.append(token)
+            yield format_sse_event("token", {"content": token})
+    except Exception as e:
+        print(f"❌ Streaming code generation failed: {getattr(e, 'detail', str(e))}")
+        yield format_sse_event("error", {"detail": f"Failed to generate test code: {getattr(e, 'detail', str(e))}"})
+        return
+    
+    yield format_sse_event("done", split_batch_test_code("".join(chunks), dict(metadata)))
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap an event iterator in an unbuffered text/event-stream response"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/generate-test-suggestions")
 async def generate_test_suggestions(request_data: GenerateTestRequest, request: Request):
@@ -1025,20 +1588,20 @@ async def generate_test_suggestions(request_data: GenerateTestRequest, request:
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         raise HTTPException(status_code=401, detail="GitHub token not found")
     
-    # Fetch file contents
-    file_contents = []
+    # Fetch file contents (whole tarball when many files are requested)
     owner, repo = request_data.repo_full_name.split("/")
-    
-    for file_path in request_data.files:
-        file_data = await github_api_request(f"/repos/{owner}/{repo}/contents/{file_path}", github_token)
-        if file_data.get("encoding") == "base64":
-            import base64
-            content = base64.b64decode(file_data["content"]).decode("utf-8")
-            file_contents.append(f"File: {file_path}\n```\n{content}\n```")
+    await prefetch_repo_files(owner, repo, request_data.files, github_token)
+    contents = await fetch_files_batched(
+        owner, repo, request_data.files, github_token,
+        lambda file_path: fetch_file_content_oauth(owner, repo, file_path, github_token)
+    )
+    # Pack for the tightest model the tier may route to (hedging and failover included)
+    model, budget = get_packing_model(request_data.quality_tier)
+    file_contents, token_usage = pack_file_contents(request_data.files, contents, model, budget)
     
     # Detect framework and language
     primary_language = None
@@ -1151,31 +1714,21 @@ Generate 3-5 meaningful test case suggestions focusing on:
         {"role": "system", "content": system_message},
         {"role": "user", "content": user_message}
     ]
+    finalize_token_usage(token_usage, messages, model)
     
-    # Call AI API with fallback models
-    ai_response = None
-    models_to_try = [
-        "mistralai/mistral-7b-instruct",
-        "openai/gpt-3.5-turbo",
-        "anthropic/claude-3-haiku",
-        "meta-llama/llama-3-8b-instruct"
-    ]
-    
-    for model in models_to_try:
-        try:
-            print(f"🤖 Trying AI model: {model}")
-            ai_response = await call_openrouter_api(messages, model)
-            if ai_response and len(ai_response.strip()) > 50:
-                print(f"✅ Success with model: {model}")
-                break
-            else:
-                print(f"⚠️ Empty/short response from {model}")
-        except Exception as e:
-            print(f"❌ Error with model {model}: {str(e)}")
-            continue
-    
-    if not ai_response:
-        raise HTTPException(status_code=500, detail="All AI models failed to generate suggestions")
+    # Call AI API (routed across the tier's models, with hedging and failover);
+    # while it is unavailable the fallback suggestions below are served
+    ai_unavailable = None
+    try:
+        ai_response = await call_openrouter_api(
+            messages, use_cache=not request_data.bypass_cache, quality_tier=request_data.quality_tier
+        )
+    except HTTPException as e:
+        if e.status_code in (400, 429):
+            raise
+        print(f"⚠️ All AI models failed, serving fallback suggestions: {e.detail}")
+        ai_unavailable = e.detail
+        ai_response = ""
     
     # Parse response into suggestions with improved logic
     suggestions = []
@@ -1229,61 +1782,9 @@ Generate 3-5 meaningful test case suggestions focusing on:
     if len(suggestions) == 0:
         print("🔄 No suggestions parsed, generating GUARANTEED fallback suggestions...")
         
-        # Get file info for better suggestions
-        first_file = request_data.files[0] if request_data.files else "code_file"
-        file_name = first_file.split('/')[-1] if '/' in first_file else first_file
-        file_ext = file_name.split('.')[-1].lower() if '.' in file_name else 'code'
-        
-        # GUARANTEED Framework-specific fallback suggestions
-        if framework == 'pytest' or file_ext == 'py':
-            fallback_suggestions = [
-                f"Verify that functions in {file_name} return correct data types and values",
-                f"Test error handling and exception scenarios in {file_name}",
-                f"Validate input parameters and boundary conditions in {file_name}",
-                f"Test function behavior with None, empty, and invalid inputs in {file_name}",
-                f"Verify integration points and external dependencies in {file_name}"
-            ]
-        elif framework == 'jest' or file_ext in ['js', 'jsx', 'ts', 'tsx']:
-            fallback_suggestions = [
-                f"Test component rendering and prop validation in {file_name}",
-                f"Verify user interactions and event handling in {file_name}",
-                f"Test state management and component updates in {file_name}",
-                f"Validate API calls and async operations in {file_name}",
-                f"Test error boundaries and error handling in {file_name}"
-            ]
-        elif framework == 'junit' or file_ext == 'java':
-            fallback_suggestions = [
-                f"Test method return values and object states in {file_name}",
-                f"Verify exception handling and error scenarios in {file_name}",
-                f"Test input validation and parameter checking in {file_name}",
-                f"Validate class initialization and constructor behavior in {file_name}",
-                f"Test integration with external services and dependencies in {file_name}"
-            ]
-        elif framework == 'selenium':
-            fallback_suggestions = [
-                f"Test web element interactions and page navigation for {file_name}",
-                f"Verify form submissions and input validations for {file_name}",
-                f"Test dynamic content loading and AJAX operations for {file_name}",
-                f"Validate cross-browser compatibility for {file_name}",
-                f"Test responsive design and mobile compatibility for {file_name}"
-            ]
-        else:
-            # Universal fallback that works for ANY file type
-            fallback_suggestions = [
-                f"Test core functionality and expected behavior in {file_name}",
-                f"Verify error handling and exception scenarios in {file_name}",
-                f"Test input validation and data processing in {file_name}",
-                f"Validate edge cases and boundary conditions in {file_name}",
-                f"Test performance and resource usage in {file_name}"
-            ]
-        
-        # FORCE creation of suggestions - this CANNOT fail
-        for i, summary in enumerate(fallback_suggestions, 1):
-            suggestions.append(TestSuggestion(
-                id=i,
-                summary=summary,
-                framework=framework
-            ))
+        suggestions.extend(
+            TestSuggestion(**suggestion) for suggestion in build_fallback_suggestions(request_data.files, framework)
+        )
         
         print(f"✅ GUARANTEED: Generated {len(suggestions)} fallback suggestions")
     
@@ -1307,10 +1808,11 @@ Generate 3-5 meaningful test case suggestions focusing on:
         print(f"🚨 EMERGENCY: Generated {len(suggestions)} basic suggestions")
     
     # Store suggestions in session for later use
-    if session_token in sessions:
-        sessions[session_token]["last_suggestions"] = suggestions
-        sessions[session_token]["last_files"] = request_data.files
-        sessions[session_token]["last_repo"] = request_data.repo_full_name
+    await session_store.update(session_token, {
+        "last_suggestions": [suggestion.dict() for suggestion in suggestions],
+        "last_files": request_data.files,
+        "last_repo": request_data.repo_full_name
+    })
     
     # Convert to the same format as direct endpoints
     suggestions_dict = []
@@ -1326,30 +1828,24 @@ Generate 3-5 meaningful test case suggestions focusing on:
         "framework": framework,
         "suggestions": suggestions_dict,
         "files_analyzed": request_data.files,
-        "oauth": True
+        "oauth": True,
+        "token_usage": token_usage,
+        "ai_unavailable": ai_unavailable
     }
 
-@app.post("/generate-test-code")
-async def generate_test_code(request_data: GenerateCodeRequest, request: Request):
-    """Generate full test code for a selected suggestion"""
-    session_token = get_session_token(request)
-    if not session_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    github_token = get_github_token_from_session(session_token)
-    if not github_token:
-        raise HTTPException(status_code=401, detail="GitHub token not found")
-    
-    # Fetch file contents
-    file_contents = []
+async def prepare_oauth_code_generation(request_data: GenerateCodeRequest, github_token: str) -> Tuple[List[dict], Dict[str, Any]]:
+    """Fetch source files, detect the framework and build the code generation prompt (OAuth mode)"""
+    # Fetch file contents (whole tarball when many files are requested)
     owner, repo = request_data.repo_full_name.split("/")
-    
-    for file_path in request_data.files:
-        file_data = await github_api_request(f"/repos/{owner}/{repo}/contents/{file_path}", github_token)
-        if file_data.get("encoding") == "base64":
-            import base64
-            content = base64.b64decode(file_data["content"]).decode("utf-8")
-            file_contents.append(f"File: {file_path}\n```\n{content}\n```")
+    await prefetch_repo_files(owner, repo, request_data.files, github_token)
+    contents = await fetch_files_batched(
+        owner, repo, request_data.files, github_token,
+        lambda file_path: fetch_file_content_oauth(owner, repo, file_path, github_token)
+    )
+    # Pack for the tightest model the tier may route to, leaving room for every requested test file
+    suggestions = get_requested_suggestions(request_data)
+    model, budget = get_packing_model(request_data.quality_tier, get_code_max_tokens_for(len(suggestions)))
+    file_contents, token_usage = pack_file_contents(request_data.files, contents, model, budget)
     
     # Detect framework and language
     primary_language = None
@@ -1409,7 +1905,7 @@ Rules:
 
 The code should be production-ready and follow industry standards."""
 
-    user_message = f"""Write complete test code for this test case: "{request_data.suggestion_summary}"
+    user_message = f"""{describe_requested_test_cases(suggestions)}
 
 Source code to test:
 {chr(10).join(file_contents)}
@@ -1422,15 +1918,13 @@ Generate a complete test file with:
 - Test class/function structure
 - Meaningful test method names
 - Appropriate assertions
-- Any necessary mocks or fixtures"""
+- Any necessary mocks or fixtures{batch_format_instructions(suggestions, primary_language)}"""
 
     messages = [
         {"role": "system", "content": system_message},
         {"role": "user", "content": user_message}
     ]
-    
-    # Call AI API
-    test_code = await call_openrouter_api(messages)
+    finalize_token_usage(token_usage, messages, model)
     
     # Generate suggested filename
     base_name = request_data.files[0].split('/')[-1].split('.')[0]
@@ -1444,12 +1938,142 @@ Generate a complete test file with:
     ext = ext_map.get(framework, "py")
     suggested_filename = f"test_{base_name}.{ext}"
     
-    return {
-        "test_code": test_code,
+    metadata = {
         "suggested_filename": suggested_filename,
         "framework": framework,
-        "language": primary_language
+        "language": primary_language,
+        "token_usage": token_usage
+    }
+    if len(suggestions) > 1:
+        metadata["batch"] = describe_batch_files(suggestions, suggested_filename)
+    
+    return messages, metadata
+
+@app.post("/generate-test-code")
+async def generate_test_code(request_data: GenerateCodeRequest, request: Request):
+    """Generate full test code for a selected suggestion"""
+    session_token = get_session_token(request)
+    if not session_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    github_token = await get_github_token_from_session(session_token)
+    if not github_token:
+        raise HTTPException(status_code=401, detail="GitHub token not found")
+    
+    messages, metadata = await prepare_oauth_code_generation(request_data, github_token)
+    
+    # Call AI API (one completion for all suggestions in batch mode)
+    test_code = await call_openrouter_api(
+        messages, use_cache=not request_data.bypass_cache, max_tokens=get_code_max_tokens(metadata),
+        quality_tier=request_data.quality_tier
+    )
+    
+    return split_batch_test_code(test_code, metadata)
+
+@app.post("/generate-test-code/stream")
+async def generate_test_code_stream(request_data: GenerateCodeRequest, request: Request):
+    """Stream generated test code as server-sent events (OAuth mode)"""
+    session_token = get_session_token(request)
+    if not session_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    github_token = await get_github_token_from_session(session_token)
+    if not github_token:
+        raise HTTPException(status_code=401, detail="GitHub token not found")
+    
+    messages, metadata = await prepare_oauth_code_generation(request_data, github_token)
+    
+    # Reject unknown tiers (400) and full AI queues (429) before the stream starts
+    model_router.rank(request_data.quality_tier)
+    llm_limiter.check_admission()
+    return sse_response(stream_code_generation_events(
+        messages, metadata, use_cache=not request_data.bypass_cache, quality_tier=request_data.quality_tier
+    ))
+
+# Pull Request helpers
+async def get_pr_repo_info(owner: str, repo: str, github_token: str) -> Dict[str, Any]:
+    """Get repository info, raising 403 unless the user can push to it"""
+    repo_info = await github_api_request(f"/repos/{owner}/{repo}", github_token)
+    if not repo_info.get("permissions", {}).get("push", False):
+        print("❌ User does not have push permissions")
+        raise HTTPException(
+            status_code=403, 
+            detail="You don't have write access to this repository. You need push permissions to create pull requests."
+        )
+    return repo_info
+
+async def create_pr_branch(owner: str, repo: str, github_token: str, branch_name: str, sha: str) -> str:
+    """Create a uniquely named branch at sha and return its name (retries once with a random suffix)"""
+    unique_branch_name = f"{branch_name}-{int(time.time())}"
+    branch_data = {
+        "ref": f"refs/heads/{unique_branch_name}",
+        "sha": sha
     }
+    try:
+        await github_api_request(f"/repos/{owner}/{repo}/git/refs", github_token, "POST", branch_data)
+        print(f"✅ Branch created: {unique_branch_name}")
+    except Exception as branch_error:
+        print(f"❌ Branch creation failed: {str(branch_error)}")
+        # Try with a different name
+        unique_branch_name = f"{branch_name}-{int(time.time())}-{secrets.token_hex(4)}"
+        branch_data["ref"] = f"refs/heads/{unique_branch_name}"
+        try:
+            await github_api_request(f"/repos/{owner}/{repo}/git/refs", github_token, "POST", branch_data)
+            print(f"✅ Branch created with fallback name: {unique_branch_name}")
+        except Exception as fallback_error:
+            print(f"❌ Fallback branch creation also failed: {str(fallback_error)}")
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Failed to create branch. This might be due to naming conflicts or permissions: {str(fallback_error)}"
+            )
+    return unique_branch_name
+
+async def get_pr_base(owner: str, repo: str, github_token: str) -> Dict[str, str]:
+    """Default branch (push access verified) and its latest commit SHA"""
+    repo_info = await get_pr_repo_info(owner, repo, github_token)
+    default_branch = repo_info["default_branch"]
+    branch_info = await github_api_request(f"/repos/{owner}/{repo}/git/refs/heads/{default_branch}", github_token)
+    return {"default_branch": default_branch, "base_sha": branch_info["object"]["sha"]}
+
+async def create_git_object(owner: str, repo: str, github_token: str, kind: str, data: dict) -> str:
+    """Create a git blob, tree or commit and return its SHA"""
+    response = await github_api_request(f"/repos/{owner}/{repo}/git/{kind}", github_token, "POST", data)
+    return response["sha"]
+
+def get_pr_journal_key(request: Request, github_token: str) -> Optional[str]:
+    """Journal key from the Idempotency-Key header, scoped to the GitHub user and endpoint"""
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        return None
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long (max 255 characters)")
+    return f"{get_token_scope(github_token)}:{request.url.path}:{idempotency_key}"
+
+async def timed_step(timings: Dict[str, float], name: str, awaitable: Awaitable[Any]) -> Any:
+    """Await one PR pipeline step, recording its duration in milliseconds"""
+    started_at = time.monotonic()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = round((time.monotonic() - started_at) * 1000, 1)
+
+async def create_pull_request_on_github(owner: str, repo: str, github_token: str, pr_data: dict) -> Dict[str, Any]:
+    """Open the pull request and keep the fields the response needs"""
+    pr_response = await github_api_request(f"/repos/{owner}/{repo}/pulls", github_token, "POST", pr_data)
+    return {"number": pr_response["number"], "html_url": pr_response["html_url"]}
+
+def describe_pr_error(e: Exception) -> str:
+    """Turn a GitHub failure during PR creation into a user-facing message"""
+    error_message = f"{e.status_code}: {e.detail}" if isinstance(e, HTTPException) else str(e)
+    if "403" in error_message or "Forbidden" in error_message:
+        error_message = "Permission denied. You may not have write access to this repository, or the repository may be archived."
+    elif "404" in error_message or "Not Found" in error_message:
+        error_message = "Repository not found or not accessible with your current permissions."
+    elif "422" in error_message or "Unprocessable Entity" in error_message:
+        error_message = "Invalid request data. The branch name might already exist or contain invalid characters."
+    elif "401" in error_message or "Unauthorized" in error_message:
+        error_message = "Authentication failed. Please login again."
+    return error_message
 
 # Pull Request endpoints
 @app.post("/create-pull-request")
@@ -1464,7 +2088,7 @@ async def create_pull_request(request_data: CreatePRRequest, request: Request):
         print("❌ No session token provided")
         raise HTTPException(status_code=401, detail="Not authenticated - please login with GitHub")
     
-    github_token = get_github_token_from_session(session_token)
+    github_token = await get_github_token_from_session(session_token)
     if not github_token:
         print("❌ No GitHub token in session")
         raise HTTPException(status_code=401, detail="GitHub token not found - please login again")
@@ -1476,155 +2100,254 @@ async def create_pull_request(request_data: CreatePRRequest, request: Request):
         print(f"❌ Invalid repository format: {request_data.repo_full_name}")
         raise HTTPException(status_code=400, detail="Invalid repository format. Expected 'owner/repo'")
     
-    try:
-        # 1. Get the default branch and verify repository access
-        print("📡 Step 1: Getting repository info...")
-        repo_info = await github_api_request(f"/repos/{owner}/{repo}", github_token)
-        default_branch = repo_info["default_branch"]
+    # 1. Validate test file name and content (no GitHub call depends on this failing late)
+    if not request_data.test_file_name or not request_data.test_file_name.strip():
+        raise HTTPException(status_code=400, detail="Test file name is required")
+    
+    if not request_data.test_code or not request_data.test_code.strip():
+        raise HTTPException(status_code=400, detail="Test code content is required")
+    
+    # Sanitize file name to prevent path traversal
+    safe_filename = request_data.test_file_name.replace('..', '').replace('/', '_').replace('\\', '_')
+    if safe_filename != request_data.test_file_name:
+        print(f"⚠️ Sanitized filename: {request_data.test_file_name} -> {safe_filename}")
+    
+    timings: Dict[str, float] = {}
+    # Steps already done by an earlier attempt with the same Idempotency-Key are skipped
+    journal_key = get_pr_journal_key(request, github_token)
+    async with pr_journal.run(journal_key, make_request_fingerprint(request_data.dict())) as journal:
+        if "response" in journal.steps:
+            print("♻️ Returning the pull request created by an earlier attempt")
+            return {**journal.steps["response"], "idempotent_replay": True}
         
-        # Check if user has push access
-        if not repo_info.get("permissions", {}).get("push", False):
-            print("❌ User does not have push permissions")
-            raise HTTPException(
-                status_code=403, 
-                detail="You don't have write access to this repository. You need push permissions to create pull requests."
+        try:
+            # 2 + 3. Repository info/base commit and the blob do not depend on each other: run them together
+            print("📡 Steps 2-3: Getting repository info and base commit, creating blob...")
+            base, blob_sha = await asyncio.gather(
+                journal.step("base", lambda: timed_step(
+                    timings, "repository_and_base", get_pr_base(owner, repo, github_token)
+                )),
+                journal.step("blob", lambda: timed_step(timings, "blob", create_git_object(
+                    owner, repo, github_token, "blobs", {"content": request_data.test_code, "encoding": "utf-8"}
+                )))
             )
-        
-        print(f"✅ Default branch: {default_branch}")
-        print(f"✅ Repository permissions verified")
-        
-        # 2. Get the latest commit SHA of the default branch
-        print("📡 Step 2: Getting latest commit SHA...")
-        branch_info = await github_api_request(f"/repos/{owner}/{repo}/git/refs/heads/{default_branch}", github_token)
-        base_sha = branch_info["object"]["sha"]
-        print(f"✅ Base SHA: {base_sha[:8]}...")
-        
-        # 3. Create a new branch with unique name to avoid conflicts
-        unique_branch_name = f"{request_data.branch_name}-{int(time.time())}"
-        print(f"📡 Step 3: Creating branch {unique_branch_name}...")
-        branch_data = {
-            "ref": f"refs/heads/{unique_branch_name}",
-            "sha": base_sha
-        }
+            default_branch, base_sha = base["default_branch"], base["base_sha"]
+            print(f"✅ Default branch: {default_branch}, base SHA: {base_sha[:8]}..., blob: {blob_sha[:8]}...")
+            
+            # 4. Create a new tree with the test file on top of the base tree
+            print("📡 Step 4: Creating new tree with test file...")
+            tree_data = {
+                "base_tree": base_sha,
+                "tree": [
+                    {
+                        "path": safe_filename,
+                        "mode": "100644",
+                        "type": "blob",
+                        "sha": blob_sha
+                    }
+                ]
+            }
+            new_tree_sha = await journal.step("tree", lambda: timed_step(
+                timings, "tree", create_git_object(owner, repo, github_token, "trees", tree_data)
+            ))
+            print(f"✅ New tree created: {new_tree_sha[:8]}...")
+            
+            # 5. Create a commit
+            print("📡 Step 5: Creating commit...")
+            commit_data = {
+                "message": request_data.commit_message,
+                "tree": new_tree_sha,
+                "parents": [base_sha]
+            }
+            commit_sha = await journal.step("commit", lambda: timed_step(
+                timings, "commit", create_git_object(owner, repo, github_token, "commits", commit_data)
+            ))
+            print(f"✅ Commit created: {commit_sha[:8]}...")
+            
+            # 6. Create the branch directly at the new commit (unique name to avoid conflicts)
+            print(f"📡 Step 6: Creating branch from {request_data.branch_name}...")
+            unique_branch_name = await journal.step("branch", lambda: timed_step(
+                timings, "branch", create_pr_branch(owner, repo, github_token, request_data.branch_name, commit_sha)
+            ))
+            
+            # 7. Create the pull request
+            print("📡 Step 7: Creating pull request...")
+            pr_data = {
+                "title": f"Add test file: {safe_filename}",
+                "head": unique_branch_name,
+                "base": default_branch,
+                "body": f"This PR adds automated test cases generated by Test Case Generator.\n\n**Test file:** `{safe_filename}`\n\n**Commit:** {request_data.commit_message}\n\n**Branch:** `{unique_branch_name}`\n\n---\n*Generated by GitHub Test Case Generator*"
+            }
+            pr_response = await journal.step("pull_request", lambda: timed_step(
+                timings, "pull_request", create_pull_request_on_github(owner, repo, github_token, pr_data)
+            ))
+            
+            print(f"🎉 PR created successfully: #{pr_response['number']}")
+            print(f"⏱️ PR step timings (ms): {timings}")
+            
+            async def build_response() -> Dict[str, Any]:
+                return {
+                    "success": True,
+                    "pr_url": pr_response["html_url"],
+                    "pr_number": pr_response["number"],
+                    "branch_name": unique_branch_name,
+                    "commit_sha": commit_sha,
+                    "test_file_name": safe_filename
+                }
+            
+            response = await journal.step("response", build_response)
+            return {**response, "timings_ms": timings, "resumed_steps": journal.resumed_steps}
+            
+        except JournalLeaseLost:
+            raise
+        except Exception as e:
+            print(f"❌ PR creation failed: {str(e)}")
+            print(f"Error type: {type(e).__name__}")
+            
+            # Provide more specific error messages
+            error_message = describe_pr_error(e)
+            raise HTTPException(status_code=500, detail=f"Failed to create pull request: {error_message}")
+
+@app.post("/create-pull-request/batch")
+async def create_batch_pull_request(request_data: CreateBatchPRRequest, request: Request):
+    """Create one pull request adding many test files in a single commit"""
+    print(f"🚀 Starting batch PR creation for {request_data.repo_full_name} ({len(request_data.files)} files)")
+    
+    session_token = get_session_token(request)
+    if not session_token:
+        raise HTTPException(status_code=401, detail="Not authenticated - please login with GitHub")
+    
+    github_token = await get_github_token_from_session(session_token)
+    if not github_token:
+        raise HTTPException(status_code=401, detail="GitHub token not found - please login again")
+    
+    try:
+        owner, repo = request_data.repo_full_name.split("/")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid repository format. Expected 'owner/repo'")
+    
+    if not request_data.files:
+        raise HTTPException(status_code=400, detail="At least one test file is required")
+    if len(request_data.files) > PR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files for one pull request (max {PR_BATCH_MAX_FILES})")
+    
+    # Per-file status, in request order; invalid files are reported and left out of the commit
+    file_results: List[Dict[str, Any]] = []
+    seen_paths = set()
+    for item in request_data.files:
+        result = {"path": item.path, "status": "pending", "blob_sha": None, "error": None}
+        file_results.append(result)
         try:
-            await github_api_request(f"/repos/{owner}/{repo}/git/refs", github_token, "POST", branch_data)
-            print(f"✅ Branch created: {unique_branch_name}")
-        except Exception as branch_error:
-            print(f"❌ Branch creation failed: {str(branch_error)}")
-            # Try with a different name
-            unique_branch_name = f"{request_data.branch_name}-{int(time.time())}-{secrets.token_hex(4)}"
-            branch_data["ref"] = f"refs/heads/{unique_branch_name}"
-            try:
-                await github_api_request(f"/repos/{owner}/{repo}/git/refs", github_token, "POST", branch_data)
-                print(f"✅ Branch created with fallback name: {unique_branch_name}")
-            except Exception as fallback_error:
-                print(f"❌ Fallback branch creation also failed: {str(fallback_error)}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Failed to create branch. This might be due to naming conflicts or permissions: {str(fallback_error)}"
-                )
-        
-        # 4. Validate test file name and content
-        print("📡 Step 4: Validating test file...")
-        if not request_data.test_file_name or not request_data.test_file_name.strip():
-            raise HTTPException(status_code=400, detail="Test file name is required")
-        
-        if not request_data.test_code or not request_data.test_code.strip():
-            raise HTTPException(status_code=400, detail="Test code content is required")
-        
-        # Sanitize file name to prevent path traversal
-        safe_filename = request_data.test_file_name.replace('..', '').replace('/', '_').replace('\\', '_')
-        if safe_filename != request_data.test_file_name:
-            print(f"⚠️ Sanitized filename: {request_data.test_file_name} -> {safe_filename}")
-        
-        # 5. Create a blob with the test file content
-        print("📡 Step 5: Creating blob for test file...")
-        blob_data = {
-            "content": request_data.test_code,
-            "encoding": "utf-8"
-        }
-        blob_response = await github_api_request(f"/repos/{owner}/{repo}/git/blobs", github_token, "POST", blob_data)
-        blob_sha = blob_response["sha"]
-        print(f"✅ Blob created: {blob_sha[:8]}...")
-        
-        # 6. Get the current tree
-        print("📡 Step 6: Getting current tree...")
-        tree_response = await github_api_request(f"/repos/{owner}/{repo}/git/trees/{base_sha}", github_token)
-        print(f"✅ Tree retrieved with {len(tree_response.get('tree', []))} items")
+            result["path"] = sanitize_file_path(item.path.strip())
+        except HTTPException as e:
+            result.update(status="invalid", error=e.detail)
+            continue
+        if not item.test_code or not item.test_code.strip():
+            result.update(status="invalid", error="Test code content is required")
+        elif result["path"] in seen_paths:
+            result.update(status="invalid", error="Duplicate path in this pull request")
+        seen_paths.add(result["path"])
+    
+    pending = [(item, result) for item, result in zip(request_data.files, file_results) if result["status"] == "pending"]
+    if not pending:
+        raise HTTPException(status_code=400, detail={"message": "No valid test files to commit", "files": file_results})
+    
+    timings: Dict[str, float] = {}
+    journal_key = get_pr_journal_key(request, github_token)
+    async with pr_journal.run(journal_key, make_request_fingerprint(request_data.dict())) as journal:
+        if "response" in journal.steps:
+            print("♻️ Returning the pull request created by an earlier attempt")
+            return {**journal.steps["response"], "idempotent_replay": True}
         
-        # 7. Create a new tree with the test file
-        print("📡 Step 7: Creating new tree with test file...")
-        tree_data = {
-            "base_tree": base_sha,
-            "tree": [
-                {
-                    "path": safe_filename,
-                    "mode": "100644",
-                    "type": "blob",
-                    "sha": blob_sha
+        try:
+            blob_slots = asyncio.Semaphore(PR_MAX_CONCURRENT_BLOBS)
+            
+            async def create_blob(item: PRFileItem, result: Dict[str, Any]):
+                async with blob_slots:
+                    try:
+                        blob_sha = await journal.step(f"blob:{result['path']}", lambda: create_git_object(
+                            owner, repo, github_token, "blobs", {"content": item.test_code, "encoding": "utf-8"}
+                        ))
+                        result.update(status="committed", blob_sha=blob_sha)
+                    except Exception as e:
+                        print(f"❌ Blob for {result['path']} failed: {getattr(e, 'detail', str(e))}")
+                        result.update(status="failed", error=describe_pr_error(e))
+            
+            async def create_blobs():
+                # Once an earlier attempt built the tree, its file set is final
+                if "tree" not in journal.steps:
+                    await asyncio.gather(*(create_blob(item, result) for item, result in pending))
+            
+            # One permission check and base commit for the whole batch, before any upload:
+            # a request without push access must not spend rate limit on up to PR_BATCH_MAX_FILES blobs
+            base = await journal.step("base", lambda: timed_step(
+                timings, "repository_and_base", get_pr_base(owner, repo, github_token)
+            ))
+            await timed_step(timings, "blobs", create_blobs())
+            default_branch, base_sha = base["default_branch"], base["base_sha"]
+            print(f"✅ Base {default_branch} at {base_sha[:8]}..., uploaded {len(pending)} blobs")
+            committed = [result for result in file_results if result["status"] == "committed"]
+            if not committed and "tree" not in journal.steps:
+                raise HTTPException(status_code=502, detail={"message": "No test file could be uploaded", "files": file_results})
+            
+            async def create_tree() -> Dict[str, Any]:
+                tree_sha = await create_git_object(owner, repo, github_token, "trees", {
+                    "base_tree": base_sha,
+                    "tree": [
+                        {"path": result["path"], "mode": "100644", "type": "blob", "sha": result["blob_sha"]}
+                        for result in committed
+                    ]
+                })
+                return {"sha": tree_sha, "files": {result["path"]: result["blob_sha"] for result in committed}}
+            
+            tree = await journal.step("tree", lambda: timed_step(timings, "tree", create_tree()))
+            for result in file_results:
+                if result["path"] in tree["files"]:
+                    result.update(status="committed", blob_sha=tree["files"][result["path"]], error=None)
+                elif result["status"] == "pending":
+                    result.update(status="failed", error="Not part of the commit made by an earlier attempt")
+            committed = [result for result in file_results if result["status"] == "committed"]
+            
+            commit_sha = await journal.step("commit", lambda: timed_step(timings, "commit", create_git_object(
+                owner, repo, github_token, "commits",
+                {"message": request_data.commit_message, "tree": tree["sha"], "parents": [base_sha]}
+            )))
+            print(f"✅ Commit {commit_sha[:8]}... with {len(committed)} files")
+            
+            # The branch starts at the finished commit, so it never points at an empty change
+            unique_branch_name = await journal.step("branch", lambda: timed_step(
+                timings, "branch", create_pr_branch(owner, repo, github_token, request_data.branch_name, commit_sha)
+            ))
+            
+            file_list = "\n".join(f"- `{result['path']}`" for result in committed)
+            pr_response = await journal.step("pull_request", lambda: timed_step(timings, "pull_request", create_pull_request_on_github(owner, repo, github_token, {
+                "title": request_data.title or f"Add {len(committed)} test files",
+                "head": unique_branch_name,
+                "base": default_branch,
+                "body": f"This PR adds automated test cases generated by Test Case Generator.\n\n**Test files:**\n{file_list}\n\n**Commit:** {request_data.commit_message}\n\n**Branch:** `{unique_branch_name}`\n\n---\n*Generated by GitHub Test Case Generator*"
+            })))
+            
+            print(f"🎉 Batch PR created successfully: #{pr_response['number']}")
+            print(f"⏱️ Batch PR step timings (ms): {timings}")
+            
+            async def build_response() -> Dict[str, Any]:
+                return {
+                    "success": True,
+                    "pr_url": pr_response["html_url"],
+                    "pr_number": pr_response["number"],
+                    "branch_name": unique_branch_name,
+                    "commit_sha": commit_sha,
+                    "files": file_results
                 }
-            ]
-        }
-        new_tree_response = await github_api_request(f"/repos/{owner}/{repo}/git/trees", github_token, "POST", tree_data)
-        new_tree_sha = new_tree_response["sha"]
-        print(f"✅ New tree created: {new_tree_sha[:8]}...")
-        
-        # 8. Create a commit
-        print("📡 Step 8: Creating commit...")
-        commit_data = {
-            "message": request_data.commit_message,
-            "tree": new_tree_sha,
-            "parents": [base_sha]
-        }
-        commit_response = await github_api_request(f"/repos/{owner}/{repo}/git/commits", github_token, "POST", commit_data)
-        commit_sha = commit_response["sha"]
-        print(f"✅ Commit created: {commit_sha[:8]}...")
-        
-        # 9. Update the branch reference
-        print(f"📡 Step 9: Updating branch reference...")
-        update_ref_data = {
-            "sha": commit_sha
-        }
-        await github_api_request(f"/repos/{owner}/{repo}/git/refs/heads/{unique_branch_name}", github_token, "PATCH", update_ref_data)
-        print(f"✅ Branch updated with new commit")
-        
-        # 10. Create the pull request
-        print("📡 Step 10: Creating pull request...")
-        pr_data = {
-            "title": f"Add test file: {safe_filename}",
-            "head": unique_branch_name,
-            "base": default_branch,
-            "body": f"This PR adds automated test cases generated by Test Case Generator.\n\n**Test file:** `{safe_filename}`\n\n**Commit:** {request_data.commit_message}\n\n**Branch:** `{unique_branch_name}`\n\n---\n*Generated by GitHub Test Case Generator*"
-        }
-        pr_response = await github_api_request(f"/repos/{owner}/{repo}/pulls", github_token, "POST", pr_data)
-        
-        print(f"🎉 PR created successfully: #{pr_response['number']}")
-        
-        return {
-            "success": True,
-            "pr_url": pr_response["html_url"],
-            "pr_number": pr_response["number"],
-            "branch_name": unique_branch_name,
-            "commit_sha": commit_sha,
-            "test_file_name": safe_filename
-        }
-        
-    except Exception as e:
-        print(f"❌ PR creation failed: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        
-        # Provide more specific error messages
-        error_message = str(e)
-        if "403" in error_message or "Forbidden" in error_message:
-            error_message = "Permission denied. You may not have write access to this repository, or the repository may be archived."
-        elif "404" in error_message or "Not Found" in error_message:
-            error_message = "Repository not found or not accessible with your current permissions."
-        elif "422" in error_message or "Unprocessable Entity" in error_message:
-            error_message = "Invalid request data. The branch name might already exist or contain invalid characters."
-        elif "401" in error_message or "Unauthorized" in error_message:
-            error_message = "Authentication failed. Please login again."
-        
-        raise HTTPException(status_code=500, detail=f"Failed to create pull request: {error_message}")
+            
+            response = await journal.step("response", build_response)
+            return {**response, "timings_ms": timings, "resumed_steps": journal.resumed_steps}
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"❌ Batch PR creation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to create pull request: {describe_pr_error(e)}")
 
 # End of API endpoints
 
@@ -0,0 +1,207 @@
+"""
+Model routing for AI completions
+Keeps moving latency and error statistics per model in AI_MODELS, orders a
+quality tier's models by expected latency (penalizing recent errors), and
+hedges: when the chosen model is slower than its p95, the same prompt is also
+sent to the next model and whichever answers first wins. Failed models fall
+over to the remaining models of the tier
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException
+
+from config import (
+    AI_MODELS, MODEL_TIERS, DEFAULT_MODEL_TIER, ROUTER_HEDGING_ENABLED, ROUTER_LATENCY_WINDOW,
+    ROUTER_MIN_SAMPLES, ROUTER_DEFAULT_LATENCY_SECONDS, ROUTER_HEDGE_MIN_DELAY_SECONDS,
+    ROUTER_HEDGE_MAX_DELAY_SECONDS, ROUTER_ERROR_PENALTY
+)
+from circuit_breaker import CircuitOpenError
+
+# Weight of the newest observation in moving averages
+_EWMA_ALPHA = 0.2
+
+def is_rejection(error: BaseException) -> bool:
+    """Rejections by the AI queue (429) or an open circuit say nothing about the model"""
+    return isinstance(error, CircuitOpenError) or (isinstance(error, HTTPException) and error.status_code == 429)
+
+class ModelStats:
+    """Moving latency and error statistics for one model"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=ROUTER_LATENCY_WINDOW)
+        self.average_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.hedge_wins = 0
+
+    def record_success(self, seconds: float):
+        self.calls += 1
+        self.latencies.append(seconds)
+        if self.average_latency is None:
+            self.average_latency = seconds
+        else:
+            self.average_latency += _EWMA_ALPHA * (seconds - self.average_latency)
+        self.error_rate *= 1 - _EWMA_ALPHA
+
+    def record_error(self):
+        self.calls += 1
+        self.errors += 1
+        self.error_rate += _EWMA_ALPHA * (1 - self.error_rate)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def score(self) -> float:
+        """Expected latency, inflated by the recent error rate (lower is better)"""
+        latency = self.average_latency if self.average_latency is not None else ROUTER_DEFAULT_LATENCY_SECONDS
+        return latency * (1 + ROUTER_ERROR_PENALTY * self.error_rate)
+
+    def to_dict(self) -> Dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "average_latency_seconds": round(self.average_latency, 2) if self.average_latency is not None else None,
+            "p50_latency_seconds": round(p50, 2) if p50 is not None else None,
+            "p95_latency_seconds": round(p95, 2) if p95 is not None else None,
+            "cancelled": self.cancelled,
+            "hedge_wins": self.hedge_wins
+        }
+
+class ModelRouter:
+    """Pick, hedge and fail over between the models of a quality tier"""
+
+    def __init__(self):
+        self._stats: Dict[str, ModelStats] = {key: ModelStats() for key in AI_MODELS}
+        self.counters = {"routed": 0, "hedges": 0, "failovers": 0}
+
+    def _stats_for(self, model_name: str) -> ModelStats:
+        for key, model_config in AI_MODELS.items():
+            if model_config["name"] == model_name:
+                return self._stats[key]
+        return self._stats.setdefault(model_name, ModelStats())
+
+    def rank(self, tier: Optional[str] = None) -> List[str]:
+        """OpenRouter model names of a tier, best expected latency first (config order breaks ties)"""
+        tier = tier or DEFAULT_MODEL_TIER
+        if tier not in MODEL_TIERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown quality tier '{tier}'. Available: {', '.join(MODEL_TIERS)}"
+            )
+        ranked = sorted(MODEL_TIERS[tier], key=lambda key: self._stats[key].score())
+        return [AI_MODELS[key]["name"] for key in ranked]
+
+    def hedge_delay(self, model_name: str) -> float:
+        """Wait this long for a model before hedging: its p95 latency, clamped"""
+        p95 = self._stats_for(model_name).percentile(0.95)
+        delay = p95 if p95 is not None else ROUTER_DEFAULT_LATENCY_SECONDS
+        return min(max(delay, ROUTER_HEDGE_MIN_DELAY_SECONDS), ROUTER_HEDGE_MAX_DELAY_SECONDS)
+
+    def record_success(self, model_name: str, seconds: float):
+        self._stats_for(model_name).record_success(seconds)
+
+    def record_error(self, model_name: str, error: BaseException):
+        if not is_rejection(error):
+            self._stats_for(model_name).record_error()
+
+    async def observe(self, model_name: str, call: Callable[[str], Awaitable[str]]) -> str:
+        """Run one completion on a model and record its latency or failure"""
+        started_at = time.monotonic()
+        try:
+            content = await call(model_name)
+            if not content or not content.strip():
+                raise HTTPException(status_code=500, detail=f"Empty response from {model_name}")
+        except asyncio.CancelledError:
+            self._stats_for(model_name).cancelled += 1
+            raise
+        except Exception as e:
+            self.record_error(model_name, e)
+            raise
+        self.record_success(model_name, time.monotonic() - started_at)
+        return content
+
+    async def complete(self, call: Callable[[str], Awaitable[str]], tier: Optional[str] = None) -> str:
+        """
+        Run call(model_name) on the tier's best model, hedging to the next one
+        after the p95 delay and failing over when a model errors
+        """
+        candidates = self.rank(tier)
+        self.counters["routed"] += 1
+        pending: Dict[asyncio.Task, str] = {}
+        launched = 0
+        hedged = None
+        rejected = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> asyncio.Task:
+            nonlocal launched
+            model_name = candidates[launched]
+            launched += 1
+            task = asyncio.ensure_future(self.observe(model_name, call))
+            pending[task] = model_name
+            return task
+
+        launch()
+        try:
+            while pending:
+                current_model = next(iter(pending.values()))
+                can_hedge = (
+                    ROUTER_HEDGING_ENABLED and hedged is None and not rejected
+                    and len(pending) == 1 and launched < len(candidates)
+                )
+                timeout = self.hedge_delay(current_model) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    self.counters["hedges"] += 1
+                    hedged = launch()
+                    print(f"🧭 {current_model} slower than its p95, hedging with {pending[hedged]}")
+                    continue
+
+                for task in done:
+                    model_name = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if task is hedged:
+                            self._stats_for(model_name).hedge_wins += 1
+                        return task.result()
+                    last_error = error
+                    if is_rejection(error):
+                        # Other models would be rejected the same way; keep waiting for one already running
+                        rejected = True
+                        continue
+                    print(f"❌ Model {model_name} failed: {getattr(error, 'detail', str(error))}")
+
+                if not pending and launched < len(candidates) and not rejected:
+                    self.counters["failovers"] += 1
+                    launch()
+        finally:
+            # Cancel the slower model once one answered (or the caller went away)
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def stats(self) -> Dict:
+        return {
+            "hedging_enabled": ROUTER_HEDGING_ENABLED,
+            "default_tier": DEFAULT_MODEL_TIER,
+            "tiers": {tier: self.rank(tier) for tier in MODEL_TIERS},
+            "models": {
+                AI_MODELS[key]["name"] if key in AI_MODELS else key: stats.to_dict()
+                for key, stats in self._stats.items()
+            },
+            "counters": dict(self.counters)
+        }
+
+# Process-wide router shared by all AI calls
+model_router = ModelRouter()
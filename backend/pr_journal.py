@@ -0,0 +1,303 @@
+"""
+Operation journal for idempotent, resumable pull request creation
+A request carrying an Idempotency-Key records every GitHub object it
+produces (base commit, blobs, tree, commit, branch, pull request) as soon as
+it exists. A retry with the same key skips the completed steps and resumes
+where the previous attempt failed instead of creating another branch; a
+finished request returns its stored result. Journals live in memory or, with
+PR_JOURNAL_BACKEND=sqlite, in a SQLite file shared by all workers. An attempt
+claims its key under a lease first, so concurrent attempts with the same key
+(on any worker) run one at a time
+"""
+import asyncio
+import hashlib
+import heapq
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+
+from config import (
+    PR_JOURNAL_BACKEND, PR_JOURNAL_SQLITE_PATH, PR_JOURNAL_TTL_SECONDS,
+    PR_JOURNAL_LEASE_SECONDS, PR_JOURNAL_WAIT_SECONDS
+)
+
+# How often a waiting attempt checks whether the key was released
+_CLAIM_POLL_SECONDS = 0.25
+
+def make_request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Fingerprint a request body so a key cannot be reused for a different request"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class JournalLeaseLost(HTTPException):
+    """Raised when another attempt took over the key (this one held it past its lease)"""
+
+    def __init__(self):
+        super().__init__(status_code=409, detail="Another request with this Idempotency-Key took over")
+
+class MemoryJournalBackend:
+    """Journal entries in a dict of this process, expired through a min-heap on every write"""
+
+    name = "memory"
+
+    def __init__(self):
+        # key -> {"entry", "expires_at", "owner", "lease_expires"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # (expires_at, key) min-heap; entries go stale when a key is written
+        # again and are fixed up lazily when they reach the top
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def claim(self, key: str, owner: str, lease_seconds: float, ttl: int, new_entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Take the key's lease and return its entry (new_entry if absent); None while another attempt holds it"""
+        now = time.time()
+        self._prune(now)
+        item = self._entries.get(key)
+        if item is not None and item["expires_at"] <= now and not self._leased(item, now):
+            item = None
+        if item is None:
+            self._entries[key] = {"entry": new_entry, "expires_at": now + ttl, "owner": owner, "lease_expires": now + lease_seconds}
+            heapq.heappush(self._expiry_heap, (now + ttl, key))
+            return new_entry
+        if self._leased(item, now) and item["owner"] != owner:
+            return None
+        item.update(owner=owner, lease_expires=now + lease_seconds)
+        return item["entry"]
+
+    @staticmethod
+    def _leased(item: Dict[str, Any], now: float) -> bool:
+        return item["owner"] is not None and item["lease_expires"] > now
+
+    def set(self, key: str, entry: Dict[str, Any], ttl: int, owner: str, lease_seconds: float):
+        """Store an entry, extending the lease; raises JournalLeaseLost if owner no longer holds it"""
+        item = self._entries.get(key)
+        if item is None or item["owner"] != owner:
+            raise JournalLeaseLost()
+        now = time.time()
+        item.update(entry=entry, expires_at=now + ttl, lease_expires=now + lease_seconds)
+        self._prune(now)
+
+    def release(self, key: str, owner: str):
+        item = self._entries.get(key)
+        if item is not None and item["owner"] == owner:
+            item.update(owner=None, lease_expires=0)
+
+    def _prune(self, now: float):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, key = heapq.heappop(self._expiry_heap)
+            item = self._entries.get(key)
+            if item is None:
+                continue
+            if item["expires_at"] > now or self._leased(item, now):
+                # Written since, or an attempt is still running: requeue
+                heapq.heappush(self._expiry_heap, (max(item["expires_at"], item["lease_expires"]), key))
+                continue
+            del self._entries[key]
+
+    def prune(self):
+        self._prune(time.time())
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class SQLiteJournalBackend:
+    """Journal entries in SQLite, shared by all workers on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = PR_JOURNAL_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pr_journal ("
+            " key TEXT PRIMARY KEY,"
+            " entry TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pr_journal_expires_at ON pr_journal (expires_at)")
+        self._conn.commit()
+
+    def claim(self, key: str, owner: str, lease_seconds: float, ttl: int, new_entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Take the key's lease and return its entry (new_entry if absent); None while another attempt holds it"""
+        now = time.time()
+        # Each statement is atomic across workers: drop an expired, unleased entry,
+        # insert if absent, otherwise take over a free or lapsed lease
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM pr_journal WHERE key = ? AND expires_at <= ? AND (owner IS NULL OR lease_expires <= ?)",
+                (key, now, now)
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO pr_journal (key, entry, expires_at, owner, lease_expires) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(new_entry), now + ttl, owner, now + lease_seconds)
+            )
+            if cursor.rowcount == 1:
+                self._conn.commit()
+                return new_entry
+            cursor = self._conn.execute(
+                "UPDATE pr_journal SET owner = ?, lease_expires = ?"
+                " WHERE key = ? AND (owner IS NULL OR owner = ? OR lease_expires <= ?)",
+                (owner, now + lease_seconds, key, owner, now)
+            )
+            self._conn.commit()
+            if cursor.rowcount != 1:
+                return None
+            row = self._conn.execute("SELECT entry FROM pr_journal WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0])
+
+    def set(self, key: str, entry: Dict[str, Any], ttl: int, owner: str, lease_seconds: float):
+        """Store an entry, extending the lease; raises JournalLeaseLost if owner no longer holds it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE pr_journal SET entry = ?, expires_at = ?, lease_expires = ? WHERE key = ? AND owner = ?",
+                (json.dumps(entry), now + ttl, now + lease_seconds, key, owner)
+            )
+            self._conn.commit()
+        if cursor.rowcount != 1:
+            raise JournalLeaseLost()
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pr_journal SET owner = NULL, lease_expires = 0 WHERE key = ? AND owner = ?", (key, owner)
+            )
+            self._conn.commit()
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM pr_journal WHERE expires_at <= ? AND (owner IS NULL OR lease_expires <= ?)", (now, now)
+            )
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pr_journal").fetchone()[0]
+
+class JournalRun:
+    """One attempt at a journaled operation (without a key nothing is persisted)"""
+
+    def __init__(self, journal: "PRJournal", key: Optional[str], entry: Dict[str, Any], owner: Optional[str] = None):
+        self.journal = journal
+        self.key = key
+        self.entry = entry
+        self.owner = owner
+        # Steps completed by earlier attempts
+        self.resumed_steps = list(entry["steps"])
+
+    @property
+    def steps(self) -> Dict[str, Any]:
+        return self.entry["steps"]
+
+    async def step(self, name: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of a completed step, or run it and record its (JSON-serializable) result"""
+        if name in self.steps:
+            self.journal.counters["steps_skipped"] += 1
+            return self.steps[name]
+        result = await run()
+        self.steps[name] = result
+        if self.key is not None:
+            self.entry["updated_at"] = time.time()
+            self.journal.backend.set(self.key, self.entry, self.journal.ttl_seconds, self.owner, self.journal.lease_seconds)
+        return result
+
+class PRJournal:
+    """Idempotency-key journal with one attempt per key at a time"""
+
+    def __init__(self, backend, ttl_seconds: int = PR_JOURNAL_TTL_SECONDS,
+                 lease_seconds: float = PR_JOURNAL_LEASE_SECONDS, wait_seconds: float = PR_JOURNAL_WAIT_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        # key -> [lock, attempts holding or waiting for it]; spares this process polling the backend
+        self._locks: Dict[str, list] = {}
+        self.counters = {"started": 0, "resumed": 0, "replayed": 0, "steps_skipped": 0, "waited": 0, "busy": 0}
+
+    async def _claim(self, key: str, owner: str, fingerprint: str) -> Dict[str, Any]:
+        """Claim the key, waiting up to wait_seconds for an attempt on another worker"""
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while True:
+            new_entry = {"fingerprint": fingerprint, "steps": {}, "created_at": time.time()}
+            entry = self.backend.claim(key, owner, self.lease_seconds, self.ttl_seconds, new_entry)
+            if entry is not None:
+                return entry
+            if time.monotonic() >= deadline:
+                self.counters["busy"] += 1
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": str(max(1, int(self.lease_seconds)))}
+                )
+            if not waited:
+                waited = True
+                self.counters["waited"] += 1
+            await asyncio.sleep(_CLAIM_POLL_SECONDS)
+
+    @asynccontextmanager
+    async def run(self, key: Optional[str], fingerprint: str):
+        """
+        Open the journal for key (None: an unjournaled attempt). A concurrent
+        attempt with the same key waits for this one (409 after wait_seconds);
+        reusing a key for a different request is rejected with 422
+        """
+        if key is None:
+            yield JournalRun(self, None, {"steps": {}})
+            return
+
+        lock_entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        lock_entry[1] += 1
+        try:
+            async with lock_entry[0]:
+                owner = secrets.token_hex(8)
+                entry = await self._claim(key, owner, fingerprint)
+                try:
+                    if entry["fingerprint"] != fingerprint:
+                        raise HTTPException(
+                            status_code=422,
+                            detail="Idempotency-Key was already used for a different request"
+                        )
+                    if "response" in entry["steps"]:
+                        self.counters["replayed"] += 1
+                    elif entry["steps"]:
+                        self.counters["resumed"] += 1
+                        print(f"♻️ Resuming journaled operation after steps: {', '.join(entry['steps'])}")
+                    else:
+                        self.counters["started"] += 1
+                    yield JournalRun(self, key, entry, owner)
+                finally:
+                    self.backend.release(key, owner)
+        finally:
+            lock_entry[1] -= 1
+            if not lock_entry[1]:
+                del self._locks[key]
+
+    def stats(self) -> Dict:
+        self.backend.prune()
+        return {
+            "backend": self.backend.name,
+            "entries": self.backend.size(),
+            "ttl_seconds": self.ttl_seconds,
+            "in_progress": len(self._locks),
+            **self.counters
+        }
+
+def create_journal_backend(backend_name: str = PR_JOURNAL_BACKEND):
+    """Create the configured journal backend ('memory' or 'sqlite')"""
+    if backend_name == "sqlite":
+        return SQLiteJournalBackend()
+    return MemoryJournalBackend()
+
+# Process-wide journal for pull request creation
+pr_journal = PRJournal(create_journal_backend())
@@ -0,0 +1,213 @@
+"""
+Per-repository project profile used for framework detection
+The tree is classified once per commit; per-file framework decisions are then
+a dictionary lookup against the profile
+"""
+from typing import List, Dict, Optional
+from pydantic import BaseModel
+
+from config import SUPPORTED_EXTENSIONS
+from tree_cache import get_repo_tree_entry
+
+# Languages counted for the project statistics
+PROFILE_LANGUAGES = ['python', 'javascript', 'typescript', 'java', 'csharp', 'go', 'ruby', 'php']
+
+# Framework indicators, checked in priority order (first match wins for a path)
+FRAMEWORK_INDICATORS = [
+    'cypress', 'playwright', 'selenium', 'jest', 'vitest', 'pytest',
+    'unittest', 'junit', 'nunit', 'rspec', 'mocha', 'phpunit'
+]
+
+# Directory names that hold tests
+TEST_DIRECTORY_NAMES = {'test', 'tests', '__tests__', 'spec', 'specs', 'e2e', 'cypress'}
+
+# Maximum number of test directories kept in the profile
+MAX_TEST_DIRECTORIES = 20
+
+class RepoProfile(BaseModel):
+    commit_sha: str
+    total_files: int
+    language_counts: Dict[str, int]
+    framework_indicators: Dict[str, int]
+    test_directories: Dict[str, int]
+    test_file_patterns: Dict[str, int]
+    framework_by_language: Dict[str, str]
+    framework_by_extension: Dict[str, str]
+
+    def framework_for(self, file_path: str) -> str:
+        """Get the detected framework for a file"""
+        ext = '.' + file_path.split('.')[-1].lower() if '.' in file_path else ''
+        return self.framework_by_extension.get(ext, self.framework_by_language['unknown'])
+
+def _get_extension(path: str) -> str:
+    return '.' + path.split('.')[-1].lower() if '.' in path else ''
+
+def _match_framework_indicator(path_lower: str, ext: str) -> Optional[str]:
+    """Get the framework a path points to, if any"""
+    if 'cypress' in path_lower or 'cypress.config' in path_lower:
+        return 'cypress'
+    elif 'playwright' in path_lower or 'playwright.config' in path_lower:
+        return 'playwright'
+    elif 'selenium' in path_lower:
+        return 'selenium'
+    elif 'jest.config' in path_lower or 'jest.setup' in path_lower:
+        return 'jest'
+    elif 'vitest.config' in path_lower:
+        return 'vitest'
+    elif 'conftest.py' in path_lower or 'pytest.ini' in path_lower:
+        return 'pytest'
+    elif 'unittest' in path_lower and ext == '.py':
+        return 'unittest'
+    elif 'pom.xml' in path_lower or 'build.gradle' in path_lower or path_lower.endswith('test.java'):
+        return 'junit'
+    elif path_lower.endswith('.csproj') or 'nunit' in path_lower:
+        return 'nunit'
+    elif 'spec.rb' in path_lower or 'rspec' in path_lower:
+        return 'rspec'
+    elif 'mocha' in path_lower:
+        return 'mocha'
+    elif 'phpunit' in path_lower:
+        return 'phpunit'
+    return None
+
+def _match_test_file_pattern(file_name: str) -> Optional[str]:
+    """Get the naming convention of a test file, if it is one"""
+    name_lower = file_name.lower()
+    if name_lower.startswith('test_') and name_lower.endswith('.py'):
+        return 'test_*.py'
+    elif name_lower.endswith('_test.py'):
+        return '*_test.py'
+    elif '.test.' in name_lower:
+        return '*.test.*'
+    elif '.spec.' in name_lower:
+        return '*.spec.*'
+    elif name_lower.endswith('_test.go'):
+        return '*_test.go'
+    elif name_lower.endswith('_spec.rb'):
+        return '*_spec.rb'
+    elif file_name.endswith('Test.java') or file_name.endswith('Tests.java'):
+        return '*Test.java'
+    elif file_name.endswith('Tests.cs') or file_name.endswith('Test.cs'):
+        return '*Tests.cs'
+    elif file_name.endswith('Test.php'):
+        return '*Test.php'
+    return None
+
+def _decide_framework(target_language: str, language_counts: Dict[str, int], indicators: Dict[str, int]) -> str:
+    """Priority-based framework decision for a target language"""
+    # 1. E2E/UI Testing frameworks (highest priority for web projects)
+    if indicators['cypress']:
+        return 'cypress'
+    elif indicators['playwright']:
+        return 'playwright'
+    elif indicators['selenium'] and (language_counts['python'] > 0 or target_language == 'python'):
+        return 'selenium'
+
+    js_count = language_counts['javascript'] + language_counts['typescript']
+
+    # 2. Language-specific framework detection with project analysis
+    if target_language == 'python' or language_counts['python'] > js_count:
+        if indicators['pytest']:
+            return 'pytest'
+        elif indicators['unittest']:
+            return 'unittest'
+        elif indicators['selenium']:
+            return 'selenium'
+        return 'pytest'  # Default for Python
+
+    elif target_language in ['javascript', 'typescript'] or js_count > language_counts['python']:
+        if indicators['jest']:
+            return 'jest'
+        elif indicators['vitest']:
+            return 'vitest'
+        elif indicators['mocha']:
+            return 'mocha'
+        return 'jest'  # Default for JS/TS
+
+    elif target_language == 'java' or language_counts['java'] > 0:
+        return 'junit'
+    elif target_language == 'csharp' or language_counts['csharp'] > 0:
+        return 'nunit'
+    elif target_language == 'go' or language_counts['go'] > 0:
+        return 'testing'
+    elif target_language == 'ruby' or language_counts['ruby'] > 0:
+        return 'rspec'
+    elif target_language == 'php' or language_counts['php'] > 0:
+        return 'phpunit'
+
+    # Fallback to simple language-based detection
+    return next(
+        (config['default_framework'] for config in SUPPORTED_EXTENSIONS.values() if config['language'] == target_language),
+        'generic'
+    )
+
+def build_repo_profile(commit_sha: str, tree_items: List[Dict]) -> RepoProfile:
+    """Classify every file in a tree once and precompute framework decisions"""
+    language_counts = {language: 0 for language in PROFILE_LANGUAGES}
+    indicators = {framework: 0 for framework in FRAMEWORK_INDICATORS}
+    test_directories: Dict[str, int] = {}
+    test_file_patterns: Dict[str, int] = {}
+    total_files = 0
+
+    for item in tree_items:
+        if item.get("type") != "blob":
+            continue
+        total_files += 1
+        path = item["path"]
+        path_lower = path.lower()
+        ext = _get_extension(path)
+
+        language = SUPPORTED_EXTENSIONS.get(ext, {}).get('language')
+        if language in language_counts:
+            language_counts[language] += 1
+
+        framework = _match_framework_indicator(path_lower, ext)
+        if framework:
+            indicators[framework] += 1
+
+        parts = path.split('/')
+        pattern = _match_test_file_pattern(parts[-1])
+        if pattern:
+            test_file_patterns[pattern] = test_file_patterns.get(pattern, 0) + 1
+
+        # Attribute test files to their outermost test directory
+        for depth, part in enumerate(parts[:-1]):
+            if part.lower() in TEST_DIRECTORY_NAMES:
+                test_dir = '/'.join(parts[:depth + 1])
+                test_directories[test_dir] = test_directories.get(test_dir, 0) + 1
+                break
+
+    top_test_directories = dict(
+        sorted(test_directories.items(), key=lambda entry: entry[1], reverse=True)[:MAX_TEST_DIRECTORIES]
+    )
+
+    languages = {config['language'] for config in SUPPORTED_EXTENSIONS.values()} | {'unknown'}
+    framework_by_language = {
+        language: _decide_framework(language, language_counts, indicators)
+        for language in sorted(languages)
+    }
+    framework_by_extension = {
+        ext: framework_by_language[config['language']]
+        for ext, config in SUPPORTED_EXTENSIONS.items()
+    }
+
+    return RepoProfile(
+        commit_sha=commit_sha,
+        total_files=total_files,
+        language_counts=language_counts,
+        framework_indicators={framework: count for framework, count in indicators.items() if count},
+        test_directories=top_test_directories,
+        test_file_patterns=test_file_patterns,
+        framework_by_language=framework_by_language,
+        framework_by_extension=framework_by_extension
+    )
+
+async def get_repo_profile(owner: str, repo: str, token: str = None) -> RepoProfile:
+    """Get the project profile for the repository's HEAD commit (built once per tree)"""
+    entry = await get_repo_tree_entry(owner, repo, token)
+    if "profile" not in entry:
+        entry["profile"] = build_repo_profile(entry["commit_sha"], entry["items"])
+        profile = entry["profile"]
+        print(f"📊 Built profile for {owner}/{repo}@{profile.commit_sha[:8]}: {profile.language_counts}")
+        print(f"🔍 Framework indicators found: {profile.framework_indicators}")
+    return entry["profile"]
@@ -0,0 +1,290 @@
+"""
+Session storage
+Sessions live behind a small async backend interface so every worker sees
+the same logins: "memory" keeps them in this process (single worker),
+"sqlite" shares them between workers on one host (WAL mode) and survives
+restarts. A network store (e.g. Redis) only needs to implement SessionBackend
+
+Expiry slides: a session expires SESSION_TIMEOUT_HOURS after it was last
+used. Each backend keeps an expiry index (a min-heap in memory, an indexed
+column in SQLite) so the background reaper only touches expired sessions
+"""
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    SESSION_STORE_BACKEND, SESSION_STORE_SQLITE_PATH, SESSION_TIMEOUT_HOURS,
+    SESSION_TOUCH_INTERVAL_SECONDS, SESSION_REAPER_INTERVAL_SECONDS
+)
+
+class SessionBackend(ABC):
+    """Interface of a session store; session data must be JSON-serializable"""
+
+    name = "base"
+
+    def __init__(self, ttl_seconds: float = SESSION_TIMEOUT_HOURS * 3600,
+                 touch_interval_seconds: float = SESSION_TOUCH_INTERVAL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        # Refresh last_accessed at most this often per session (saves writes on busy sessions)
+        self.touch_interval_seconds = touch_interval_seconds
+
+    def _needs_touch(self, last_accessed: float, now: float) -> bool:
+        return now - last_accessed >= self.touch_interval_seconds
+
+    @abstractmethod
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Session data, refreshing its expiry; None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, token: str, data: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def update(self, token: str, fields: Dict[str, Any]) -> bool:
+        """Merge fields into an existing session; False if it does not exist"""
+
+    @abstractmethod
+    async def delete(self, token: str) -> Optional[Dict[str, Any]]:
+        """Remove a session and return its data"""
+
+    @abstractmethod
+    async def reap(self, now: float) -> List[str]:
+        """Remove sessions expired at `now` and return their tokens"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    async def list(self, offset: int = 0, limit: int = 50) -> List[Tuple[str, Dict[str, Any]]]:
+        """Sessions ordered by expiry, soonest first (data includes expires_at)"""
+
+class MemorySessionBackend(SessionBackend):
+    """Sessions in a dict of this process (sessions are lost on restart)"""
+
+    name = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        # (expires_at, token) min-heap; entries go stale when a session is
+        # touched or deleted and are fixed up lazily when they reach the top
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def _expires_at(self, data: Dict[str, Any]) -> float:
+        return data.get("last_accessed", 0) + self.ttl_seconds
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        data = self._sessions.get(token)
+        if data is None:
+            return None
+        now = time.time()
+        if self._expires_at(data) <= now:
+            return None
+        if self._needs_touch(data.get("last_accessed", 0), now):
+            data["last_accessed"] = now
+        return data
+
+    async def set(self, token: str, data: Dict[str, Any]):
+        self._sessions[token] = data
+        heapq.heappush(self._expiry_heap, (self._expires_at(data), token))
+
+    async def update(self, token: str, fields: Dict[str, Any]) -> bool:
+        if token not in self._sessions:
+            return False
+        self._sessions[token].update(fields)
+        return True
+
+    async def delete(self, token: str) -> Optional[Dict[str, Any]]:
+        return self._sessions.pop(token, None)
+
+    async def reap(self, now: float) -> List[str]:
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, token = heapq.heappop(self._expiry_heap)
+            data = self._sessions.get(token)
+            if data is None:
+                continue
+            expires_at = self._expires_at(data)
+            if expires_at > now:
+                # Used since the entry was pushed: requeue at its new expiry
+                heapq.heappush(self._expiry_heap, (expires_at, token))
+                continue
+            del self._sessions[token]
+            expired.append(token)
+        return expired
+
+    async def count(self) -> int:
+        return len(self._sessions)
+
+    async def list(self, offset: int = 0, limit: int = 50) -> List[Tuple[str, Dict[str, Any]]]:
+        page = heapq.nsmallest(offset + limit, self._sessions.items(), key=lambda item: self._expires_at(item[1]))
+        return [(token, {**data, "expires_at": self._expires_at(data)}) for token, data in page[offset:]]
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in SQLite, shared by all workers on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_STORE_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        # The file holds GitHub tokens: keep it private to the server user
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " token TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_accessed REAL NOT NULL DEFAULT 0,"
+            " expires_at REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self._conn.commit()
+
+    def _row_to_data(self, data: str, last_accessed: float) -> Dict[str, Any]:
+        # The column is authoritative: touches only update the columns, not the JSON
+        return {**json.loads(data), "last_accessed": last_accessed}
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, last_accessed FROM sessions WHERE token = ? AND expires_at > ?", (token, now)
+            ).fetchone()
+            if row is None:
+                return None
+            last_accessed = row[1]
+            if self._needs_touch(last_accessed, now):
+                last_accessed = now
+                self._conn.execute(
+                    "UPDATE sessions SET last_accessed = ?, expires_at = ? WHERE token = ?",
+                    (now, now + self.ttl_seconds, token)
+                )
+                self._conn.commit()
+        return self._row_to_data(row[0], last_accessed)
+
+    async def set(self, token: str, data: Dict[str, Any]):
+        last_accessed = data.get("last_accessed", 0)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, data, created_at, last_accessed, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (token, json.dumps(data), data.get("created_at", 0), last_accessed, last_accessed + self.ttl_seconds)
+            )
+            self._conn.commit()
+
+    async def update(self, token: str, fields: Dict[str, Any]) -> bool:
+        # Read-modify-write in one transaction so concurrent workers do not lose fields
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE token = ?", (token,)).fetchone()
+            if row is None:
+                return False
+            data = {**json.loads(row[0]), **fields}
+            self._conn.execute("UPDATE sessions SET data = ? WHERE token = ?", (json.dumps(data), token))
+            self._conn.commit()
+        return True
+
+    async def delete(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, last_accessed FROM sessions WHERE token = ?", (token,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            self._conn.commit()
+        return self._row_to_data(*row)
+
+    async def reap(self, now: float) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT token FROM sessions WHERE expires_at <= ?", (now,)).fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                self._conn.commit()
+        return [row[0] for row in rows]
+
+    async def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    async def list(self, offset: int = 0, limit: int = 50) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT token, data, last_accessed, expires_at FROM sessions"
+                " ORDER BY expires_at LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [
+            (token, {**self._row_to_data(data, last_accessed), "expires_at": expires_at})
+            for token, data, last_accessed, expires_at in rows
+        ]
+
+class SessionReaper:
+    """Background task removing expired sessions every few seconds"""
+
+    def __init__(self, store: SessionBackend, interval_seconds: float = SESSION_REAPER_INTERVAL_SECONDS):
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.last_run_at: Optional[float] = None
+        self.counters = {"runs": 0, "expired_total": 0, "expired_last_run": 0}
+
+    async def reap_once(self) -> int:
+        expired = await self.store.reap(time.time())
+        self.last_run_at = time.time()
+        self.counters["runs"] += 1
+        self.counters["expired_last_run"] = len(expired)
+        self.counters["expired_total"] += len(expired)
+        if expired:
+            print(f"🧹 Reaped {len(expired)} expired sessions")
+        return len(expired)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.reap_once()
+            except Exception as e:
+                print(f"⚠️ Session reaper failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def start(self):
+        """Start reaping (first pass right away, for sessions that expired while the server was down)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "timeout_seconds": self.store.ttl_seconds,
+            "reaper_interval_seconds": self.interval_seconds,
+            "last_run_at": self.last_run_at,
+            **self.counters
+        }
+
+def create_session_backend(backend_name: str = SESSION_STORE_BACKEND) -> SessionBackend:
+    """Create the configured session backend ('memory' or 'sqlite')"""
+    if backend_name == "sqlite":
+        return SQLiteSessionBackend()
+    return MemorySessionBackend()
+
+# Process-wide session store used by the auth endpoints, and its reaper
+session_store = create_session_backend()
+session_reaper = SessionReaper(session_store)
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing for identical in-flight upstream calls
+Concurrent callers with the same key await one shared upstream task; its
+result or exception is delivered to every waiter
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class SingleFlight:
+    """Runs at most one upstream call per key at a time"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Optional[Hashable], fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn, or join the identical call already in flight (key None disables coalescing)"""
+        if key is None:
+            return await fn()
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finish, key))
+        else:
+            self.coalesced += 1
+
+        # Shield so one cancelled caller (e.g. a disconnected client) does not
+        # cancel the upstream call for everyone else
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
+
+def single_flight(flight: SingleFlight, key_fn: Callable[..., Optional[Hashable]]):
+    """Decorator that coalesces concurrent calls whose key_fn(*args, **kwargs) match"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await flight.do(key_fn(*args, **kwargs), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
+
+# Shared flights for GitHub and OpenRouter calls
+github_flight = SingleFlight("github")
+openrouter_flight = SingleFlight("openrouter")
+
+def get_single_flight_stats() -> Dict:
+    """Get coalescing counters for all flights"""
+    return {
+        github_flight.name: github_flight.stats(),
+        openrouter_flight.name: openrouter_flight.stats()
+    }
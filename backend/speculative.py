@@ -0,0 +1,117 @@
+"""
+Speculative pre-generation of test code
+When a suggestion request opts in, test code for its top SPECULATIVE_TOP_K
+suggestions is generated in the background right away. Finished results are
+stored in the completion cache backend (so they survive restarts with the
+sqlite backend) for SPECULATIVE_TTL_SECONDS; a later generate-code request for
+one of them returns the stored result or attaches to the generation in flight
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import SPECULATIVE_TTL_SECONDS, SPECULATIVE_MAX_INFLIGHT
+from completion_cache import completion_cache
+from github_scheduler import background_priority
+from llm_limiter import llm_client, current_llm_client
+
+def make_speculative_key(owner: str, repo: str, files: List[str], framework: Optional[str],
+                         suggestion_id: int, suggestion_summary: str, quality_tier: Optional[str]) -> str:
+    """Fingerprint a generate-code request (the fields its prompt depends on)"""
+    payload = json.dumps(
+        {
+            "repository": f"{owner}/{repo}",
+            "files": files,
+            "framework": framework,
+            "suggestion_id": suggestion_id,
+            "suggestion_summary": suggestion_summary,
+            "quality_tier": quality_tier
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SpeculativeGenerator:
+    """Background generations keyed by request fingerprint, with stored results"""
+
+    def __init__(self, backend, ttl_seconds: int = SPECULATIVE_TTL_SECONDS, max_inflight: int = SPECULATIVE_MAX_INFLIGHT):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_inflight = max_inflight
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"started": 0, "skipped": 0, "completed": 0, "failed": 0, "hits": 0, "attached": 0, "misses": 0}
+
+    @staticmethod
+    def _storage_key(key: str) -> str:
+        return f"speculative:{key}"
+
+    def has(self, key: str) -> bool:
+        """Whether a result is stored or being generated for this key"""
+        return key in self._inflight or self.backend.get(self._storage_key(key)) is not None
+
+    def start(self, key: str, generate: Callable[[], Awaitable[Dict[str, Any]]]) -> bool:
+        """Start generating in the background unless already stored, in flight or over the limit"""
+        if self.has(key):
+            return False
+        if len(self._inflight) >= self.max_inflight:
+            self.counters["skipped"] += 1
+            return False
+
+        self.counters["started"] += 1
+        task = asyncio.ensure_future(self._run(key, generate))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return True
+
+    async def _run(self, key: str, generate: Callable[[], Awaitable[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        # Speculative work yields GitHub budget to interactive calls and queues for AI calls on its own
+        with background_priority(), llm_client(f"speculative:{current_llm_client()}"):
+            try:
+                result = await generate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                print(f"⚠️ Speculative generation failed: {getattr(e, 'detail', str(e))}")
+                return None
+
+        self.backend.set(self._storage_key(key), json.dumps(result), self.ttl_seconds)
+        self.counters["completed"] += 1
+        return result
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored result, or the result of the generation in flight (None if there is neither)"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["attached"] += 1
+            print("🔮 Attaching to speculative generation in flight")
+            # Shield so a disconnected client does not cancel the generation for later requests
+            return await asyncio.shield(task)
+
+        stored = self.backend.get(self._storage_key(key))
+        if stored is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        print("🔮 Serving speculatively generated test code")
+        return json.loads(stored)
+
+    async def stop(self):
+        """Cancel generations still in flight (on shutdown)"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "max_in_flight": self.max_inflight,
+            "ttl_seconds": self.ttl_seconds,
+            **self.counters
+        }
+
+# Process-wide generator; results share the completion cache's storage backend
+speculative_generator = SpeculativeGenerator(completion_cache.backend)
@@ -0,0 +1,178 @@
+"""
+Bulk repository ingestion from the GitHub tarball
+The tarball of a resolved commit is downloaded once and streamed through
+tarfile (nothing is extracted to disk); code files are stored in the blob
+cache under their git blob SHA, so later per-file fetches are cache hits
+"""
+import asyncio
+import io
+import queue
+import tarfile
+import time
+from typing import Dict, List, Optional
+import httpx
+from fastapi import HTTPException
+
+from config import TARBALL_INGEST_MIN_FILES, TARBALL_MAX_FILE_BYTES, is_code_file
+from http_clients import get_client
+from blob_cache import blob_cache, git_blob_sha
+from tree_cache import get_repo_tree_entry
+from github_scheduler import scheduled_send, is_rate_limited, seconds_until_reset
+from single_flight import github_flight, single_flight
+
+# Downloaded chunks buffered between the network and the tar parser
+_QUEUE_CHUNKS = 64
+
+_stats = {"ingested_repos": 0, "ingested_files": 0, "ingested_bytes": 0, "failures": 0}
+
+class _ChunkReader(io.RawIOBase):
+    """Blocking file object fed with downloaded chunks from the event loop"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=_QUEUE_CHUNKS)
+        self._buffer = b""
+        self._eof = False
+        self.finished = False  # Set by the parser; further chunks are dropped
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def offer(self, chunk: bytes) -> bool:
+        """Queue a chunk without blocking (False when the buffer is full)"""
+        try:
+            self._queue.put_nowait(chunk)
+            return True
+        except queue.Full:
+            return False
+
+    def feed(self, chunk: Optional[bytes]):
+        """Queue a chunk (None marks the end of the download), waiting while the parser catches up"""
+        while not self.finished:
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+def _parse_tarball(reader: _ChunkReader) -> Dict[str, int]:
+    """Read the tar stream and fill the blob cache with code files (runs in a worker thread)"""
+    counts = {"files": 0, "bytes": 0, "skipped": 0}
+    try:
+        with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isreg():
+                    continue
+                # Entries are prefixed with "<owner>-<repo>-<sha>/"
+                path = member.name.split("/", 1)[-1]
+                if not is_code_file(path) or member.size > TARBALL_MAX_FILE_BYTES:
+                    counts["skipped"] += 1
+                    continue
+
+                data = archive.extractfile(member).read()
+                try:
+                    content = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    counts["skipped"] += 1
+                    continue
+
+                blob_cache.put(git_blob_sha(data), content)
+                counts["files"] += 1
+                counts["bytes"] += len(data)
+    finally:
+        reader.finished = True
+    return counts
+
+async def _send_tarball_request(client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+    response = await client.send(request, stream=True, follow_redirects=True)
+    if response.status_code != 200:
+        # Error bodies are small; read them so rate limit checks can inspect the text
+        await response.aread()
+    return response
+
+# Keyed by commit SHA only: the caller already resolved that commit with its own token
+@single_flight(github_flight, lambda owner, repo, commit_sha, token=None: ("tarball", owner, repo, commit_sha))
+async def _download_and_ingest(owner: str, repo: str, commit_sha: str, token: str = None) -> Dict[str, int]:
+    headers = {
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "TestCaseGenerator/1.0"
+    }
+    if token:
+        headers["Authorization"] = f"token {token}"
+
+    client = get_client("github")
+    request = client.build_request("GET", f"https://api.github.com/repos/{owner}/{repo}/tarball/{commit_sha}", headers=headers)
+    started_at = time.time()
+
+    try:
+        response = await scheduled_send(headers, lambda: _send_tarball_request(client, request))
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to connect to GitHub API: {str(e)}")
+
+    try:
+        if is_rate_limited(response):
+            reset_in = seconds_until_reset(response)
+            raise HTTPException(
+                status_code=429,
+                detail=f"GitHub API rate limit exceeded. Resets in {reset_in}s",
+                headers={"Retry-After": str(reset_in + 1)}
+            )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=f"Failed to download tarball: {response.text}")
+
+        reader = _ChunkReader()
+        parser = asyncio.create_task(asyncio.to_thread(_parse_tarball, reader))
+        try:
+            async for chunk in response.aiter_bytes():
+                if reader.finished:
+                    break
+                if not reader.offer(chunk):
+                    await asyncio.to_thread(reader.feed, chunk)
+        finally:
+            await asyncio.to_thread(reader.feed, None)
+            counts = await parser
+    finally:
+        await response.aclose()
+
+    print(f"📥 Ingested tarball for {owner}/{repo}@{commit_sha[:8]}: {counts['files']} files, "
+          f"{counts['bytes']} bytes in {time.time() - started_at:.2f}s ({counts['skipped']} skipped)")
+    return counts
+
+async def ingest_repo_tarball(owner: str, repo: str, token: str = None) -> Dict[str, int]:
+    """Fill the blob cache with the code files of the repository's HEAD commit (once per commit)"""
+    entry = await get_repo_tree_entry(owner, repo, token)
+    if "tarball_counts" not in entry:
+        counts = await _download_and_ingest(owner, repo, entry["commit_sha"], token)
+        entry["tarball_counts"] = counts
+        _stats["ingested_repos"] += 1
+        _stats["ingested_files"] += counts["files"]
+        _stats["ingested_bytes"] += counts["bytes"]
+    return entry["tarball_counts"]
+
+async def prefetch_repo_files(owner: str, repo: str, file_paths: List[str], token: str = None):
+    """
+    Ingest the repository tarball when more than TARBALL_INGEST_MIN_FILES files
+    are requested. Failures are logged and callers fall back to per-file fetches.
+    """
+    if len(file_paths) <= TARBALL_INGEST_MIN_FILES:
+        return
+    try:
+        await ingest_repo_tarball(owner, repo, token)
+    except Exception as e:
+        _stats["failures"] += 1
+        print(f"⚠️ Tarball ingestion failed for {owner}/{repo}, fetching files individually: {str(e)}")
+
+def get_tarball_stats() -> Dict:
+    """Get tarball ingestion counters"""
+    return {"min_files": TARBALL_INGEST_MIN_FILES, **_stats}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Circuit Breaker Test Script - closed / open / half-open transitions
+Runs without a server: python test_circuit_breaker.py (or with pytest)
+"""
+
+import asyncio
+import httpx
+
+from circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN, is_upstream_failure
+)
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("Test", failure_threshold=3, recovery_seconds=30, half_open_max_calls=1)
+
+def call(breaker: CircuitBreaker, status_code: int = 200) -> httpx.Response:
+    async def send():
+        return httpx.Response(status_code)
+    return asyncio.run(breaker.call(send, is_upstream_failure))
+
+def fail(breaker: CircuitBreaker):
+    async def send():
+        raise httpx.ConnectError("connection refused")
+    try:
+        asyncio.run(breaker.call(send))
+    except httpx.ConnectError:
+        return
+    raise AssertionError("connection error was swallowed")
+
+def open_breaker() -> CircuitBreaker:
+    breaker = make_breaker()
+    for _ in range(breaker.failure_threshold):
+        fail(breaker)
+    assert breaker.state == STATE_OPEN
+    return breaker
+
+def wait_for_recovery(breaker: CircuitBreaker):
+    """Pretend CIRCUIT_RECOVERY_SECONDS have passed"""
+    breaker.opened_at -= breaker.recovery_seconds
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == STATE_CLOSED
+    fail(breaker)
+    assert breaker.state == STATE_OPEN
+    assert breaker.counters["opened"] == 1
+    print("✅ Opens after the failure threshold")
+
+def test_success_resets_failure_count():
+    breaker = make_breaker()
+    fail(breaker)
+    fail(breaker)
+    call(breaker)
+    fail(breaker)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.consecutive_failures == 1
+    print("✅ A success resets the consecutive failure count")
+
+def test_only_server_errors_count():
+    breaker = make_breaker()
+    call(breaker, 404)
+    call(breaker, 429)
+    assert breaker.consecutive_failures == 0
+    for _ in range(3):
+        call(breaker, 502)
+    assert breaker.state == STATE_OPEN
+    print("✅ 5xx responses count as failures, 4xx do not")
+
+def test_open_breaker_fails_fast():
+    breaker = open_breaker()
+    sent = []
+
+    async def send():
+        sent.append(True)
+
+    try:
+        asyncio.run(breaker.call(send))
+        raise AssertionError("open breaker let a call through")
+    except CircuitOpenError as e:
+        assert e.status_code == 503
+        assert 1 <= int(e.headers["Retry-After"]) <= 31
+    assert not sent
+    assert breaker.counters["rejected"] == 1
+    assert breaker.stats()["retry_after_seconds"] is not None
+    print("✅ Open breaker rejects with 503 and Retry-After without calling upstream")
+
+def test_half_open_success_closes():
+    breaker = open_breaker()
+    wait_for_recovery(breaker)
+    assert not breaker.is_open()
+    assert breaker.stats()["retry_after_seconds"] is None
+    call(breaker)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.consecutive_failures == 0
+    print("✅ Successful trial call closes the breaker")
+
+def test_half_open_failure_reopens():
+    breaker = open_breaker()
+    wait_for_recovery(breaker)
+    fail(breaker)
+    assert breaker.state == STATE_OPEN
+    assert breaker.is_open()
+    assert breaker.counters["opened"] == 2
+    print("✅ Failed trial call opens the breaker again")
+
+def test_half_open_limits_trial_calls():
+    breaker = open_breaker()
+    wait_for_recovery(breaker)
+    breaker.before_call()
+    assert breaker.state == STATE_HALF_OPEN
+    try:
+        breaker.before_call()
+        raise AssertionError("second trial call was admitted")
+    except CircuitOpenError:
+        pass
+
+    # An abandoned trial (no verdict) frees its slot without deciding anything
+    breaker.record(None)
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == STATE_CLOSED
+    print("✅ Half-open breaker admits one trial call at a time")
+
+if __name__ == "__main__":
+    print("🧪 CIRCUIT BREAKER TESTS")
+    print("=" * 50)
+    test_opens_after_consecutive_failures()
+    test_success_resets_failure_count()
+    test_only_server_errors_count()
+    test_open_breaker_fails_fast()
+    test_half_open_success_closes()
+    test_half_open_failure_reopens()
+    test_half_open_limits_trial_calls()
+    print("\n🎯 All circuit breaker tests passed")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+PR Journal Test Script - resuming, replaying and guarding Idempotency-Keys
+Runs without a server: python test_pr_journal.py (or with pytest)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from fastapi import HTTPException
+
+from pr_journal import (
+    PRJournal, MemoryJournalBackend, SQLiteJournalBackend, JournalLeaseLost, make_request_fingerprint
+)
+
+FINGERPRINT = make_request_fingerprint({"repo": "octo/repo", "files": ["test_app.py"]})
+TEMP_DIR = tempfile.mkdtemp(prefix="pr_journal_test_")
+
+def journals(workers: int = 1):
+    """Yield lists of journals sharing one store: in memory, then in one SQLite file (as separate workers would)"""
+    memory = MemoryJournalBackend()
+    yield [PRJournal(memory, ttl_seconds=3600, wait_seconds=0) for _ in range(workers)]
+    path = os.path.join(TEMP_DIR, f"journal_{time.time_ns()}.db")
+    yield [PRJournal(SQLiteJournalBackend(path), ttl_seconds=3600, wait_seconds=0) for _ in range(workers)]
+
+def github_step(calls: list, name: str, fail: bool = False):
+    """A fake GitHub call that records it ran"""
+    async def run():
+        calls.append(name)
+        if fail:
+            raise HTTPException(status_code=502, detail="GitHub API error")
+        return f"{name}-sha"
+    return run
+
+def test_retry_resumes_after_failed_step():
+    for [journal] in journals():
+        calls = []
+
+        async def attempt(blob_fails: bool):
+            async with journal.run("key-1", FINGERPRINT) as run:
+                base = await run.step("base", github_step(calls, "base"))
+                blob = await run.step("blob", github_step(calls, "blob", fail=blob_fails))
+                return run.resumed_steps, base, blob
+
+        try:
+            asyncio.run(attempt(blob_fails=True))
+            raise AssertionError("failing step did not raise")
+        except HTTPException:
+            pass
+        assert asyncio.run(attempt(blob_fails=False)) == (["base"], "base-sha", "blob-sha")
+        assert calls == ["base", "blob", "blob"]
+        assert (journal.counters["started"], journal.counters["resumed"]) == (1, 1)
+        print(f"✅ [{journal.backend.name}] Retry skips the steps the failed attempt completed")
+
+def test_finished_request_is_replayed():
+    for [journal] in journals():
+        calls = []
+
+        async def attempt():
+            async with journal.run("key-1", FINGERPRINT) as run:
+                await run.step("branch", github_step(calls, "branch"))
+                return await run.step("response", github_step(calls, "response"))
+
+        assert asyncio.run(attempt()) == asyncio.run(attempt()) == "response-sha"
+        assert calls == ["branch", "response"]
+        assert journal.counters["replayed"] == 1
+        print(f"✅ [{journal.backend.name}] Finished request is replayed without GitHub calls")
+
+def test_key_reused_for_other_request_is_rejected():
+    for [journal] in journals():
+        async def attempt(fingerprint: str):
+            async with journal.run("key-1", fingerprint) as run:
+                await run.step("base", github_step([], "base"))
+
+        asyncio.run(attempt(FINGERPRINT))
+        try:
+            asyncio.run(attempt(make_request_fingerprint({"repo": "octo/other"})))
+            raise AssertionError("reused key was accepted")
+        except HTTPException as e:
+            assert e.status_code == 422
+        # The rejected attempt does not keep the key
+        asyncio.run(attempt(FINGERPRINT))
+        print(f"✅ [{journal.backend.name}] Key reused for a different request gets 422")
+
+def test_attempt_without_key_is_not_journaled():
+    for [journal] in journals():
+        calls = []
+
+        async def attempt():
+            async with journal.run(None, FINGERPRINT) as run:
+                await run.step("base", github_step(calls, "base"))
+
+        asyncio.run(attempt())
+        asyncio.run(attempt())
+        assert calls == ["base", "base"]
+        assert journal.backend.size() == 0
+        print(f"✅ [{journal.backend.name}] Requests without a key run every step")
+
+def test_concurrent_attempts_run_one_at_a_time():
+    for [journal] in journals():
+        calls = []
+
+        async def attempt():
+            async with journal.run("key-1", FINGERPRINT) as run:
+                await run.step("branch", github_step(calls, "branch"))
+                await asyncio.sleep(0.01)
+                return await run.step("response", github_step(calls, "response"))
+
+        async def both():
+            return await asyncio.gather(attempt(), attempt())
+
+        assert asyncio.run(both()) == ["response-sha", "response-sha"]
+        assert calls == ["branch", "response"]
+        print(f"✅ [{journal.backend.name}] Concurrent attempts with one key create one branch")
+
+def test_other_worker_gets_409_while_key_is_held():
+    for [worker_a, worker_b] in journals(workers=2):
+        async def scenario():
+            async with worker_a.run("key-1", FINGERPRINT) as run:
+                await run.step("branch", github_step([], "branch"))
+                try:
+                    async with worker_b.run("key-1", FINGERPRINT):
+                        raise AssertionError("second worker got a held key")
+                except HTTPException as e:
+                    assert e.status_code == 409 and "Retry-After" in e.headers
+            # Released: the other worker resumes where the first stopped
+            async with worker_b.run("key-1", FINGERPRINT) as run:
+                assert run.resumed_steps == ["branch"]
+
+        asyncio.run(scenario())
+        assert worker_b.counters["busy"] == 1
+        print(f"✅ [{worker_a.backend.name}] Other workers get 409 while an attempt holds the key")
+
+def test_expired_lease_is_taken_over():
+    for [journal] in journals():
+        backend = journal.backend
+        entry = {"fingerprint": FINGERPRINT, "steps": {}, "created_at": time.time()}
+        assert backend.claim("key-1", "slow", 0.05, 3600, entry) is not None
+        assert backend.claim("key-1", "other", 60, 3600, entry) is None
+        time.sleep(0.06)
+        assert backend.claim("key-1", "other", 60, 3600, entry) is not None
+        try:
+            backend.set("key-1", entry, 3600, "slow", 60)
+            raise AssertionError("write with a lost lease was accepted")
+        except JournalLeaseLost:
+            pass
+        print(f"✅ [{backend.name}] Expired lease is taken over and the old owner's writes are refused")
+
+def test_memory_backend_prunes_on_write():
+    backend = MemoryJournalBackend()
+    entry = {"fingerprint": FINGERPRINT, "steps": {}, "created_at": time.time()}
+    for index in range(50):
+        backend.claim(f"expired-{index}", "owner", 60, 0, entry)
+        backend.release(f"expired-{index}", "owner")
+    backend.claim("live", "owner", 60, 3600, entry)
+    assert backend.size() == 1
+    print("✅ [memory] Expired entries are pruned on every write")
+
+if __name__ == "__main__":
+    print("🧪 PR JOURNAL TESTS")
+    print("=" * 50)
+    test_retry_resumes_after_failed_step()
+    test_finished_request_is_replayed()
+    test_key_reused_for_other_request_is_rejected()
+    test_attempt_without_key_is_not_journaled()
+    test_concurrent_attempts_run_one_at_a_time()
+    test_other_worker_gets_409_while_key_is_held()
+    test_expired_lease_is_taken_over()
+    test_memory_backend_prunes_on_write()
+    print("\n🎯 All PR journal tests passed")
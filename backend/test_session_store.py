@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Session Store Test Script - sliding expiry and reaping on both backends
+Runs without a server: python test_session_store.py (or with pytest)
+"""
+
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+
+from session_store import MemorySessionBackend, SQLiteSessionBackend, SessionReaper
+
+TTL = 100
+TOUCH_INTERVAL = 10
+
+async def add_session(store, token: str, last_accessed: float):
+    await store.set(token, {"github_token": f"gh-{token}", "created_at": last_accessed, "last_accessed": last_accessed})
+
+async def check_reap_removes_expired(store):
+    """Reaping removes expired sessions only"""
+    now = time.time()
+    await add_session(store, "old", now - 150)
+    await add_session(store, "older", now - 300)
+    await add_session(store, "fresh", now - 50)
+
+    assert sorted(await store.reap(now)) == ["old", "older"]
+    assert await store.count() == 1
+    assert (await store.get("fresh"))["github_token"] == "gh-fresh"
+
+async def check_list_by_expiry(store):
+    """Sessions are listed soonest expiry first"""
+    now = time.time()
+    await add_session(store, "b", now - 20)
+    await add_session(store, "c", now - 5)
+    await add_session(store, "a", now - 60)
+
+    page = await store.list(0, 10)
+    assert [token for token, _ in page] == ["a", "b", "c"]
+    assert abs(page[0][1]["expires_at"] - (now - 60 + TTL)) < 0.01
+    assert [token for token, _ in await store.list(1, 1)] == ["b"]
+
+async def check_get_slides_expiry(store):
+    """Using a session pushes its expiry back"""
+    now = time.time()
+    await add_session(store, "used", now - 90)
+    await add_session(store, "idle", now - 80)
+
+    assert await store.get("used") is not None
+    assert await store.reap(now + 30) == ["idle"]
+    assert await store.reap(now + TTL + 1) == ["used"]
+
+async def check_touch_interval(store):
+    """Sessions used within the touch interval are not rewritten"""
+    now = time.time()
+    await add_session(store, "recent", now - 5)
+    assert abs((await store.get("recent"))["last_accessed"] - (now - 5)) < 0.01
+
+async def check_expired_hidden(store):
+    """Expired sessions are hidden before the reaper runs"""
+    await add_session(store, "stale", time.time() - TTL - 1)
+    assert await store.get("stale") is None
+    assert await store.count() == 1
+
+async def check_update_and_delete(store):
+    """Updates merge fields; deletes return the session once"""
+    await add_session(store, "user", time.time())
+    assert await store.update("user", {"login": "octocat"})
+    assert not await store.update("missing", {"login": "nobody"})
+    assert (await store.delete("user"))["login"] == "octocat"
+    assert await store.delete("user") is None
+
+async def check_reaper_counters(store):
+    """The reaper counts what each pass removed"""
+    await add_session(store, "expired", time.time() - TTL - 1)
+    reaper = SessionReaper(store, interval_seconds=60)
+    assert await reaper.reap_once() == 1
+    assert await reaper.reap_once() == 0
+    stats = reaper.stats()
+    assert (stats["runs"], stats["expired_total"], stats["expired_last_run"]) == (2, 1, 0)
+
+CHECKS = [
+    check_reap_removes_expired, check_list_by_expiry, check_get_slides_expiry, check_touch_interval,
+    check_expired_hidden, check_update_and_delete, check_reaper_counters
+]
+
+def run_checks(make_store):
+    for check in CHECKS:
+        asyncio.run(check(make_store()))
+        print(f"✅ {check.__doc__}")
+
+def test_memory_backend():
+    print("🧠 Memory backend")
+    run_checks(lambda: MemorySessionBackend(ttl_seconds=TTL, touch_interval_seconds=TOUCH_INTERVAL))
+
+def test_memory_backend_stale_heap_entries():
+    store = MemorySessionBackend(ttl_seconds=TTL)
+    now = time.time()
+
+    async def scenario():
+        await add_session(store, "gone", now - 200)
+        await add_session(store, "reset", now - 200)
+        await store.delete("gone")
+        # Set again with a fresh timestamp: its old heap entry must not expire it
+        await add_session(store, "reset", now)
+        assert await store.reap(now) == []
+        assert await store.count() == 1
+
+    asyncio.run(scenario())
+    print("✅ Deleted and re-set sessions leave no live heap entries behind")
+
+def test_sqlite_backend():
+    print("💾 SQLite backend")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = (os.path.join(directory, f"sessions_{n}.db") for n in itertools.count())
+        run_checks(lambda: SQLiteSessionBackend(
+            path=next(paths), ttl_seconds=TTL, touch_interval_seconds=TOUCH_INTERVAL
+        ))
+
+if __name__ == "__main__":
+    print("🧪 SESSION STORE TESTS")
+    print("=" * 50)
+    test_memory_backend()
+    test_memory_backend_stale_heap_entries()
+    test_sqlite_backend()
+    print("\n🎯 All session store tests passed")
@@ -0,0 +1,253 @@
+"""
+Prompt token budgeting
+Tokenizers are resolved per model from AI_MODELS: tiktoken encodings or
+Hugging Face tokenizer.json files are used when available, with a code-aware
+heuristic otherwise. The packer fits source files into the input
+budget (MAX_INPUT_TOKENS, less when a model's context window is smaller) in
+priority (request) order, replacing over-budget files with code outlines,
+and reports what it used
+"""
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    AI_MODELS, DEFAULT_AI_MODEL, MAX_INPUT_TOKENS, PROMPT_RESERVED_TOKENS,
+    MIN_PACKED_FILE_TOKENS, TOKENIZER_DIR, OUTLINE_FILE_MAX_TOKENS
+)
+from code_outline import get_code_outline
+
+# Extra tokens per chat message for role and separators
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+class HeuristicTokenizer:
+    """Approximate BPE token counts: long identifiers split into several tokens, punctuation is one each"""
+
+    exact = False
+
+    def __init__(self, name: str, chars_per_token: float):
+        self.name = f"heuristic:{name}"
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for piece in _PIECE_PATTERN.findall(text):
+            if piece[0].isspace():
+                # Single spaces merge into the next word; line breaks and indentation do not
+                if "\n" in piece or len(piece) > 1:
+                    tokens += 1
+            elif piece[0].isalnum() or piece[0] == "_":
+                tokens += math.ceil(len(piece) / self.chars_per_token)
+            else:
+                tokens += 1
+        return tokens
+
+class TiktokenTokenizer:
+    """OpenAI tiktoken encoding"""
+
+    exact = True
+
+    def __init__(self, encoding):
+        self.name = f"tiktoken:{encoding.name}"
+        self._encoding = encoding
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+class HuggingFaceTokenizer:
+    """Tokenizer loaded from a Hugging Face tokenizer.json file"""
+
+    exact = True
+
+    def __init__(self, name: str, tokenizer):
+        self.name = f"hf:{name}"
+        self._tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+_tokenizers: Dict[str, object] = {}
+
+def _resolve_model_key(model: Optional[str]) -> str:
+    """Accept either an AI_MODELS key or a full OpenRouter model name"""
+    if model in AI_MODELS:
+        return model
+    for key, model_config in AI_MODELS.items():
+        if model_config["name"] == model:
+            return key
+    return DEFAULT_AI_MODEL
+
+def _load_tokenizer(tokenizer_name: str, chars_per_token: float):
+    try:
+        import tiktoken
+        return TiktokenTokenizer(tiktoken.get_encoding(tokenizer_name))
+    except Exception:
+        pass
+
+    if TOKENIZER_DIR:
+        path = os.path.join(TOKENIZER_DIR, f"{tokenizer_name}.json")
+        if os.path.exists(path):
+            try:
+                from tokenizers import Tokenizer
+                return HuggingFaceTokenizer(tokenizer_name, Tokenizer.from_file(path))
+            except Exception as e:
+                print(f"⚠️ Failed to load tokenizer {path}: {str(e)}")
+
+    return HeuristicTokenizer(tokenizer_name, chars_per_token)
+
+def get_tokenizer(model: Optional[str] = None):
+    """Get the tokenizer for a model (loaded once, heuristic fallback)"""
+    model_config = AI_MODELS[_resolve_model_key(model)]
+    tokenizer_name = model_config.get("tokenizer", "default")
+    if tokenizer_name not in _tokenizers:
+        tokenizer = _load_tokenizer(tokenizer_name, model_config.get("chars_per_token", 4.0))
+        _tokenizers[tokenizer_name] = tokenizer
+        print(f"🔤 Tokenizer for {model_config['name']}: {tokenizer.name}")
+    return _tokenizers[tokenizer_name]
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens of a text for a model"""
+    return get_tokenizer(model).count(text)
+
+def count_message_tokens(messages: List[dict], model: Optional[str] = None) -> int:
+    """Count prompt tokens of chat messages for a model"""
+    tokenizer = get_tokenizer(model)
+    return sum(tokenizer.count(message["content"]) + _MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def truncate_to_tokens(content: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Keep whole lines from the start (80%) and end (20%) of content within max_tokens"""
+    tokenizer = get_tokenizer(model)
+    if tokenizer.count(content) <= max_tokens:
+        return content
+
+    marker = "\n... [CONTENT TRUNCATED] ...\n"
+    available = max(0, max_tokens - tokenizer.count(marker))
+    lines = content.splitlines(keepends=True)
+
+    head, head_tokens = [], 0
+    for line in lines:
+        line_tokens = tokenizer.count(line)
+        if head_tokens + line_tokens > available * 0.8:
+            break
+        head.append(line)
+        head_tokens += line_tokens
+
+    tail, tail_tokens = [], 0
+    for line in reversed(lines[len(head):]):
+        line_tokens = tokenizer.count(line)
+        if head_tokens + tail_tokens + line_tokens > available:
+            break
+        tail.append(line)
+        tail_tokens += line_tokens
+
+    return "".join(head) + marker + "".join(reversed(tail))
+
+def get_input_budget(model: Optional[str] = None, max_tokens: Optional[int] = None) -> int:
+    """
+    Tokens available for source files: MAX_INPUT_TOKENS, capped by the model's
+    context window less the completion's max_tokens (the model's default if None)
+    """
+    model_config = AI_MODELS[_resolve_model_key(model)]
+    if max_tokens is None:
+        max_tokens = model_config.get("max_tokens", 0)
+    input_tokens = MAX_INPUT_TOKENS
+    if model_config.get("context_window"):
+        input_tokens = min(input_tokens, model_config["context_window"] - max_tokens)
+    return input_tokens - PROMPT_RESERVED_TOKENS
+
+def get_tightest_budget(models: List[str], max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    """
+    The model with the smallest input budget among models a prompt may be sent
+    to, and that budget. Models whose window cannot hold the completion plus
+    MIN_PACKED_FILE_TOKENS of files are left out while another model can
+    """
+    budgets = [(get_input_budget(model, max_tokens), model) for model in models]
+    usable = [item for item in budgets if item[0] >= MIN_PACKED_FILE_TOKENS]
+    if usable and len(usable) < len(budgets):
+        too_small = [model for budget, model in budgets if budget < MIN_PACKED_FILE_TOKENS]
+        print(f"⚠️ Context window of {', '.join(too_small)} too small for {max_tokens} completion tokens, not budgeting for it")
+    budget, model = min(usable or budgets, key=lambda item: item[0])
+    return model, budget
+
+def format_file_block(file_path: str, content: str) -> str:
+    """Format one source file for the AI prompt"""
+    return f"File: {file_path}\n```\n{content}\n```"
+
+def pack_file_contents(
+    file_paths: List[str],
+    contents: List[Optional[str]],
+    model: Optional[str] = None,
+    budget: Optional[int] = None
+) -> Tuple[List[str], Dict]:
+    """
+    Fit files into the prompt budget in priority (request) order
+
+    Files that fit are included whole. Files over OUTLINE_FILE_MAX_TOKENS or
+    the remaining budget are replaced by their code outline; what still does
+    not fit is truncated if at least MIN_PACKED_FILE_TOKENS remain, and the
+    rest are dropped. Returns the formatted file blocks and a token usage report.
+    """
+    tokenizer = get_tokenizer(model)
+    if budget is None:
+        budget = get_input_budget(model)
+
+    blocks = []
+    files_report = []
+    used = 0
+    for file_path, content in zip(file_paths, contents):
+        if content is None:
+            files_report.append({"path": file_path, "status": "missing", "tokens": 0})
+            continue
+
+        label = file_path
+        block = format_file_block(label, content)
+        original_tokens = tokens = tokenizer.count(block)
+        remaining = budget - used
+        outlined = False
+
+        if tokens > min(remaining, OUTLINE_FILE_MAX_TOKENS):
+            outline = get_code_outline(file_path, content)
+            if outline is not None:
+                outline_label = f"{file_path} (outline, long bodies elided)"
+                outline_block = format_file_block(outline_label, outline)
+                outline_tokens = tokenizer.count(outline_block)
+                if outline_tokens < tokens:
+                    label, content, block, tokens, outlined = outline_label, outline, outline_block, outline_tokens, True
+
+        if tokens <= remaining:
+            status = "outlined" if outlined else "included"
+        elif remaining >= MIN_PACKED_FILE_TOKENS:
+            wrapper_tokens = tokenizer.count(format_file_block(label, ""))
+            block = format_file_block(label, truncate_to_tokens(content, remaining - wrapper_tokens, model))
+            tokens = tokenizer.count(block)
+            status = "truncated"
+        else:
+            files_report.append({"path": file_path, "status": "dropped", "tokens": 0, "original_tokens": original_tokens})
+            continue
+
+        blocks.append(block)
+        used += tokens
+        file_report = {"path": file_path, "status": status, "tokens": tokens}
+        if tokens != original_tokens:
+            file_report["original_tokens"] = original_tokens
+        files_report.append(file_report)
+
+    report = {
+        "tokenizer": tokenizer.name,
+        "exact": tokenizer.exact,
+        "budget": budget,
+        "file_tokens": used,
+        "files": files_report
+    }
+    return blocks, report
+
+def finalize_token_usage(report: Dict, messages: List[dict], model: Optional[str] = None) -> Dict:
+    """Add the prompt's total token count to a packing report and log it"""
+    report["prompt_tokens"] = count_message_tokens(messages, model)
+    shrunk = [f["path"] for f in report["files"] if f["status"] in ("outlined", "truncated", "dropped")]
+    print(f"🧮 Prompt uses {report['prompt_tokens']} tokens ({report['file_tokens']}/{report['budget']} for files)"
+          + (f", outlined/truncated/dropped: {shrunk}" if shrunk else ""))
+    return report
@@ -76,7 +76,7 @@ async def monitor_session_management():
     print("🎯 Session Management Monitor Complete!")
     print()
     print("💡 Expected behavior after server restart:")
-    print("   1. All sessions should be cleared (in-memory storage)")
+    print("   1. All sessions should be cleared (memory session store; the sqlite store keeps them)")
     print("   2. Frontend should detect 401 errors and logout automatically")
     print("   3. Users should be redirected to login again")
 
@@ -0,0 +1,153 @@
+"""
+Repository tree cache keyed by resolved commit SHA
+HEAD is resolved to a commit with a short TTL, and the recursive tree for that
+commit is fetched once and shared by file listing and framework detection
+"""
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import httpx
+from fastapi import HTTPException
+
+from config import TREE_HEAD_TTL_SECONDS, TREE_CACHE_MAX_ENTRIES, TREE_HEAD_CACHE_MAX_ENTRIES
+from http_clients import get_client
+from etag_cache import conditional_get
+from github_scheduler import is_rate_limited, seconds_until_reset
+from single_flight import github_flight, single_flight
+from utils import get_token_scope
+
+# (token scope, owner, repo) -> (commit SHA, resolved_at)
+_resolved_heads: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+
+# (owner, repo, commit SHA) -> {"commit_sha": ..., "items": [...], "blob_shas": {path: sha}}
+_trees: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+
+_stats = {"head_hits": 0, "head_misses": 0, "tree_hits": 0, "tree_misses": 0}
+
+def _github_headers(token: str = None, accept: str = "application/vnd.github.v3+json") -> Dict[str, str]:
+    headers = {
+        "Accept": accept,
+        "User-Agent": "TestCaseGenerator/1.0"
+    }
+    if token:
+        headers["Authorization"] = f"token {token}"
+    return headers
+
+def _raise_for_status(response: httpx.Response, owner: str, repo: str):
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=f"Repository {owner}/{repo} not found or is private")
+    elif is_rate_limited(response):
+        reset_in = seconds_until_reset(response)
+        raise HTTPException(
+            status_code=429,
+            detail=f"GitHub API rate limit exceeded. Resets in {reset_in}s",
+            headers={"Retry-After": str(reset_in + 1)}
+        )
+    elif response.status_code == 403:
+        raise HTTPException(status_code=403, detail=f"Access to {owner}/{repo} forbidden: {response.text}")
+    elif response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=f"GitHub API error: {response.text}")
+
+def _fresh_head(owner: str, repo: str, token: str = None) -> Optional[str]:
+    """The resolved HEAD commit if it is younger than TREE_HEAD_TTL_SECONDS"""
+    key = (get_token_scope(token), owner, repo)
+    cached = _resolved_heads.get(key)
+    if not cached or time.time() - cached[1] >= TREE_HEAD_TTL_SECONDS:
+        return None
+    _resolved_heads.move_to_end(key)
+    return cached[0]
+
+async def resolve_head_commit(owner: str, repo: str, token: str = None) -> str:
+    """Resolve the default branch HEAD to a commit SHA (cached for TREE_HEAD_TTL_SECONDS)"""
+    commit_sha = _fresh_head(owner, repo, token)
+    if commit_sha:
+        _stats["head_hits"] += 1
+        return commit_sha
+
+    _stats["head_misses"] += 1
+    commit_sha = await _fetch_head_commit(owner, repo, token)
+    key = (get_token_scope(token), owner, repo)
+    _resolved_heads[key] = (commit_sha, time.time())
+    _resolved_heads.move_to_end(key)
+    while len(_resolved_heads) > TREE_HEAD_CACHE_MAX_ENTRIES:
+        _resolved_heads.popitem(last=False)
+    return commit_sha
+
+@single_flight(github_flight, lambda owner, repo, token=None: ("head", get_token_scope(token), owner, repo))
+async def _fetch_head_commit(owner: str, repo: str, token: str = None) -> str:
+    client = get_client("github")
+    try:
+        response = await conditional_get(
+            client,
+            f"https://api.github.com/repos/{owner}/{repo}/commits/HEAD",
+            _github_headers(token, accept="application/vnd.github.sha")
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to connect to GitHub API: {str(e)}")
+
+    _raise_for_status(response, owner, repo)
+    return response.text.strip()
+
+async def get_repo_tree_entry(owner: str, repo: str, token: str = None) -> Dict:
+    """Get the cache entry for the HEAD tree (also holds data derived from the tree)"""
+    commit_sha = await resolve_head_commit(owner, repo, token)
+    key = (owner, repo, commit_sha)
+
+    if key in _trees:
+        _trees.move_to_end(key)
+        _stats["tree_hits"] += 1
+        return _trees[key]
+
+    _stats["tree_misses"] += 1
+    return await _fetch_tree_entry(owner, repo, commit_sha, token)
+
+# Keyed by commit SHA only: every caller already resolved that commit with its own token
+@single_flight(github_flight, lambda owner, repo, commit_sha, token=None: ("tree", owner, repo, commit_sha))
+async def _fetch_tree_entry(owner: str, repo: str, commit_sha: str, token: str = None) -> Dict:
+    client = get_client("github")
+    try:
+        response = await conditional_get(
+            client,
+            f"https://api.github.com/repos/{owner}/{repo}/git/trees/{commit_sha}?recursive=1",
+            _github_headers(token)
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to connect to GitHub API: {str(e)}")
+
+    _raise_for_status(response, owner, repo)
+    items = response.json().get("tree", [])
+    entry = {
+        "commit_sha": commit_sha,
+        "items": items,
+        "blob_shas": {item["path"]: item["sha"] for item in items if item.get("type") == "blob"}
+    }
+
+    _trees[(owner, repo, commit_sha)] = entry
+    while len(_trees) > TREE_CACHE_MAX_ENTRIES:
+        _trees.popitem(last=False)
+
+    print(f"🌳 Cached tree for {owner}/{repo}@{commit_sha[:8]} ({len(items)} items)")
+    return entry
+
+async def get_repo_tree(owner: str, repo: str, token: str = None) -> List[Dict]:
+    """Get the recursive tree items of the repository's HEAD commit"""
+    entry = await get_repo_tree_entry(owner, repo, token)
+    return entry["items"]
+
+def lookup_blob_sha(owner: str, repo: str, file_path: str, token: str = None) -> Optional[str]:
+    """Look up a file's blob SHA from the HEAD tree resolved with this token (None once that HEAD is stale)"""
+    commit_sha = _fresh_head(owner, repo, token)
+    if not commit_sha:
+        return None
+    entry = _trees.get((owner, repo, commit_sha))
+    if not entry:
+        return None
+    return entry["blob_shas"].get(file_path)
+
+def get_tree_cache_stats() -> Dict:
+    """Get tree cache statistics"""
+    return {
+        **_stats,
+        "cached_trees": len(_trees),
+        "resolved_heads": len(_resolved_heads)
+    }
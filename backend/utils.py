@@ -1,12 +1,20 @@
 """
 Utility functions for the Test Case Generator API
 """
+import asyncio
 import base64
+import hashlib
+import json
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Awaitable
 import httpx
 from fastapi import HTTPException
 
+from config import MAX_CONCURRENT_FILE_FETCHES
+from http_clients import get_client
+from single_flight import github_flight, single_flight
+from token_budget import count_tokens, truncate_to_tokens
+
 def decode_github_content(content: str, encoding: str = "base64") -> str:
     """Decode GitHub file content"""
     if encoding == "base64":
@@ -16,25 +24,19 @@ def decode_github_content(content: str, encoding: str = "base64") -> str:
             raise HTTPException(status_code=400, detail=f"Failed to decode file content: {str(e)}")
     return content
 
-def estimate_token_count(text: str) -> int:
-    """Rough estimation of token count (1 token ≈ 4 characters)"""
-    return len(text) // 4
-
-def truncate_content_if_needed(content: str, max_tokens: int = 20000) -> str:
-    """Truncate content if it exceeds token limit"""
-    estimated_tokens = estimate_token_count(content)
-    if estimated_tokens > max_tokens:
-        # Keep roughly the first 80% and last 20% of content
-        chars_limit = max_tokens * 4
-        first_part_limit = int(chars_limit * 0.8)
-        last_part_limit = int(chars_limit * 0.2)
-        
-        first_part = content[:first_part_limit]
-        last_part = content[-last_part_limit:] if last_part_limit > 0 else ""
-        
-        return f"{first_part}\n\n... [CONTENT TRUNCATED] ...\n\n{last_part}"
-    
-    return content
+def get_token_scope(token: Optional[str]) -> str:
+    """Get a short, non-reversible identifier for a GitHub token (used as a cache scope)"""
+    if not token:
+        return "anonymous"
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+def estimate_token_count(text: str, model: Optional[str] = None) -> int:
+    """Count tokens with the model's tokenizer (heuristic when no tokenizer files are available)"""
+    return count_tokens(text, model)
+
+def truncate_content_if_needed(content: str, max_tokens: int = 20000, model: Optional[str] = None) -> str:
+    """Truncate content if it exceeds token limit, keeping whole lines from the start and end"""
+    return truncate_to_tokens(content, max_tokens, model)
 
 def clean_ai_response(response: str) -> str:
     """Clean and format AI response"""
@@ -158,6 +160,50 @@ def extract_code_from_ai_response(response: str) -> str:
     # If no code blocks found, return the response as-is
     return response.strip()
 
+def extract_code_blocks(response: str) -> List[str]:
+    """Extract all fenced code blocks from an AI response, in order"""
+    return [match.strip() for match in re.findall(r'```[\w]*\n?(.*?)\n?```', response, re.DOTALL)]
+
+# "### TEST 3" on its own line separates the files of a batch completion
+_BATCH_MARKER_PATTERN = re.compile(r'^[ \t]*#{2,4}[ \t]*TEST[ \t]+(?:CASE[ \t]+)?#?(\d+)[ \t]*:?[ \t]*$', re.IGNORECASE | re.MULTILINE)
+
+def split_batch_code_response(response: str, suggestion_ids: List[int]) -> Dict[int, Optional[str]]:
+    """
+    Split a batch completion into one test file per suggestion ID
+
+    Sections start at "### TEST <id>" markers outside code fences and each
+    section's code is taken with extract_code_from_ai_response. Without usable
+    markers, code blocks are assigned in order when their count matches.
+    Suggestions without a section map to None.
+    """
+    fenced_spans = [match.span() for match in re.finditer(r'```.*?```', response, re.DOTALL)]
+    markers = [
+        match for match in _BATCH_MARKER_PATTERN.finditer(response)
+        if not any(start < match.start() < end for start, end in fenced_spans)
+    ]
+
+    sections: Dict[int, str] = {}
+    for index, marker in enumerate(markers):
+        suggestion_id = int(marker.group(1))
+        section_end = markers[index + 1].start() if index + 1 < len(markers) else len(response)
+        section = response[marker.end():section_end]
+        if suggestion_id in suggestion_ids and suggestion_id not in sections and section.strip():
+            sections[suggestion_id] = extract_code_from_ai_response(section)
+
+    if not sections:
+        code_blocks = extract_code_blocks(response)
+        if len(code_blocks) == len(suggestion_ids):
+            return dict(zip(suggestion_ids, code_blocks))
+
+    return {suggestion_id: sections.get(suggestion_id) for suggestion_id in suggestion_ids}
+
+def _github_request_flight_key(endpoint: str, token: str, method: str = "GET", data: dict = None, timeout: int = 30):
+    """Coalesce identical GET requests made with the same token; never coalesce writes"""
+    if method != "GET":
+        return None
+    return ("github_request", get_token_scope(token), endpoint)
+
+@single_flight(github_flight, _github_request_flight_key)
 async def make_github_request(
     endpoint: str, 
     token: str, 
@@ -174,41 +220,90 @@ async def make_github_request(
     
     url = f"https://api.github.com{endpoint}"
     
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            if method == "GET":
-                response = await client.get(url, headers=headers)
-            elif method == "POST":
-                response = await client.post(url, headers=headers, json=data)
-            elif method == "PUT":
-                response = await client.put(url, headers=headers, json=data)
-            elif method == "PATCH":
-                response = await client.patch(url, headers=headers, json=data)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported HTTP method: {method}")
-            
-            if response.status_code == 401:
-                raise HTTPException(status_code=401, detail="GitHub token expired or invalid")
-            elif response.status_code == 403:
-                raise HTTPException(status_code=403, detail="GitHub API rate limit exceeded or insufficient permissions")
-            elif response.status_code == 404:
-                raise HTTPException(status_code=404, detail="GitHub resource not found")
-            elif response.status_code >= 400:
-                error_detail = f"GitHub API error ({response.status_code})"
-                try:
-                    error_data = response.json()
-                    if "message" in error_data:
-                        error_detail += f": {error_data['message']}"
-                except:
-                    error_detail += f": {response.text}"
-                raise HTTPException(status_code=response.status_code, detail=error_detail)
-            
-            return response.json()
-            
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=408, detail="GitHub API request timed out")
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=500, detail=f"GitHub API request failed: {str(e)}")
+    # Imported here because etag_cache and github_scheduler depend on this module
+    from etag_cache import conditional_get
+    from github_scheduler import scheduled_send, is_rate_limited, seconds_until_reset
+    
+    client = get_client("github")
+    try:
+        if method == "GET":
+            response = await conditional_get(client, url, headers, timeout=timeout)
+        elif method in ("POST", "PUT", "PATCH"):
+            response = await scheduled_send(
+                headers,
+                lambda: client.request(method, url, headers=headers, json=data, timeout=timeout)
+            )
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported HTTP method: {method}")
+        
+        if response.status_code == 401:
+            raise HTTPException(status_code=401, detail="GitHub token expired or invalid")
+        elif is_rate_limited(response):
+            reset_in = seconds_until_reset(response)
+            raise HTTPException(
+                status_code=429,
+                detail=f"GitHub API rate limit exceeded. Resets in {reset_in}s",
+                headers={"Retry-After": str(reset_in + 1)}
+            )
+        elif response.status_code == 403:
+            error_detail = "GitHub API request forbidden (insufficient permissions)"
+            try:
+                error_data = response.json()
+                if "message" in error_data:
+                    error_detail += f": {error_data['message']}"
+            except:
+                pass
+            raise HTTPException(status_code=403, detail=error_detail)
+        elif response.status_code == 404:
+            raise HTTPException(status_code=404, detail="GitHub resource not found")
+        elif response.status_code >= 400:
+            error_detail = f"GitHub API error ({response.status_code})"
+            try:
+                error_data = response.json()
+                if "message" in error_data:
+                    error_detail += f": {error_data['message']}"
+            except:
+                error_detail += f": {response.text}"
+            raise HTTPException(status_code=response.status_code, detail=error_detail)
+        
+        return response.json()
+        
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=408, detail="GitHub API request timed out")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"GitHub API request failed: {str(e)}")
+
+async def fetch_files_concurrently(
+    file_paths: List[str],
+    fetch_one: Callable[[str], Awaitable[Optional[str]]],
+    max_concurrency: int = MAX_CONCURRENT_FILE_FETCHES
+) -> List[Optional[str]]:
+    """
+    Fetch several files with bounded concurrency
+    
+    Results are returned in the same order as file_paths. If any fetch fails,
+    the error of the first failing file (in request order) is raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def fetch_with_limit(file_path: str) -> Optional[str]:
+        async with semaphore:
+            return await fetch_one(file_path)
+    
+    results = await asyncio.gather(
+        *(fetch_with_limit(file_path) for file_path in file_paths),
+        return_exceptions=True
+    )
+    
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    
+    return list(results)
+
+def format_sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 def sanitize_file_path(file_path: str) -> str:
     """Sanitize file path to prevent directory traversal attacks"""
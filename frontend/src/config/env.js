@@ -25,9 +25,12 @@ export const ENV = {
     },
     REPOSITORIES: '/repositories',
     ANALYZE: '/repo/analyze',
+    REPO_PROFILE: '/repo/profile',
     GENERATE_SUGGESTIONS: '/generate-test-suggestions',
     GENERATE_CODE: '/generate-test-code',
+    GENERATE_CODE_STREAM: '/repo/generate-code/stream',
     CREATE_PR: '/create-pull-request',
+    CREATE_PR_BATCH: '/create-pull-request/batch',
     FRAMEWORKS: '/frameworks',
     HEALTH: '/health',
     ADMIN: {
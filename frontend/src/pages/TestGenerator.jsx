@@ -1,8 +1,9 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { 
   generateTestSuggestions, 
   generateTestCode, 
+  generateTestCodeStream,
   createPullRequest,
   getFrameworksForFile,
   generateSuggestionsOAuth,
@@ -84,6 +85,11 @@ const TestGenerator = () => {
     }
   }, [navigate])
 
+  // Repository profile, fetched once per repository and reused for every file
+  const repoProfileRef = useRef({ repoUrl: null, profile: null })
+  // One Idempotency-Key per generated test, so retrying a failed PR resumes it instead of creating another branch
+  const prIdempotencyRef = useRef({ code: null, key: null })
+
   // Auto-detect framework when files are selected
   useEffect(() => {
     const detectFramework = async () => {
@@ -91,11 +97,32 @@ const TestGenerator = () => {
         try {
           // Try backend detection first with repo URL for enhanced detection
           const repoUrl = repoData?.repoUrl || (repoData?.repository?.full_name ? `https://github.com/${repoData.repository.full_name}` : null)
-          const url = repoUrl ? 
-            `/frameworks/${selectedFiles[0]}?repo_url=${encodeURIComponent(repoUrl)}` :
-            `/frameworks/${selectedFiles[0]}`
           
-          const response = await fetch(`${ENV.API_BASE_URL}${url}`)
+          if (repoUrl) {
+            if (repoProfileRef.current.repoUrl !== repoUrl) {
+              const profileResponse = await fetch(`${ENV.API_BASE_URL}${ENV.ENDPOINTS.REPO_PROFILE}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ repo_url: repoUrl })
+              })
+              if (!profileResponse.ok) {
+                throw new Error(`Profile request failed: ${profileResponse.status}`)
+              }
+              repoProfileRef.current = { repoUrl, profile: await profileResponse.json() }
+            }
+            
+            const profile = repoProfileRef.current.profile
+            const fileName = selectedFiles[0]
+            const ext = fileName.includes('.') ? '.' + fileName.split('.').pop().toLowerCase() : ''
+            const framework = profile.framework_by_extension[ext] || profile.framework_by_language.unknown
+            
+            setDetectedFramework(framework || 'pytest')
+            console.log('🔧 Profile detected framework:', framework)
+            setSuccess(`Framework auto-detected: ${framework} (enhanced detection)`)
+            return
+          }
+          
+          const response = await fetch(`${ENV.API_BASE_URL}/frameworks/${selectedFiles[0]}`)
           const data = await response.json()
           
           setDetectedFramework(data.default_framework || 'pytest')
@@ -420,14 +447,30 @@ const TestGenerator = () => {
           console.log('✅ Direct code generation fallback successful')
         }
       } else {
-        // Use direct endpoint for public repository analysis
-        data = await generateTestCode(
-          repoData.repoUrl,
-          suggestion.id,
-          suggestion.summary,
-          selectedFiles,
-          detectedFramework
-        )
+        // Use the streaming direct endpoint so code appears as it is generated
+        try {
+          let streamedCode = ''
+          data = await generateTestCodeStream(
+            repoData.repoUrl,
+            suggestion.id,
+            suggestion.summary,
+            selectedFiles,
+            detectedFramework,
+            (token) => {
+              streamedCode += token
+              setGeneratedCode({ test_code: streamedCode, suggested_filename: '', framework: detectedFramework, language: '' })
+            }
+          )
+        } catch (streamError) {
+          console.error('❌ Streaming code generation failed, using regular endpoint:', streamError)
+          data = await generateTestCode(
+            repoData.repoUrl,
+            suggestion.id,
+            suggestion.summary,
+            selectedFiles,
+            detectedFramework
+          )
+        }
       }
       setGeneratedCode(data)
       setSuccess('Test code generated successfully!')
@@ -486,12 +529,17 @@ const TestGenerator = () => {
       // Show progress message
       setSuccess('Creating pull request... This may take a few moments.')
 
+      if (prIdempotencyRef.current.code !== generatedCode) {
+        prIdempotencyRef.current = { code: generatedCode, key: crypto.randomUUID() }
+      }
+
       const prData = await createPullRequest(
         repoData.repository.full_name,
         generatedCode.test_code,
         generatedCode.suggested_filename,
         branchName,
-        commitMessage
+        commitMessage,
+        prIdempotencyRef.current.key
       )
 
       console.log('✅ PR created successfully:', prData)
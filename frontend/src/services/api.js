@@ -65,42 +65,26 @@ export const generateTestSuggestions = async (repoUrl, files, framework = null)
   console.log('🚀 Starting test suggestion generation...')
   console.log('📝 Request payload:', { repo_url: repoUrl, files, framework })
   
-  // Try multiple endpoints in order of preference
-  const endpoints = [
-    '/repo/generate-suggestions',
-    '/repo/force-suggestions', 
-    '/repo/generate-suggestions-debug'
-  ]
-  
-  for (let i = 0; i < endpoints.length; i++) {
-    const endpoint = endpoints[i]
-    try {
-      console.log(`🔄 Trying endpoint ${i + 1}/${endpoints.length}: ${endpoint}`)
-      
-      const response = await api.post(endpoint, {
-        repo_url: repoUrl,
-        files,
-        framework
-      })
-      
-      console.log(`✅ Endpoint ${endpoint} succeeded:`, response.data)
-      
-      // Validate response has suggestions
-      if (response.data && response.data.suggestions && Array.isArray(response.data.suggestions)) {
-        console.log(`🎉 Got ${response.data.suggestions.length} suggestions from ${endpoint}`)
-        return response.data
-      } else {
-        console.log(`⚠️ Invalid response format from ${endpoint}, trying next...`)
-        continue
-      }
-      
-    } catch (error) {
-      console.log(`❌ Endpoint ${endpoint} failed:`, error.message)
-      if (i === endpoints.length - 1) {
-        console.log('❌ All endpoints failed, using emergency fallback')
-        break
+  // The server serves fallback suggestions itself while the AI service is unavailable
+  try {
+    const response = await api.post('/repo/generate-suggestions', {
+      repo_url: repoUrl,
+      files,
+      framework,
+      // Pre-generate code for the top suggestions so clicking one returns quickly
+      speculative: true
+    })
+    
+    if (response.data && response.data.suggestions && Array.isArray(response.data.suggestions)) {
+      if (response.data.ai_unavailable) {
+        console.log('⚠️ AI unavailable, server returned fallback suggestions:', response.data.ai_unavailable)
       }
+      console.log(`🎉 Got ${response.data.suggestions.length} suggestions`)
+      return response.data
     }
+    console.log('⚠️ Invalid response format from /repo/generate-suggestions')
+  } catch (error) {
+    console.log('❌ Suggestion request failed:', error.message)
   }
   
   // GUARANTEED Emergency fallback - this CANNOT fail
@@ -156,6 +140,59 @@ export const generateTestCode = async (repoUrl, suggestionId, suggestionSummary,
   return response.data
 }
 
+// Streaming test code generation (server-sent events)
+// Calls onToken with each chunk of code and resolves with the final result
+export const generateTestCodeStream = async (repoUrl, suggestionId, suggestionSummary, files, framework = null, onToken = () => {}) => {
+  const response = await fetch(`${ENV.API_BASE_URL}${ENV.ENDPOINTS.GENERATE_CODE_STREAM}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      repo_url: repoUrl,
+      suggestion_id: suggestionId,
+      suggestion_summary: suggestionSummary,
+      files,
+      framework
+    })
+  })
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({}))
+    throw new Error(errorData.detail || `Streaming request failed: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // Events are separated by a blank line
+    let separatorIndex
+    while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, separatorIndex)
+      buffer = buffer.slice(separatorIndex + 2)
+
+      const eventName = rawEvent.match(/^event: (.*)$/m)?.[1]
+      const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1]
+      if (!eventName || !dataLine) continue
+      const data = JSON.parse(dataLine)
+
+      if (eventName === 'token') {
+        onToken(data.content)
+      } else if (eventName === 'done') {
+        return data
+      } else if (eventName === 'error') {
+        throw new Error(data.detail)
+      }
+    }
+  }
+
+  throw new Error('Stream ended before test code was complete')
+}
+
 // OAuth-based Repository Access
 export const getRepositories = async () => {
   const response = await api.get(ENV.ENDPOINTS.REPOSITORIES)
@@ -225,14 +262,27 @@ export const generateCodeOAuth = async (suggestionId, suggestionSummary, files,
 }
 
 // Pull Request Creation
-export const createPullRequest = async (repoFullName, testCode, testFileName, branchName, commitMessage) => {
+// Pass the same idempotencyKey when retrying so the backend resumes instead of starting over
+export const createPullRequest = async (repoFullName, testCode, testFileName, branchName, commitMessage, idempotencyKey = null) => {
   const response = await api.post(ENV.ENDPOINTS.CREATE_PR, {
     repo_full_name: repoFullName,
     test_code: testCode,
     test_file_name: testFileName,
     branch_name: branchName,
     commit_message: commitMessage
-  })
+  }, idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined)
+  return response.data
+}
+
+// One pull request for many test files (files: [{ path, test_code }]), committed together
+export const createBatchPullRequest = async (repoFullName, files, branchName, commitMessage, title = null, idempotencyKey = null) => {
+  const response = await api.post(ENV.ENDPOINTS.CREATE_PR_BATCH, {
+    repo_full_name: repoFullName,
+    files,
+    branch_name: branchName,
+    commit_message: commitMessage,
+    title
+  }, idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined)
   return response.data
 }
 